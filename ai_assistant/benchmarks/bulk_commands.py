@@ -0,0 +1,72 @@
+# Throughput of bulk create / update against one command per document.
+#
+# Creates N ToDo records through execute_frappe_command one at a time (insert + commit per row, as a
+# chat round trip would), then the same number through "bulk_create" (savepoint per row, one commit),
+# and updates them both ways. Every tenth bulk row is made invalid to include the savepoint rollback
+# path. All benchmark records are deleted afterwards. Needs a site:
+#
+#   bench --site <site> execute ai_assistant.benchmarks.bulk_commands.run
+#   bench --site <site> execute ai_assistant.benchmarks.bulk_commands.run --kwargs "{'row_counts': (100, 1000)}"
+
+import time
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api.frappe_command_executor import execute_frappe_command
+
+MARKER = "ai-assistant-bulk-benchmark"
+
+
+def _rows(count, invalid_every=None):
+    rows = []
+    for index in range(count):
+        row = {"description": f"{MARKER} {index}", "priority": "Medium"}
+        if invalid_every and index % invalid_every == 0:
+            # Fails the Select validation in insert(), so the row's savepoint is rolled back
+            row["priority"] = "Not A Priority"
+        rows.append(row)
+    return rows
+
+
+def _single(count):
+    start = time.perf_counter()
+    names = []
+    for row in _rows(count):
+        names.append(execute_frappe_command("create", "ToDo", data=row, user=frappe.session.user)["name"])
+    created = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for name in names:
+        execute_frappe_command("update", "ToDo", data={"priority": "High"}, filters={"name": name}, user=frappe.session.user)
+    return created, time.perf_counter() - start
+
+
+def _bulk(count):
+    start = time.perf_counter()
+    result = execute_frappe_command("bulk_create", "ToDo", data=_rows(count, invalid_every=10), user=frappe.session.user)
+    created = time.perf_counter() - start
+
+    updates = [{"name": row["name"], "priority": "High"} for row in result["results"] if row["status"] == "created"]
+    start = time.perf_counter()
+    execute_frappe_command("bulk_update", "ToDo", data=updates, user=frappe.session.user)
+    return created, time.perf_counter() - start, result["failed"]
+
+
+def _cleanup():
+    frappe.db.delete("ToDo", {"description": ["like", f"{MARKER}%"]})
+    frappe.db.commit()
+
+
+def run(row_counts=(50, 200, 1000)):
+    print(f"{'rows':>6} {'single create/s':>16} {'bulk create/s':>14} {'single update/s':>16} {'bulk update/s':>14} {'failed':>7}")
+    try:
+        for count in row_counts:
+            single_create, single_update = _single(count)
+            bulk_create, bulk_update, failed = _bulk(count)
+            print(
+                f"{count:>6} {count / single_create:>16.1f} {count / bulk_create:>14.1f}"
+                f" {count / single_update:>16.1f} {(count - failed) / bulk_update:>14.1f} {failed:>7}"
+            )
+            _cleanup()
+    finally:
+        _cleanup()
@@ -0,0 +1,88 @@
+# Map-reduce document analysis benchmark.
+#
+# Synthetic 10/100/500-page documents are analysed by a local stub LLM whose latency follows the usual
+# shape of a completion call: a fixed overhead, a prefill cost per prompt token and a decode cost per
+# generated token (generation grows with the prompt up to a cap). The whole document in one prompt is
+# compared with chunk_pages + map_reduce at the given concurrency; prompts larger than the stub's
+# context window are reported, since a real provider would reject or truncate them.
+#
+#   bench --site <site> execute ai_assistant.benchmarks.chunked_analysis.run
+#   python -m ai_assistant.benchmarks.chunked_analysis
+
+import random
+import threading
+import time
+
+from ai_assistant.ontime_ai_assistant.api.chunked_analysis import chunk_pages, estimate_tokens, map_reduce
+
+CONTEXT_WINDOW = 32_000
+CALL_OVERHEAD = 0.05
+PREFILL_PER_TOKEN = 0.000005
+DECODE_PER_TOKEN = 0.001
+MAX_OUTPUT_TOKENS = 800
+
+WORDS = "invoice supplier amount total clause party term delivery payment tax item quantity rate date contract".split()
+
+
+class StubLLM:
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, prompt):
+        prompt_tokens = estimate_tokens(prompt)
+        output_tokens = min(MAX_OUTPUT_TOKENS, 50 + prompt_tokens // 20)
+        time.sleep(CALL_OVERHEAD + prompt_tokens * PREFILL_PER_TOKEN + output_tokens * DECODE_PER_TOKEN)
+        with self.lock:
+            self.calls += 1
+        return " ".join(WORDS[i % len(WORDS)] for i in range(output_tokens))
+
+
+def make_document(page_count, words_per_page=450, seed=7):
+    rng = random.Random(seed)
+    for page_number in range(1, page_count + 1):
+        paragraphs = []
+        for _ in range(5):
+            sentence_count = rng.randint(4, 8)
+            paragraphs.append(" ".join(
+                " ".join(rng.choice(WORDS) for _ in range(words_per_page // 5 // sentence_count)).capitalize() + "."
+                for _ in range(sentence_count)
+            ))
+        yield page_number, f"## Section {page_number}\n\n" + "\n\n".join(paragraphs)
+
+
+def _single_call(pages):
+    llm = StubLLM()
+    prompt = "\n".join(text for _, text in pages)
+    start = time.perf_counter()
+    llm(prompt)
+    return time.perf_counter() - start, estimate_tokens(prompt)
+
+
+def _chunked(pages, max_tokens, concurrency):
+    llm = StubLLM()
+    chunks = list(chunk_pages(pages, max_tokens))
+    start = time.perf_counter()
+    map_reduce(
+        chunks,
+        lambda chunk, total: llm(chunk["text"]),
+        lambda partials: llm("\n\n".join(partials)),
+        max_tokens=max_tokens,
+        max_concurrency=concurrency,
+    )
+    return time.perf_counter() - start, len(chunks), llm.calls
+
+
+def run(page_counts=(10, 100, 500), max_tokens=6000, concurrency=4):
+    print(f"stub LLM: context {CONTEXT_WINDOW} tokens, chunks of {max_tokens} tokens, concurrency {concurrency}")
+    print(f"{'pages':>6} {'tokens':>8} {'single s':>9} {'fits':>5} {'chunks':>7} {'calls':>6} {'map-reduce s':>13}")
+    for page_count in page_counts:
+        pages = list(make_document(page_count))
+        single_elapsed, tokens = _single_call(pages)
+        chunked_elapsed, chunk_count, calls = _chunked(pages, max_tokens, concurrency)
+        fits = "yes" if tokens <= CONTEXT_WINDOW else "no"
+        print(f"{page_count:>6} {tokens:>8} {single_elapsed:>9.2f} {fits:>5} {chunk_count:>7} {calls:>6} {chunked_elapsed:>13.2f}")
+
+
+if __name__ == "__main__":
+    run()
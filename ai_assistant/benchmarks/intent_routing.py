@@ -0,0 +1,72 @@
+# Micro-benchmark for the chat intent router.
+#
+# Grows the intent table with synthetic intents and times routing the same queries through the
+# compiled Aho-Corasick router and through a naive substring cascade. Routing cost should stay
+# flat for the router while the cascade grows linearly with the number of intents.
+#
+#   python -m ai_assistant.benchmarks.intent_routing
+#   bench --site <site> execute ai_assistant.benchmarks.intent_routing.run
+
+import random
+import string
+import time
+
+from ai_assistant.ontime_ai_assistant.api.intent_router import INTENTS, IntentRouter
+
+QUERIES = [
+    "create customer named Acme Trading",
+    "show me overdue invoices for april",
+    "what is a payment entry",
+    "أنشئ عميل باسم محمد",
+    "tell me something the router does not know about",
+]
+
+
+def _synthetic_intents(count, seed=42):
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 9)))
+
+    return [
+        {
+            "name": f"synthetic_{index}",
+            "command_type": "read",
+            "doctype": "ToDo",
+            "triggers": [[word(), word()], [f"{word()} {word()}", word()]],
+        }
+        for index in range(count)
+    ]
+
+
+def _naive_route(intents, query):
+    # Mirrors the old if/elif cascade: substring checks for every phrase of every intent
+    lower_query = query.lower()
+    for intent in intents:
+        if all(any(phrase in lower_query for phrase in group) for group in intent["triggers"]):
+            return intent
+    return None
+
+
+def _time_per_query(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for query in QUERIES:
+            fn(query)
+    return (time.perf_counter() - start) / (iterations * len(QUERIES)) * 1e6
+
+
+def run(sizes=(0, 100, 500, 1000, 2000), iterations=2000):
+    print(f"{'intents':>8} {'router us/query':>16} {'cascade us/query':>17} {'compile ms':>11}")
+    for size in sizes:
+        intents = _synthetic_intents(size) + INTENTS
+        start = time.perf_counter()
+        router = IntentRouter(intents)
+        compile_ms = (time.perf_counter() - start) * 1e3
+        router_us = _time_per_query(router.route, iterations)
+        cascade_us = _time_per_query(lambda query: _naive_route(intents, query), iterations)
+        print(f"{len(intents):>8} {router_us:>16.2f} {cascade_us:>17.2f} {compile_ms:>11.1f}")
+
+
+if __name__ == "__main__":
+    run()
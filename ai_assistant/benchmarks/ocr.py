@@ -0,0 +1,71 @@
+# OCR throughput benchmark (pages per minute).
+#
+# Renders synthetic scanned pages (large, on a noisy grey background, like a phone photo of an
+# invoice) and OCRs them twice: the old way, full resolution with both languages through a fresh
+# pytesseract subprocess per page, and through ocr.py (downsample, binarise, script detection, a
+# reused tesseract instance per worker) spread over a process pool. Needs tesseract with the eng, ara
+# and osd traineddata; tesserocr is used by the pipeline when installed.
+#
+#   bench --site <site> execute ai_assistant.benchmarks.ocr.run
+#   python -m ai_assistant.benchmarks.ocr
+
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ai_assistant.ontime_ai_assistant.api import ocr
+
+PAGE_SIZE = (3500, 4950)
+LINES_PER_PAGE = 40
+WORDS = "Invoice Supplier Amount Total Quantity Rate Tax Delivery Payment Terms Date Item Customer Due".split()
+
+
+def make_page(seed):
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    image = Image.new("L", PAGE_SIZE, 200)
+    pixels = image.load()
+    for _ in range(PAGE_SIZE[0] * PAGE_SIZE[1] // 200):
+        pixels[rng.randrange(PAGE_SIZE[0]), rng.randrange(PAGE_SIZE[1])] = rng.randint(150, 230)
+
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=60)
+    for line in range(LINES_PER_PAGE):
+        words = " ".join(rng.choice(WORDS) for _ in range(6)) + f" {rng.randint(1, 99999)}.{rng.randint(0, 99):02d}"
+        draw.text((200, 250 + line * 110), words, fill=rng.randint(10, 60), font=font)
+    return image
+
+
+def _baseline(image):
+    import pytesseract
+
+    return pytesseract.image_to_string(image, lang="eng+ara")
+
+
+def _pages_per_minute(fn, pages, workers):
+    start = time.perf_counter()
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(fn, pages))
+    else:
+        for page in pages:
+            fn(page)
+    return len(pages) / (time.perf_counter() - start) * 60
+
+
+def run(page_count=8, workers=4):
+    pages = [make_page(seed) for seed in range(page_count)]
+    baseline = _pages_per_minute(_baseline, pages, 1)
+    pipeline_serial = _pages_per_minute(ocr.ocr_image, pages, 1)
+    pipeline_pool = _pages_per_minute(ocr.ocr_image, pages, workers)
+
+    print(f"engine: {type(ocr.get_engine()).__name__}, {page_count} pages of {PAGE_SIZE[0]}x{PAGE_SIZE[1]}px")
+    print(f"{'mode':>28} {'pages/min':>10}")
+    print(f"{'full-res eng+ara, serial':>28} {baseline:>10.1f}")
+    print(f"{'pipeline, serial':>28} {pipeline_serial:>10.1f}")
+    print(f"{f'pipeline, {workers} workers':>28} {pipeline_pool:>10.1f}")
+
+
+if __name__ == "__main__":
+    run()
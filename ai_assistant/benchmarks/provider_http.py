@@ -0,0 +1,77 @@
+# Connection reuse benchmark for the provider HTTP clients.
+#
+# Starts a local HTTP/1.1 keep-alive stub that answers like a completion endpoint and counts the TCP
+# connections it accepts. The same number of requests is sent once with a fresh connection per call
+# (the old requests.post behaviour) and once through a pooled session from http_client.
+#
+#   bench --site <site> execute ai_assistant.benchmarks.provider_http.run
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ai_assistant.ontime_ai_assistant.api.http_client import build_session
+
+RESPONSE_BODY = json.dumps({"candidates": [{"content": {"parts": [{"text": "ok"}]}}]}).encode()
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.daemon_threads = True
+    server.connections = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _measure(server, post, requests_count):
+    url = f"http://127.0.0.1:{server.server_address[1]}/v1beta/models/stub:generateContent"
+    server.connections = 0
+    start = time.perf_counter()
+    for _ in range(requests_count):
+        post(url, json={"contents": [{"parts": [{"text": "ping"}]}]}, timeout=(5, 30)).raise_for_status()
+    elapsed = time.perf_counter() - start
+    return server.connections, elapsed / requests_count * 1e3
+
+
+def run(requests_count=500):
+    server = _start_stub()
+    try:
+        unpooled = _measure(server, requests.post, requests_count)
+        session = build_session()
+        pooled = _measure(server, session.post, requests_count)
+        session.close()
+    finally:
+        server.shutdown()
+
+    print(f"{'client':>10} {'requests':>9} {'connections':>12} {'ms/request':>11}")
+    print(f"{'unpooled':>10} {requests_count:>9} {unpooled[0]:>12} {unpooled[1]:>11.3f}")
+    print(f"{'pooled':>10} {requests_count:>9} {pooled[0]:>12} {pooled[1]:>11.3f}")
+    print(f"handshakes saved per request: {(unpooled[0] - pooled[0]) / requests_count:.3f}")
+
+
+if __name__ == "__main__":
+    run()
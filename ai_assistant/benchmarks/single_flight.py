@@ -0,0 +1,99 @@
+# Load test for request coalescing of identical LLM calls.
+#
+# Simulates users asking the assistant at nearly the same moment: each user is a thread with its
+# own frappe site context (standing in for a gunicorn worker) and all of them share the site's Redis.
+# The provider is a local stub that sleeps for a completion's latency and counts the calls it gets.
+# Each scenario runs once calling the stub directly (no coalescing) and once through single_flight.run,
+# and reports upstream calls and request latency. Questions vary in case and spacing, as typed by users.
+#
+#   bench --site <site> execute ai_assistant.benchmarks.single_flight.run
+#   bench --site <site> execute ai_assistant.benchmarks.single_flight.run --kwargs "{'latency': 5}"
+
+import random
+import threading
+import time
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api import single_flight
+
+QUESTIONS = [
+    "What is a Payment Entry?",
+    "How to create a Sales Invoice",
+    "What is a Cost Center?",
+    "How do I close the fiscal year?",
+]
+
+# (name, users, distinct questions, seconds over which the users arrive)
+SCENARIOS = [
+    ("dashboard burst", 20, 1, 0.0),
+    ("classroom", 40, 1, 1.5),
+    ("team, 4 questions", 40, 4, 1.5),
+    ("spread arrivals", 40, 4, 6.0),
+]
+
+
+class StubProvider:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def complete(self, question):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return f"Answer to {question.strip()}"
+
+
+def _typed(question):
+    # Case and spacing as different users would type it
+    words = question.split()
+    words[0] = words[0].lower() if random.random() < 0.5 else words[0]
+    return ("  " if random.random() < 0.3 else " ").join(words)
+
+
+def _run_scenario(site, sites_path, provider, users, questions, spread, coalesce):
+    latencies = []
+    lock = threading.Lock()
+    run_id = frappe.generate_hash(length=8)
+
+    def user(question, delay):
+        frappe.init(site=site, sites_path=sites_path)
+        try:
+            time.sleep(delay)
+            start = time.perf_counter()
+            if coalesce:
+                # run_id keeps flights of earlier runs (result keys still alive) out of this one
+                key = single_flight.flight_key("Stub", run_id, [{"role": "user", "content": question}])
+                single_flight.run(key, lambda: provider.complete(question), lock_ttl=provider.latency * 4)
+            else:
+                provider.complete(question)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+        finally:
+            frappe.destroy()
+
+    threads = [
+        threading.Thread(target=user, args=(_typed(QUESTIONS[index % questions]), random.uniform(0, spread)))
+        for index in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    return provider.calls, latencies[len(latencies) // 2], latencies[-1]
+
+
+def run(latency=2.0, seed=42):
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+    print(f"{'scenario':>20} {'users':>6} {'mode':>9} {'upstream':>9} {'p50 s':>7} {'max s':>7}")
+    for name, users, questions, spread in SCENARIOS:
+        for coalesce in (False, True):
+            random.seed(seed)
+            provider = StubProvider(latency)
+            calls, p50, worst = _run_scenario(site, sites_path, provider, users, questions, spread, coalesce)
+            mode = "coalesced" if coalesce else "direct"
+            print(f"{name:>20} {users:>6} {mode:>9} {calls:>9} {p50:>7.2f} {worst:>7.2f}")
@@ -145,9 +145,37 @@ app_license = "mit"
 # 	}
 # }
 
+doc_events = {
+	"User": {
+		"on_update": "ai_assistant.ontime_ai_assistant.api.permission_cache.clear_user_snapshot",
+		"on_trash": "ai_assistant.ontime_ai_assistant.api.permission_cache.clear_user_snapshot"
+	},
+	"Role": {
+		"on_update": "ai_assistant.ontime_ai_assistant.api.permission_cache.bump_permission_version",
+		"on_trash": "ai_assistant.ontime_ai_assistant.api.permission_cache.bump_permission_version"
+	}
+}
+
+# frappe.clear_cache() without arguments (bench clear-cache) also retires the cached role lists
+clear_cache = ["ai_assistant.ontime_ai_assistant.api.permission_cache.bump_permission_version"]
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"ai_assistant.ontime_ai_assistant.api.query_log.flush_query_log"
+		],
+	},
+	"hourly": [
+		"ai_assistant.ontime_ai_assistant.api.extraction_cache.trim_extraction_cache"
+	],
+	"daily": [
+		"ai_assistant.ontime_ai_assistant.api.query_archive.archive_old_queries"
+	],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"ai_assistant.tasks.all"
@@ -196,13 +224,16 @@ app_license = "mit"
 
 # Request Events
 # ----------------
-# before_request = ["ai_assistant.utils.before_request"]
-# after_request = ["ai_assistant.utils.after_request"]
+# Warm the spaCy pipelines listed in site config "ai_assistant_preload_nlp_models" once per web worker.
+# There is no before_job preload: RQ forks a work-horse per job, so a preload there would load the models
+# in every job child and discard them; chat jobs load them lazily when entity extraction needs them.
+before_request = ["ai_assistant.ontime_ai_assistant.api.nlp_models.preload"]
+# Per-process LLM metrics are added to the shared Redis series at most every few seconds
+after_request = ["ai_assistant.ontime_ai_assistant.api.metrics.flush_if_due"]
 
 # Job Events
 # ----------
-# before_job = ["ai_assistant.utils.before_job"]
-# after_job = ["ai_assistant.utils.after_job"]
+after_job = ["ai_assistant.ontime_ai_assistant.api.metrics.flush_if_due"]
 
 # User Data Protection
 # --------------------
@@ -0,0 +1,128 @@
+import frappe
+
+# Aggregation planner for reporting intents.
+#
+# An intent's "aggregate" spec names a measure (count / sum / avg / min / max of a numeric field),
+# an optional dimension (a field to group by), an optional time bucket over a date field and an
+# optional top-N. The spec is validated against the DocType's metadata and turned into one GROUP BY
+# query through frappe.get_list, which adds the same permission conditions (roles, user permissions,
+# permission query hooks) as the list view. Only the grouped rows leave the database.
+
+MEASURES = {"count": "Number", "sum": "Total", "avg": "Average", "min": "Minimum", "max": "Maximum"}
+NUMERIC_FIELDTYPES = ("Currency", "Float", "Int", "Percent")
+DATE_FIELDTYPES = ("Date", "Datetime")
+# Value fields a report can be grouped by; free text and attachments make useless groups
+DIMENSION_FIELDTYPES = ("Link", "Select", "Data", "Check", "Date", "Int", "Dynamic Link")
+# Used when the spec has a time bucket but no date_field
+DATE_FIELD_CANDIDATES = ("posting_date", "transaction_date", "schedule_date", "date")
+TIME_BUCKETS = {
+    "day": (("date", "day"),),
+    "month": (("year", "year"), ("month", "month")),
+    "quarter": (("year", "year"), ("quarter", "quarter")),
+    "year": (("year", "year"),),
+}
+DEFAULT_TOP = 10
+MAX_GROUPS = 500
+
+
+def run_aggregation(doctype, aggregate, filters=None):
+    plan = plan_aggregation(doctype, **aggregate)
+    rows = frappe.get_list(
+        doctype,
+        filters=filters,
+        fields=plan["fields"],
+        group_by=plan["group_by"],
+        order_by=plan["order_by"],
+        limit_page_length=plan["limit"],
+    )
+    return {"status": "success", "data": rows, "fields": plan["columns"], "summary": describe(plan, len(rows))}
+
+
+def plan_aggregation(doctype, measure="count", field=None, dimension=None, time_bucket=None, date_field=None, top=None):
+    meta = frappe.get_meta(doctype)
+    measure = (measure or "count").lower()
+    if measure not in MEASURES:
+        frappe.throw(f"Unsupported measure: {measure}")
+
+    if measure == "count":
+        value_expression = "count(name)"
+        field = None
+    else:
+        df = meta.get_field(field) if field else None
+        if not df or df.fieldtype not in NUMERIC_FIELDTYPES:
+            frappe.throw(f"{doctype} has no numeric field {field} to {measure}")
+        value_expression = f"{measure}(`{field}`)"
+
+    fields, group_by, columns = [], [], []
+
+    if time_bucket:
+        if time_bucket not in TIME_BUCKETS:
+            frappe.throw(f"Unsupported time bucket: {time_bucket}")
+        date_field = date_field or _default_date_field(meta)
+        if date_field != "creation":
+            df = meta.get_field(date_field)
+            if not df or df.fieldtype not in DATE_FIELDTYPES:
+                frappe.throw(f"{doctype} has no date field {date_field}")
+        for function, alias in TIME_BUCKETS[time_bucket]:
+            fields.append(f"{function}(`{date_field}`) as `{alias}`")
+            group_by.append(f"`{alias}`")
+            columns.append(alias)
+
+    if dimension:
+        df = meta.get_field(dimension)
+        if dimension != "owner" and (not df or df.fieldtype not in DIMENSION_FIELDTYPES):
+            frappe.throw(f"{doctype} cannot be grouped by {dimension}")
+        fields.append(f"`{dimension}`")
+        group_by.append(f"`{dimension}`")
+        columns.append(dimension)
+
+    fields.append(f"{value_expression} as `value`")
+    columns.append("value")
+
+    if time_bucket:
+        # A time series reads best in period order; top-N does not apply across periods
+        order_by = ", ".join(group_by)
+        limit = MAX_GROUPS
+    elif dimension:
+        order_by = "`value` desc"
+        limit = min(frappe.utils.cint(top) or DEFAULT_TOP, MAX_GROUPS)
+    else:
+        order_by = None
+        limit = 1
+
+    return {
+        "doctype": doctype,
+        "measure": measure,
+        "field": field,
+        "dimension": dimension,
+        "time_bucket": time_bucket,
+        "date_field": date_field if time_bucket else None,
+        "fields": fields,
+        "group_by": ", ".join(group_by) or None,
+        "order_by": order_by,
+        "limit": limit,
+        "columns": columns,
+    }
+
+
+def describe(plan, row_count):
+    meta = frappe.get_meta(plan["doctype"])
+    if plan["measure"] == "count":
+        text = f"Number of {plan['doctype']} records"
+    else:
+        text = f"{MEASURES[plan['measure']]} {meta.get_label(plan['field'])} of {plan['doctype']}"
+    if plan["dimension"]:
+        text += f" by {meta.get_label(plan['dimension'])}"
+    if plan["time_bucket"]:
+        text += f" per {plan['time_bucket']}"
+    if plan["dimension"] and not plan["time_bucket"]:
+        text += f" (top {row_count})"
+    return text + "."
+
+
+def _default_date_field(meta):
+    for fieldname in DATE_FIELD_CANDIDATES:
+        df = meta.get_field(fieldname)
+        if df and df.fieldtype in DATE_FIELDTYPES:
+            return fieldname
+    return "creation"
@@ -1,60 +1,218 @@
+import threading
+import time
+from functools import partial
+
 import frappe
 from litellm import completion
 
+from ai_assistant.ontime_ai_assistant.api import metrics, provider_router, single_flight
+from ai_assistant.ontime_ai_assistant.api.http_client import configure_litellm, get_timeout
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config, get_routing_settings
+from ai_assistant.ontime_ai_assistant.api.prompt_templates import render
+
+# Realtime event carrying partial tokens to the chat UI: {"stream_id", "delta"} then {"stream_id", "done"}
+STREAM_EVENT = "ai_assistant_stream"
+# After the first token, deltas are batched for this many seconds to keep socket.io traffic low
+STREAM_FLUSH_INTERVAL = 0.1
+
+_usage_lock = threading.Lock()
+
+PROVIDER_MODELS = {
+    "Gemini": "gemini/gemini-pro",
+    "OpenAI": "gpt-3.5-turbo",
+    "DeepSeek": "ollama/deepseek-coder", # Assuming Ollama is set up for DeepSeek
+    "Claude": "claude-2", # Example Claude model, adjust as needed
+    "Cohere": "command-r", # Example Cohere model, adjust as needed
+    "Mistral": "mistral/mistral-tiny", # Example Mistral model, adjust as needed
+}
+
+def get_model_name(ai_provider_name):
+    return PROVIDER_MODELS.get(ai_provider_name)
+
+def is_error_response(response):
+    # get_ai_response reports failures as text rather than raising
+    return not isinstance(response, str) or response.startswith(("Error", "AI Provider "))
+
 @frappe.whitelist()
-def get_ai_response(query_text, query_type, ai_provider_name, api_key):
+def get_ai_response(query_text, query_type, ai_provider_name, api_key, stream=False, stream_id=None, messages=None):
     try:
-        model = None
-        if ai_provider_name == "Gemini":
-            model = "gemini/gemini-pro"
-        elif ai_provider_name == "OpenAI":
-            model = "gpt-3.5-turbo"
-        elif ai_provider_name == "DeepSeek":
-            model = "ollama/deepseek-coder" # Assuming Ollama is set up for DeepSeek
-        elif ai_provider_name == "Claude":
-            model = "claude-2" # Example Claude model, adjust as needed
-        elif ai_provider_name == "Cohere":
-            model = "command-r" # Example Cohere model, adjust as needed
-        elif ai_provider_name == "Mistral":
-            model = "mistral/mistral-tiny" # Example Mistral model, adjust as needed
-        else:
+        model = get_model_name(ai_provider_name)
+        if not model:
             return f"AI Provider {ai_provider_name} not supported yet."
 
-        messages = [{"role": "user", "content": query_text}]
-        
-        # Use LiteLLM for unified API call
-        response = completion(model=model, messages=messages, api_key=api_key)
-        
-        return response.choices[0].message.content
+        # messages carries a conversation's history (see conversation.build_messages) ending with query_text
+        messages = frappe.parse_json(messages) if messages else [{"role": "user", "content": query_text}]
+        configure_litellm()
+
+        on_shared = None
+        if frappe.utils.cint(stream):
+            record_usage({"provider": ai_provider_name, "model": model})
+            call = partial(stream_completion, model, messages, api_key, stream_id, ai_provider_name, query_type)
+
+            def on_shared(response):
+                # A stream that waited on an identical request receives its answer in one piece
+                publish_stream(stream_id, delta=response, done=True)
+        else:
+            call = partial(route_completion, messages, ai_provider_name, model, api_key, query_type)
+
+        if not single_flight.is_enabled():
+            return call()
+        # Identical prompts in flight at the same moment share one provider call
+        return single_flight.run(
+            single_flight.flight_key(ai_provider_name, model, messages),
+            call,
+            # Long enough for the fallback providers to be tried too
+            lock_ttl=2 * get_timeout()[1],
+            share=lambda response: not is_error_response(response),
+            labels={"provider": ai_provider_name, "model": model, "intent": query_type or ""},
+            on_shared=on_shared,
+        )
 
     except Exception as e:
         frappe.log_error(f"Error in get_ai_response: {e}", "AI Service Error")
+        if frappe.utils.cint(stream):
+            publish_stream(stream_id, error=str(e), done=True)
         return f"Error: {e}"
 
+def route_completion(messages, ai_provider_name, model, api_key, query_type=None):
+    complete = prepare_completion(ai_provider_name, model, api_key, query_type)
+    content = complete(messages)
+    record_usage(complete.usage)
+    return content
+
+def record_usage(usage):
+    # Token usage for the current request, picked up by query_log when the query is logged
+    current = getattr(frappe.local, "ai_query_usage", None) or {}
+    current.update({key: usage[key] for key in ("provider", "model") if usage.get(key)})
+    for key in ("prompt_tokens", "completion_tokens"):
+        if usage.get(key):
+            current[key] = (current.get(key) or 0) + usage[key]
+    frappe.local.ai_query_usage = current
+
+def prepare_completion(ai_provider_name, model, api_key, query_type=None):
+    # Returns complete(messages) -> text, which tries the given provider first and then the AI Settings
+    # fallbacks (see provider_router). Settings and keys are resolved here, so the returned function
+    # does not use frappe.local and can be called from worker threads.
+    settings = get_routing_settings()
+    timeout = get_timeout()[1]
+    site = metrics.current_site()
+    providers = [(ai_provider_name, model, api_key)]
+    for name in settings["providers"]:
+        if name == ai_provider_name:
+            continue
+        config = get_provider_config(name)
+        fallback_model = get_model_name(name) or PROVIDER_MODELS.get(config["provider_type"])
+        if fallback_model:
+            providers.append((name, fallback_model, config["api_key"]))
+
+    # Tokens used by every call made through this function (hedged calls included)
+    usage = {"provider": None, "model": None, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def complete(messages):
+        calls = [
+            (name, _completion_call(name, name_model, messages, key, timeout, usage, query_type, site))
+            for name, name_model, key in providers
+        ]
+        provider, content = provider_router.route(
+            calls,
+            hedge_after_ms=settings["hedge_after_ms"],
+            failure_threshold=settings["failure_threshold"],
+            cooldown=settings["cooldown"],
+        )
+        usage["provider"] = provider
+        usage["model"] = next(name_model for name, name_model, _ in providers if name == provider)
+        return content
+
+    complete.usage = usage
+    return complete
+
+def _completion_call(provider, model, messages, api_key, timeout, usage, query_type=None, site=None):
+    def call():
+        with metrics.track_llm_call(provider, model, query_type, site) as call_metrics:
+            # Use LiteLLM for unified API call
+            response = completion(model=model, messages=apply_prompt_caching(model, messages), api_key=api_key, timeout=timeout)
+            tokens = getattr(response, "usage", None)
+            if tokens:
+                call_metrics["prompt_tokens"] = getattr(tokens, "prompt_tokens", 0) or 0
+                call_metrics["completion_tokens"] = getattr(tokens, "completion_tokens", 0) or 0
+                with _usage_lock:
+                    usage["prompt_tokens"] += call_metrics["prompt_tokens"]
+                    usage["completion_tokens"] += call_metrics["completion_tokens"]
+        return response.choices[0].message.content
+
+    return call
+
+def stream_completion(model, messages, api_key, stream_id, ai_provider_name=None, query_type=None):
+    # Pushes tokens to the browser as they arrive and returns the assembled text for logging
+    with metrics.track_llm_call(ai_provider_name, model, query_type) as call_metrics:
+        text = _stream_chunks(model, messages, api_key, stream_id, call_metrics)
+    return text
+
+def _stream_chunks(model, messages, api_key, stream_id, call_metrics):
+    parts = []
+    pending = []
+    last_flush = 0.0
+    started = time.monotonic()
+    for chunk in completion(model=model, messages=apply_prompt_caching(model, messages), api_key=api_key, stream=True, timeout=get_timeout()[1]):
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        if not parts:
+            call_metrics["ttft_ms"] = (time.monotonic() - started) * 1000
+        parts.append(delta)
+        pending.append(delta)
+        now = time.monotonic()
+        # The first token goes out immediately so time-to-first-token is not delayed by batching
+        if len(parts) == 1 or now - last_flush >= STREAM_FLUSH_INTERVAL:
+            publish_stream(stream_id, delta="".join(pending))
+            pending = []
+            last_flush = now
+
+    if pending:
+        publish_stream(stream_id, delta="".join(pending))
+    publish_stream(stream_id, done=True)
+    return "".join(parts)
+
+def apply_prompt_caching(model, messages):
+    # Template system messages and conversation history repeat on every request. OpenAI and recent
+    # Gemini models reuse such a prefix on their own; Anthropic models only cache up to blocks marked
+    # with cache_control, so the system message and the last history message are marked for them.
+    if len(messages) < 2 or "claude" not in (model or ""):
+        return messages
+    marked = list(messages)
+    # The message before the new query ends the part repeated from the previous request
+    indexes = {len(marked) - 2} if len(marked) > 2 else set()
+    if marked[0].get("role") == "system":
+        indexes.add(0)
+    for index in indexes:
+        message = marked[index]
+        if isinstance(message.get("content"), str):
+            marked[index] = {**message, "content": [{"type": "text", "text": message["content"], "cache_control": {"type": "ephemeral"}}]}
+    return marked
+
+def publish_stream(stream_id, delta=None, error=None, done=False):
+    if not stream_id:
+        return
+    message = {"stream_id": stream_id}
+    if delta:
+        message["delta"] = delta
+    if error:
+        message["error"] = error
+    if done:
+        message["done"] = True
+    frappe.publish_realtime(STREAM_EVENT, message, user=frappe.session.user)
+
 @frappe.whitelist()
 def generate_script(prompt, script_type, ai_provider_name, api_key):
     try:
-        model = None
-        if ai_provider_name == "Gemini":
-            model = "gemini/gemini-pro"
-        elif ai_provider_name == "OpenAI":
-            model = "gpt-3.5-turbo"
-        elif ai_provider_name == "DeepSeek":
-            model = "ollama/deepseek-coder"
-        elif ai_provider_name == "Claude":
-            model = "claude-2"
-        elif ai_provider_name == "Cohere":
-            model = "command-r"
-        elif ai_provider_name == "Mistral":
-            model = "mistral/mistral-tiny"
-        else:
+        model = get_model_name(ai_provider_name)
+        if not model:
             return f"AI Provider {ai_provider_name} not supported for script generation."
 
-        full_prompt = f"Generate a {script_type} for the following request: {prompt}\n\nProvide only the code, without any additional explanations or text."
-        messages = [{"role": "user", "content": full_prompt}]
+        messages = render("script_generation", script_type=script_type, prompt=prompt)
+        configure_litellm()
 
-        # Use LiteLLM for unified API call
-        generated_script = completion(model=model, messages=messages, api_key=api_key).choices[0].message.content
+        generated_script = route_completion(messages, ai_provider_name, model, api_key)
 
         # Log the script generation request
         frappe.get_doc({
@@ -0,0 +1,111 @@
+import frappe
+from ai_assistant.ontime_ai_assistant.api.permission_cache import has_permission
+
+# Bulk create / update for execute_frappe_command.
+#
+# DocType permission is checked once for the whole request. Rows are then processed in batches:
+# each batch is validated up front (unknown fields, missing mandatory values, update targets that do
+# not exist, all in one metadata pass and one query), and every remaining row is saved under its own
+# savepoint, so a row that fails validation or a hook is rolled back alone. Everything is committed
+# once at the end. Document-level permissions still apply through insert() / save().
+
+BULK_ACTIONS = {"bulk_create": "create", "bulk_update": "write"}
+BATCH_SIZE = 100
+MAX_ROWS = 5000
+
+
+def run_bulk_command(command_type, doctype, rows, user=None):
+    if not isinstance(rows, (list, tuple)) or not rows:
+        frappe.throw("Bulk commands need a non-empty list of rows.")
+    if len(rows) > MAX_ROWS:
+        frappe.throw(f"Bulk commands are limited to {MAX_ROWS} rows per call.")
+
+    permtype = BULK_ACTIONS[command_type]
+    if not has_permission(doctype, permtype, user):
+        frappe.throw(f"You do not have permission to {permtype} {doctype}", frappe.PermissionError)
+
+    meta = frappe.get_meta(doctype)
+    results = []
+    for start in range(0, len(rows), BATCH_SIZE):
+        batch = list(enumerate(rows[start : start + BATCH_SIZE], start))
+        errors = validate_batch(meta, command_type, batch)
+        for index, row in batch:
+            if index in errors:
+                results.append({"row": index, "status": "failed", "message": errors[index]})
+            else:
+                results.append(_save_row(doctype, command_type, index, row))
+
+    frappe.db.commit()
+    return summarize(doctype, command_type, results)
+
+
+def validate_batch(meta, command_type, batch):
+    # {row index: message} for rows that cannot succeed, found without touching the documents
+    known_fields = {df.fieldname for df in meta.fields} | {"name", "docstatus"}
+    mandatory = [df.fieldname for df in meta.fields if df.reqd and not df.default]
+    errors = {}
+
+    for index, row in batch:
+        if not isinstance(row, dict):
+            errors[index] = "Row must be an object of field values."
+            continue
+        unknown = sorted(set(row) - known_fields)
+        if unknown:
+            errors[index] = f"Unknown fields: {', '.join(unknown)}"
+        elif command_type == "bulk_create":
+            missing = [fieldname for fieldname in mandatory if row.get(fieldname) in (None, "")]
+            if missing:
+                errors[index] = f"Missing mandatory fields: {', '.join(missing)}"
+        elif not row.get("name"):
+            errors[index] = "Name is required for update."
+
+    if command_type == "bulk_update":
+        names = {row["name"] for index, row in batch if index not in errors}
+        existing = set(frappe.get_all(meta.name, filters={"name": ["in", list(names)]}, pluck="name")) if names else set()
+        for index, row in batch:
+            if index not in errors and row["name"] not in existing:
+                errors[index] = f"{meta.name} {row['name']} not found."
+
+    return errors
+
+
+def summarize(doctype, command_type, results):
+    done_status = "created" if command_type == "bulk_create" else "updated"
+    done = sum(1 for result in results if result["status"] == done_status)
+    failed = len(results) - done
+    if not failed:
+        status = "success"
+    elif done:
+        status = "partial"
+    else:
+        status = "error"
+    return {
+        "status": status,
+        "message": f"{done} {doctype} records {done_status}, {failed} failed.",
+        done_status: done,
+        "failed": failed,
+        "results": results,
+    }
+
+
+def _save_row(doctype, command_type, index, row):
+    savepoint = f"ai_bulk_{index}"
+    frappe.db.savepoint(savepoint)
+    try:
+        if command_type == "bulk_create":
+            doc = frappe.get_doc({**row, "doctype": doctype})
+            doc.insert()
+            status = "created"
+        else:
+            values = dict(row)
+            doc = frappe.get_doc(doctype, values.pop("name"))
+            doc.update(values)
+            doc.save()
+            status = "updated"
+    except Exception as e:
+        frappe.db.rollback(save_point=savepoint)
+        frappe.clear_messages()
+        return {"row": index, "status": "failed", "message": str(e) or e.__class__.__name__}
+
+    frappe.db.release_savepoint(savepoint)
+    return {"row": index, "status": status, "name": doc.name}
@@ -1,279 +1,181 @@
+import time
+
 import frappe
 from ai_assistant.ontime_ai_assistant.api.ai_service import get_ai_response, generate_script
-from ai_assistant.ontime_ai_assistant.api.frappe_command_executor import execute_frappe_command
+from ai_assistant.ontime_ai_assistant.api.frappe_command_executor import execute_frappe_command, fetch_next_page
 from ai_assistant.ontime_ai_assistant.api.document_analysis import upload_document as doc_upload_document, get_processing_status
-from ai_assistant.ontime_ai_assistant.api.erp_knowledge_base import get_erp_explanation, get_erp_steps
-
-# Import spaCy for NLP
-import spacy
-import re
-
-# Load English and Arabic models (ensure these are downloaded on the Frappe server)
-try:
-    nlp_en = spacy.load("en_core_web_sm")
-except OSError:
-    frappe.log_error("English spaCy model not found. Please run: python3 -m spacy download en_core_web_sm", "NLP Model Error")
-try:
-    nlp_ar = spacy.load("ar_core_news_sm")
-except OSError:
-    frappe.log_error("Arabic spaCy model not found. Please run: python3 -m spacy download ar_core_news_sm", "NLP Model Error")
+from ai_assistant.ontime_ai_assistant.api.erp_knowledge_base import get_erp_explanation, get_erp_steps, get_role_perspective
+from ai_assistant.ontime_ai_assistant.api.permission_cache import get_user_roles
+
+from ai_assistant.ontime_ai_assistant.api.nlp_models import detect_language, extract_entities
+from ai_assistant.ontime_ai_assistant.api.intent_router import TODAY, route as route_intent
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config
+from ai_assistant.ontime_ai_assistant.api.chat_jobs import enqueue_chat_job, is_async_enabled
+from ai_assistant.ontime_ai_assistant.api.job_store import get_job_for_user
+from ai_assistant.ontime_ai_assistant.api.query_log import log_query
+from ai_assistant.ontime_ai_assistant.api import conversation as conversations
+from ai_assistant.ontime_ai_assistant.api.prompt_templates import render_text
+
+def _resolve_filters(filters):
+    # Intent filters are static; swap the TODAY placeholder for the current date
+    resolved = {}
+    for field, condition in filters.items():
+        if condition == TODAY:
+            condition = frappe.utils.today()
+        elif isinstance(condition, list) and TODAY in condition:
+            condition = [frappe.utils.today() if value == TODAY else value for value in condition]
+        resolved[field] = condition
+    return resolved
 
 @frappe.whitelist()
-def get_chat_response(user_query):
+def get_chat_response(user_query, stream_id=None, async_mode=None, conversation_id=None):
     try:
-        current_user = frappe.session.user
-        user_roles = frappe.get_roles(current_user)
-
-        command_type = None
-        doctype_name = None
-        data = {}
-        filters = {}
-        fields = ["*"]
-        group_by = None
-        order_by = None
-        limit_start = 0
-        limit_page_length = 20
-        is_erp_command = False
-        response_message = None
-
-        lower_query = user_query.lower()
+        if is_async_enabled(async_mode):
+            return enqueue_chat_job("get_chat_response", user_query=user_query, stream_id=stream_id, conversation_id=conversation_id)
+        return process_chat_query(user_query, stream_id, conversation_id)
+    except Exception as e:
+        frappe.log_error(f"Error in get_chat_response: {e}", "AI Chat Error")
+        frappe.response["type"] = "json"
+        frappe.response["http_status_code"] = 500
+        return {"status": "error", "message": str(e)}
 
-        # Determine language and process with appropriate NLP model
-        # Simple heuristic: check for common Arabic words
-        if any(char >= '\u0600' and char <= '\u06FF' for char in user_query):
-            doc = nlp_ar(user_query) if 'nlp_ar' in locals() else None
-            lang = 'ar'
+def process_chat_query(user_query, stream_id=None, conversation_id=None):
+    started = time.monotonic()
+    current_user = frappe.session.user
+    user_roles = get_user_roles(current_user)
+    conversation = conversations.get_conversation_state(conversation_id, current_user) if conversation_id else None
+
+    command_type = None
+    doctype_name = None
+    data = {}
+    filters = {}
+    fields = ["*"]
+    group_by = None
+    order_by = None
+    limit_start = 0
+    limit_page_length = 20
+    aggregate = None
+    is_erp_command = False
+    response_message = None
+
+    # Determine language; spaCy pipelines are only loaded if entity extraction needs them
+    lang = detect_language(user_query)
+
+    # --- ERP Command Parsing: one pass of the compiled intent router ---
+    intent = route_intent(user_query)
+    if intent:
+        is_erp_command = True
+        command_type = intent["command_type"]
+        doctype_name = intent["doctype"]
+        # Bulk intents carry one payload per listed record
+        data = intent["rows"] if intent["rows"] is not None else intent["data"]
+        filters = _resolve_filters(intent["filters"])
+        fields = intent["fields"]
+        aggregate = intent["aggregate"]
+        response_message = intent["response_message"]
+
+        ner_field = intent["ner_fallback"]
+        if ner_field and not data:
+            entities = extract_entities(user_query, lang)
+            if entities: data = {ner_field: entities[0].title()}
+
+    # Intents answered by the LLM: term explanation, process steps and script generation
+    if command_type in ("what is", "how to", "generate_script"):
+        provider = get_provider_config()
+
+        if command_type == "what is":
+            response = get_erp_explanation(intent["remainder"], user_roles, provider["name"], provider["api_key"], stream_id=stream_id)
+        elif command_type == "how to":
+            response = get_erp_steps(intent["remainder"], user_roles, provider["name"], provider["api_key"], stream_id=stream_id)
         else:
-            doc = nlp_en(user_query) if 'nlp_en' in locals() else None
-            lang = 'en'
-
-        # --- Refined ERP Command Parsing using NLP and Regex ---
-
-        # Intent: Create Record
-        if "create" in lower_query or "أنشئ" in lower_query:
-            if "item group" in lower_query or "مجموعة أصناف" in lower_query:
-                command_type = "create"
-                doctype_name = "Item Group"
-                # Extract item group name more robustly
-                match = re.search(r"(?:for|باسم|بخصوص)\s+([\w\s]+)", user_query, re.IGNORECASE)
-                if match:
-                    item_group_name = match.group(1).strip().title()
-                    data = {"item_group_name": item_group_name, "is_group": 1}
-                is_erp_command = True
-            elif "customer" in lower_query or "عميل" in lower_query:
-                command_type = "create"
-                doctype_name = "Customer"
-                customer_name = ""
-                if lang == 'ar':
-                    match = re.search(r"باسم\s+([\w\s]+)", user_query)
-                    if match: customer_name = match.group(1).strip()
-                else:
-                    match = re.search(r"named\s+([\w\s]+)", user_query)
-                    if match: customer_name = match.group(1).strip()
-                if customer_name: data = {"customer_name": customer_name.title()}
-                is_erp_command = True
-            elif "sales order" in lower_query or "أمر بيع" in lower_query:
-                command_type = "create"
-                doctype_name = "Sales Order"
-                customer_name = ""
-                if lang == 'ar':
-                    match = re.search(r"لـ\s+([\w\s]+)", user_query)
-                    if match: customer_name = match.group(1).strip()
-                else:
-                    match = re.search(r"for\s+([\w\s]+)", user_query)
-                    if match: customer_name = match.group(1).strip()
-                if customer_name: data = {"customer": customer_name.title(), "naming_series": "SO-"}
-                response_message = "Sales Order creation initiated. Please provide more details like items and quantities."
-                is_erp_command = True
-
-        # Intent: Read Data
-        elif "show me" in lower_query or "اعرض لي" in lower_query:
-            if "overdue invoices" in lower_query or "فواتير متأخرة" in lower_query:
-                command_type = "read"
-                doctype_name = "Sales Invoice"
-                filters = {"due_date": ["<=", frappe.utils.today()], "outstanding_amount": [">", 0]}
-                if "for april" in lower_query or "لشهر أبريل" in lower_query:
-                    filters["posting_date"] = [">=", "2025-04-01"], ["<=", "2025-04-30"]
-                is_erp_command = True
-            elif "quotations for client" in lower_query or "عروض أسعار للعميل" in lower_query:
-                command_type = "read"
-                doctype_name = "Quotation"
-                client_name = ""
-                if lang == 'ar':
-                    match = re.search(r"للعميل\s+([\w\s]+)", user_query)
-                    if match: client_name = match.group(1).strip()
-                else:
-                    match = re.search(r"for client\s+([\w\s]+)", user_query)
-                    if match: client_name = match.group(1).strip()
-                if client_name: filters = {"customer_name": client_name.title()}
-                is_erp_command = True
-            elif "sales invoices today" in lower_query or "فواتير البيع اليوم" in lower_query:
-                command_type = "read"
-                doctype_name = "Sales Invoice"
-                filters = {"posting_date": frappe.utils.today()}
-                fields = ["count(name) as total_invoices"]
-                is_erp_command = True
-
-        # File Understanding
-        elif "analyze" in lower_query or "تحليل" in lower_query:
-            if any(ext in lower_query for ext in ["excel", "pdf", "word", "image"]):
-                command_type = "analyze_document"
-                response_message = "Please upload the file for analysis. File analysis functionality is under development."
-                is_erp_command = True
-        elif "upload" in lower_query or "رفع" in lower_query:
-            if any(ext in lower_query for ext in ["pdf", "word", "excel", "image"]):
-                command_type = "upload_document"
-                response_message = "Please upload the file. File upload functionality is under development."
-                is_erp_command = True
-
-        # Intent: Navigate
-        elif "go to" in lower_query or "افتح" in lower_query:
-            if "customer list" in lower_query or "قائمة العملاء" in lower_query:
-                response_message = {"status": "navigate", "path": "/app/customer", "message": "Opening Customer List."} # Frontend will interpret this
-                is_erp_command = True
-            elif "item group settings" in lower_query or "إعدادات مجموعة الأصناف" in lower_query:
-                response_message = {"status": "navigate", "path": "/app/item-group", "message": "Opening Item Group settings."} # Frontend will interpret this
-                is_erp_command = True
-
-        # Intent: ERP Training and Term Explanation
-        elif "what is" in lower_query or "ما هو" in lower_query or "define" in lower_query or "ما معنى" in lower_query:
-            term = user_query.replace("what is", "").replace("ما هو", "").replace("define", "").replace("ما معنى", "").strip()
-            ai_settings = frappe.get_single("AI Settings")
-            default_ai_provider_name = ai_settings.default_ai_provider
-            ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-            api_key = ai_provider.api_key
-            response = get_erp_explanation(term, user_roles, default_ai_provider_name, api_key)
-            is_erp_command = True # Treat as ERP command for logging, but it\'s an AI response
-
-        elif "how to" in lower_query or "steps for" in lower_query or "كيف" in lower_query or "خطوات" in lower_query:
-            process = user_query.replace("how to", "").replace("steps for", "").replace("كيف", "").replace("خطوات", "").strip()
-            ai_settings = frappe.get_single("AI Settings")
-            default_ai_provider_name = ai_settings.default_ai_provider
-            ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-            api_key = ai_provider.api_key
-            response = get_erp_steps(process, user_roles, default_ai_provider_name, api_key)
-            is_erp_command = True # Treat as ERP command for logging, but it\'s an AI response
-
-        # Intent: Generate Script (New Logic)
-        elif "generate script" in lower_query or "إنشاء سكريبت" in lower_query:
-            command_type = "generate_script"
-            script_type = ""
-            prompt = user_query
-
-            # Extract script type (e.g., Client Script, Server Script)
-            if "client script" in lower_query or "سكريبت عميل" in lower_query:
-                script_type = "Client Script"
-            elif "server script" in lower_query or "سكريبت خادم" in lower_query:
-                script_type = "Server Script"
-            else:
-                script_type = "Python Script" # Default or ask for clarification
-            
-            # Extract prompt for script generation
-            # This needs more advanced NLP to get the exact prompt
-            # For now, we\'ll use the whole query as prompt, or refine later
-            
-            ai_settings = frappe.get_single("AI Settings")
-            default_ai_provider_name = ai_settings.default_ai_provider
-            ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-            api_key = ai_provider.api_key
-            
-            response = generate_script(prompt, script_type, default_ai_provider_name, api_key)
-            is_erp_command = True
-
-        # --- Execute Command or Get AI Response ---
-        if is_erp_command:
-            if response_message:
-                response = response_message
-            elif command_type in ["what is", "how to", "generate_script"]: # These are handled by erp_knowledge_base or generate_script
-                pass # Response is already generated above
-            else:
-                response = execute_frappe_command(command_type, doctype_name, data=data, filters=filters, user=current_user, fields=fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length)
+            # The whole query is used as the prompt for script generation for now
+            response = generate_script(user_query, intent["script_type"], provider["name"], provider["api_key"])
+
+    # --- Execute Command or Get AI Response ---
+    if is_erp_command:
+        if response_message:
+            response = response_message
+        elif command_type in ["what is", "how to", "generate_script"]: # These are handled by erp_knowledge_base or generate_script
+            pass # Response is already generated above
         else:
-            modified_query = user_query
-            if "Sales User" in user_roles:
-                modified_query = f"{user_query} related to sales"
-            elif "Accounts User" in user_roles:
-                modified_query = f"{user_query} related to accounting"
-
-            ai_settings = frappe.get_single("AI Settings")
-            default_ai_provider_name = ai_settings.default_ai_provider
+            response = execute_frappe_command(command_type, doctype_name, data=data, filters=filters, user=current_user, fields=fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length, aggregate=aggregate)
+    else:
+        perspective = get_role_perspective(user_roles)
+        modified_query = render_text("role_hint", query=user_query, perspective=perspective) if perspective else user_query
 
-            ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-            api_key = ai_provider.api_key
+        provider = get_provider_config()
+        # Follow-ups ("and for last month?") are answered with the conversation's history
+        messages = conversations.build_messages(conversation, modified_query) if conversation else None
+        # With a stream_id, tokens are pushed over realtime while the full text is still returned and logged
+        response = get_ai_response(modified_query, "Natural Language", provider["name"], provider["api_key"], stream=bool(stream_id), stream_id=stream_id, messages=messages)
 
-            response = get_ai_response(modified_query, "Natural Language", default_ai_provider_name, api_key)
+    query_type = "Natural Language" if not is_erp_command else command_type.replace("_", " ").title()
+    query_date = log_query(user_query, response, query_type, current_user, latency_ms=(time.monotonic() - started) * 1000, conversation=conversation_id)
+    if conversation:
+        conversations.record_turn(conversation_id, user_query, response, query_date)
 
-        frappe.get_doc({
-            "doctype": "AI Query",
-            "query_text": user_query,
-            "response_text": str(response), # Convert response to string for logging
-            "query_type": "Natural Language" if not is_erp_command else command_type.replace("_", " ").title(),
-            "user": current_user,
-            "query_date": frappe.utils.now_datetime()
-        }).insert(ignore_permissions=True)
-
-        return response
+    return response
 
+@frappe.whitelist()
+def quick_query(query_text, stream_id=None, async_mode=None, conversation_id=None):
+    try:
+        if is_async_enabled(async_mode):
+            return enqueue_chat_job("quick_query", query_text=query_text, stream_id=stream_id, conversation_id=conversation_id)
+        return process_quick_query(query_text, stream_id, conversation_id)
     except Exception as e:
-        frappe.log_error(f"Error in get_chat_response: {e}", "AI Chat Error")
+        frappe.log_error(f"Error in quick_query: {e}", "AI Quick Query Error")
         frappe.response["type"] = "json"
         frappe.response["http_status_code"] = 500
         return {"status": "error", "message": str(e)}
 
-@frappe.whitelist()
-def quick_query(query_text):
-    try:
-        current_user = frappe.session.user
-        user_roles = frappe.get_roles(current_user)
-
-        modified_query = query_text
-        if "Sales User" in user_roles:
-            modified_query = f"{query_text} related to sales"
-        elif "Accounts User" in user_roles:
-            modified_query = f"{query_text} related to accounting"
+def process_quick_query(query_text, stream_id=None, conversation_id=None):
+    started = time.monotonic()
+    current_user = frappe.session.user
+    user_roles = get_user_roles(current_user)
+    conversation = conversations.get_conversation_state(conversation_id, current_user) if conversation_id else None
 
-        ai_settings = frappe.get_single("AI Settings")
-        default_ai_provider_name = ai_settings.default_ai_provider
+    perspective = get_role_perspective(user_roles)
+    modified_query = render_text("role_hint", query=query_text, perspective=perspective) if perspective else query_text
 
-        ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-        api_key = ai_provider.api_key
+    provider = get_provider_config()
+    messages = conversations.build_messages(conversation, modified_query) if conversation else None
+    response = get_ai_response(modified_query, "Natural Language", provider["name"], provider["api_key"], stream=bool(stream_id), stream_id=stream_id, messages=messages)
 
-        response = get_ai_response(modified_query, "Natural Language", default_ai_provider_name, api_key)
+    query_date = log_query(query_text, response, "Quick Query", current_user, latency_ms=(time.monotonic() - started) * 1000, conversation=conversation_id)
+    if conversation:
+        conversations.record_turn(conversation_id, query_text, response, query_date)
 
-        frappe.get_doc({
-            "doctype": "AI Query",
-            "query_text": query_text,
-            "response_text": str(response), # Convert response to string for logging
-            "query_type": "Quick Query",
-            "user": current_user,
-            "query_date": frappe.utils.now_datetime()
-        }).insert(ignore_permissions=True)
+    return response
 
-        return response
+@frappe.whitelist()
+def start_conversation(title=None):
+    # Returns the id the client sends as conversation_id with the following messages
+    try:
+        return {"status": "success", "conversation_id": conversations.start_conversation(title)}
     except Exception as e:
-        frappe.log_error(f"Error in quick_query: {e}", "AI Quick Query Error")
+        frappe.log_error(f"Error in start_conversation: {e}", "AI Chat Error")
         frappe.response["type"] = "json"
         frappe.response["http_status_code"] = 500
         return {"status": "error", "message": str(e)}
 
 @frappe.whitelist()
-def generate_script_from_prompt(prompt, script_type):
+def generate_script_from_prompt(prompt, script_type, async_mode=None):
     try:
-        ai_settings = frappe.get_single("AI Settings")
-        default_ai_provider_name = ai_settings.default_ai_provider
-
-        ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-        api_key = ai_provider.api_key
-
-        generated_script = generate_script(prompt, script_type, default_ai_provider_name, api_key)
-
-        return generated_script
+        if is_async_enabled(async_mode):
+            return enqueue_chat_job("generate_script_from_prompt", prompt=prompt, script_type=script_type)
+        return process_script_generation(prompt, script_type)
     except Exception as e:
         frappe.log_error(f"Error in generate_script_from_prompt: {e}", "AI Script Generation Error")
         frappe.response["type"] = "json"
         frappe.response["http_status_code"] = 500
         return {"status": "error", "message": str(e)}
 
+def process_script_generation(prompt, script_type):
+    provider = get_provider_config()
+    generated_script = generate_script(prompt, script_type, provider["name"], provider["api_key"])
+
+    return generated_script
+
 @frappe.whitelist()
 def upload_and_analyze_document(file_url, document_name, document_type, analysis_prompt=None):
     try:
@@ -295,5 +197,20 @@ def get_document_analysis_status(processor_id):
         frappe.response["http_status_code"] = 500
         return {"status": "error", "message": str(e)}
 
+@frappe.whitelist()
+def get_more_records(cursor):
+    # Following pages of a "show me" answer; the cursor comes from the previous page
+    try:
+        return fetch_next_page(cursor, user=frappe.session.user)
+    except Exception as e:
+        frappe.log_error(f"Error in get_more_records: {e}", "AI Chat Error")
+        frappe.response["type"] = "json"
+        frappe.response["http_status_code"] = 500
+        return {"status": "error", "message": str(e)}
 
-
+@frappe.whitelist()
+def get_chat_job_status(request_id):
+    job = get_job_for_user(request_id)
+    if not job:
+        return {"status": "Unknown", "request_id": request_id, "result": None, "error": "Request ID not found or expired."}
+    return {"status": job["status"], "request_id": request_id, "result": job["result"], "error": job["error"]}
@@ -0,0 +1,98 @@
+import time
+from contextlib import contextmanager
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api.job_store import create_job, finish_job, update_job
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config
+
+# Opt-in asynchronous mode for the chat endpoints: the web worker only enqueues the request and
+# returns a request id, the LLM call runs on a dedicated RQ queue and the result is pushed over
+# realtime (or read from get_chat_job_status). Configure the queue in common_site_config.json:
+#   "workers": {"ai_assistant": {"timeout": 600}}, "ai_assistant_queue": "ai_assistant"
+
+DEFAULT_QUEUE = "long"
+JOB_TIMEOUT = 600
+SLOT_KEY = "ai_assistant:provider_slots"
+SLOT_WAIT = 120
+SLOT_POLL_INTERVAL = 0.25
+
+JOB_METHODS = {
+    "get_chat_response": "ai_assistant.ontime_ai_assistant.api.chat.process_chat_query",
+    "quick_query": "ai_assistant.ontime_ai_assistant.api.chat.process_quick_query",
+    "generate_script_from_prompt": "ai_assistant.ontime_ai_assistant.api.chat.process_script_generation",
+}
+
+
+def is_async_enabled(async_mode=None):
+    if async_mode is not None and async_mode != "":
+        return bool(frappe.utils.cint(async_mode))
+    return bool(frappe.utils.cint(frappe.db.get_single_value("AI Settings", "enable_async_mode")))
+
+
+def enqueue_chat_job(method, **kwargs):
+    provider = get_provider_config()
+    request_id = frappe.generate_hash(length=16)
+    create_job(request_id, method, provider=provider["name"])
+
+    frappe.enqueue(
+        "ai_assistant.ontime_ai_assistant.api.chat_jobs.run_chat_job",
+        queue=frappe.conf.get("ai_assistant_queue") or DEFAULT_QUEUE,
+        timeout=JOB_TIMEOUT,
+        job_id=request_id,
+        request_id=request_id,
+        chat_method=method,
+        provider_name=provider["name"],
+        max_concurrency=provider.get("max_concurrent_requests"),
+        method_kwargs=kwargs,
+    )
+    return {"status": "queued", "request_id": request_id, "message": "Your request is being processed."}
+
+
+def run_chat_job(request_id, chat_method, provider_name, max_concurrency, method_kwargs):
+    try:
+        with provider_slot(provider_name, max_concurrency):
+            update_job(request_id, status="Running")
+            result = frappe.get_attr(JOB_METHODS[chat_method])(**method_kwargs)
+        frappe.db.commit()
+        finish_job(request_id, "Completed", result=result)
+    except Exception as e:
+        frappe.db.rollback()
+        frappe.log_error(f"Error in chat job {chat_method}: {e}", "AI Chat Job Error")
+        finish_job(request_id, "Failed", error=str(e))
+
+
+@contextmanager
+def provider_slot(provider_name, limit):
+    # Counting semaphore in Redis so at most `limit` jobs call the same provider at once, across all workers.
+    # Each holder is a member of a sorted set scored by its deadline, so a slot leaked by a killed worker
+    # is pruned once its own deadline passes, however busy the provider is.
+    limit = frappe.utils.cint(limit)
+    if limit <= 0:
+        yield
+        return
+
+    cache = frappe.cache()
+    key = cache.make_key(f"{SLOT_KEY}:{provider_name}")
+    token = frappe.generate_hash(length=12)
+    deadline = time.monotonic() + SLOT_WAIT
+    while True:
+        now = time.time()
+        pipe = cache.pipeline()
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zadd(key, {token: now + JOB_TIMEOUT})
+        pipe.zcard(key)
+        # Only lets an idle key disappear; members expire by score
+        pipe.expire(key, JOB_TIMEOUT)
+        in_use = pipe.execute()[2]
+        if in_use <= limit:
+            break
+        cache.zrem(key, token)
+        if time.monotonic() > deadline:
+            frappe.throw(f"AI Provider {provider_name} is busy, please try again later.")
+        time.sleep(SLOT_POLL_INTERVAL)
+
+    try:
+        yield
+    finally:
+        cache.zrem(key, token)
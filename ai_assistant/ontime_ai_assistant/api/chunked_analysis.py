@@ -0,0 +1,163 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+# Map-reduce analysis for documents larger than one prompt.
+#
+# Pages are packed into chunks up to a token budget, breaking on page boundaries first, then on
+# sections (headings / blank lines), sentences, words and finally characters. Chunks are analysed
+# concurrently (map) and the partial results are merged (reduce); when the partials themselves do not
+# fit one prompt they are merged in groups, level by level, until one result remains.
+#
+# Nothing here touches frappe: `map_fn` / `reduce_fn` are plain functions prepared by the caller
+# (see ai_service.prepare_completion), so they can run on worker threads.
+
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_CONCURRENCY = 4
+
+_SECTION_BREAK = re.compile(r"\n\s*\n|\n(?=#{1,6} )")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?؟])\s+")
+
+
+def make_token_counter(model=None):
+    # Uses the model's tokenizer through litellm when available, otherwise ~4 characters per token
+    if model:
+        try:
+            from litellm import token_counter
+
+            token_counter(model=model, text="warm up")
+            return lambda text: token_counter(model=model, text=text)
+        except Exception:
+            pass
+    return estimate_tokens
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def chunk_pages(pages, max_tokens=DEFAULT_CHUNK_TOKENS, count_tokens=estimate_tokens):
+    # pages: iterable of (page_number, text). Yields {"index", "first_page", "last_page", "text", "tokens"}
+    index = 0
+    parts, tokens, first_page, last_page = [], 0, None, None
+
+    for page_number, text in pages:
+        for piece, piece_tokens in _split(text, max_tokens, count_tokens):
+            if parts and tokens + piece_tokens > max_tokens:
+                yield {"index": index, "first_page": first_page, "last_page": last_page, "text": "\n\n".join(parts), "tokens": tokens}
+                index += 1
+                parts, tokens, first_page = [], 0, None
+            if first_page is None:
+                first_page = page_number
+            parts.append(piece)
+            tokens += piece_tokens
+            last_page = page_number
+
+    if parts:
+        yield {"index": index, "first_page": first_page, "last_page": last_page, "text": "\n\n".join(parts), "tokens": tokens}
+
+
+def _split(text, max_tokens, count_tokens):
+    # Yields (piece, tokens) pieces no larger than max_tokens, preferring the coarsest boundary
+    text = text.strip()
+    if not text:
+        return
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        yield text, tokens
+        return
+
+    for pattern in (_SECTION_BREAK, _SENTENCE_BREAK):
+        pieces = [piece for piece in pattern.split(text) if piece.strip()]
+        if len(pieces) > 1:
+            for group, group_tokens in _pack(pieces, max_tokens, count_tokens):
+                if len(group) > 1:
+                    yield "\n\n".join(group), group_tokens
+                else:
+                    yield from _split(group[0], max_tokens, count_tokens)
+            return
+
+    # No natural boundary left: cut on words, and on characters inside a word over the budget
+    yield from _cut(text.split(), " ", tokens, max_tokens, count_tokens)
+
+
+def _cut(units, joiner, tokens, max_tokens, count_tokens):
+    # Cuts units (words or characters) into runs sized from their share of `tokens`; a run that is
+    # still over budget is cut again, so every yielded piece fits unless it is a single character
+    step = max(1, len(units) * max_tokens // tokens)
+    for start in range(0, len(units), step):
+        run = units[start : start + step]
+        piece = joiner.join(run)
+        piece_tokens = count_tokens(piece)
+        if piece_tokens <= max_tokens:
+            yield piece, piece_tokens
+        elif len(run) > 1:
+            yield from _cut(run, joiner, piece_tokens, max_tokens, count_tokens)
+        elif joiner:
+            # One word longer than the budget, e.g. a page of text without spaces
+            yield from _cut(list(piece), "", piece_tokens, max_tokens, count_tokens)
+        else:
+            yield piece, piece_tokens
+
+
+def _pack(pieces, max_tokens, count_tokens):
+    # Groups neighbouring small pieces so a split does not produce hundreds of tiny chunks;
+    # a group of one may still be over budget and is split further by the caller
+    buffer, tokens = [], 0
+    for piece in pieces:
+        piece_tokens = count_tokens(piece)
+        if buffer and tokens + piece_tokens > max_tokens:
+            yield buffer, tokens
+            buffer, tokens = [], 0
+        buffer.append(piece)
+        tokens += piece_tokens
+    if buffer:
+        yield buffer, tokens
+
+
+def map_reduce(
+    chunks,
+    map_fn,
+    reduce_fn,
+    max_tokens=DEFAULT_CHUNK_TOKENS,
+    max_concurrency=DEFAULT_CONCURRENCY,
+    count_tokens=estimate_tokens,
+    on_progress=None,
+):
+    # map_fn(chunk, total) -> str; reduce_fn(list of str) -> str; on_progress(done, total)
+    chunks = list(chunks)
+    if not chunks:
+        return ""
+
+    total = len(chunks)
+    if total == 1:
+        return map_fn(chunks[0], 1)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, total)), thread_name_prefix="ai-chunk") as pool:
+        futures = [pool.submit(map_fn, chunk, total) for chunk in chunks]
+        partials = []
+        for done, future in enumerate(futures, 1):
+            partials.append(future.result())
+            if on_progress:
+                on_progress(done, total)
+
+        while len(partials) > 1:
+            groups = list(_group_partials(partials, max_tokens, count_tokens))
+            if len(groups) == len(partials):
+                # Partials are too large to combine; merge pairwise so the loop always shrinks
+                groups = [partials[i : i + 2] for i in range(0, len(partials), 2)]
+            partials = list(pool.map(lambda group: group[0] if len(group) == 1 else reduce_fn(group), groups))
+
+    return partials[0]
+
+
+def _group_partials(partials, max_tokens, count_tokens):
+    group, tokens = [], 0
+    for partial in partials:
+        partial_tokens = count_tokens(partial)
+        if group and tokens + partial_tokens > max_tokens:
+            yield group
+            group, tokens = [], 0
+        group.append(partial)
+        tokens += partial_tokens
+    if group:
+        yield group
@@ -0,0 +1,221 @@
+import json
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api.ai_service import get_model_name, is_error_response, route_completion
+from ai_assistant.ontime_ai_assistant.api.chunked_analysis import estimate_tokens
+from ai_assistant.ontime_ai_assistant.api.permission_cache import get_user_roles
+from ai_assistant.ontime_ai_assistant.api.prompt_templates import get_system, record_render, render, render_text
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config
+
+# Multi-turn chat sessions.
+#
+# An AI Conversation document holds the owner, the rolling summary and the query_date of the last
+# turn it covers; every turn is also an AI Query row linked to the conversation. The hot state (owner,
+# summary and the turns not yet summarised) lives in the site cache, so a chat message costs one cache
+# read and one write. When the state has expired it is rebuilt from the document and the AI Query
+# rows logged after that date, leaving out failed answers as record_turn does.
+#
+# Messages sent to the model are: the static system message, the summary, then the most recent turns
+# that fit the token budget, then the new query. Once the unsummarised turns exceed the budget, a job
+# folds the oldest ones into the summary, keeping half the budget as verbatim turns. The prefix
+# (system message, summary and older turns) therefore only changes when a summary is written, which
+# is what provider prompt caches key on; see ai_service.apply_prompt_caching.
+#
+# Site config: ai_assistant_conversation_tokens, history budget in tokens, default 3000.
+
+# State per conversation; its turns are [query, answer, query_date]
+STATE_KEY = "ai_assistant:conversation"
+STATE_TTL = 2 * 60 * 60
+DEFAULT_HISTORY_TOKENS = 3000
+# Turns are stored clipped so one long answer (a table of records) cannot fill the budget alone
+TURN_CHARS = 2000
+# Turns read back from AI Query when the cached state has expired
+MAX_REBUILD_TURNS = 100
+SUMMARY_JOB_TIMEOUT = 300
+# Seconds a worker may hold, or wait for, the lock on a conversation's state
+STATE_LOCK_TIMEOUT = 10
+
+
+def start_conversation(title=None, user=None):
+    user = user or frappe.session.user
+    doc = frappe.get_doc({
+        "doctype": "AI Conversation",
+        "title": (title or "New conversation")[:140],
+        "user": user,
+        "last_active": frappe.utils.now(),
+    })
+    doc.insert(ignore_permissions=True)
+    _save_state(doc.name, {"user": user, "summary": "", "summarized": 0, "summarized_until": None, "turns": []})
+    return doc.name
+
+
+def get_conversation_state(conversation_id, user=None):
+    user = user or frappe.session.user
+    state = frappe.cache().get_value(_state_key(conversation_id))
+    if state is None:
+        state = _load_state(conversation_id)
+        _save_state(conversation_id, state)
+    if state["user"] != user and "System Manager" not in get_user_roles(user):
+        frappe.throw("You do not have access to this conversation.", frappe.PermissionError)
+    return state
+
+
+def build_messages(state, query_text, budget=None):
+    # The character estimate is used rather than the model tokenizer: this runs on every message
+    budget = budget or get_history_budget()
+    prefix = [{"role": "system", "content": get_system("conversation_system")}]
+    if state["summary"]:
+        prefix.append({"role": "system", "content": render_text("conversation_system", summary=state["summary"])})
+
+    history = []
+    used = 0
+    for query, answer, _ in reversed(state["turns"]):
+        tokens = estimate_tokens(query) + estimate_tokens(answer)
+        if history and used + tokens > budget:
+            # Dropped here until the summary job folds them in
+            break
+        history[:0] = [{"role": "user", "content": query}, {"role": "assistant", "content": answer}]
+        used += tokens
+
+    messages = [*prefix, *history, {"role": "user", "content": query_text}]
+    record_render("conversation_system", messages)
+    return messages
+
+
+def record_turn(conversation_id, query_text, response, query_date):
+    # Failed answers are not worth repeating to the model
+    if _is_failed(response):
+        return
+    answer = response if isinstance(response, str) else frappe.as_json(response, indent=None)
+    turn = [_clip(query_text), _clip(answer), query_date]
+    # Re-read under the lock: other turns or a summary may have been saved since state was read
+    with _state_lock(conversation_id):
+        state = frappe.cache().get_value(_state_key(conversation_id)) or _load_state(conversation_id)
+        state["turns"].append(turn)
+        _save_state(conversation_id, state)
+
+    if sum(estimate_tokens(query) + estimate_tokens(answer) for query, answer, _ in state["turns"]) > get_history_budget():
+        frappe.enqueue(
+            "ai_assistant.ontime_ai_assistant.api.conversation.summarize_conversation",
+            queue=frappe.conf.get("ai_assistant_queue") or "default",
+            timeout=SUMMARY_JOB_TIMEOUT,
+            job_id=f"ai_conversation_summary:{conversation_id}",
+            deduplicate=True,
+            conversation_id=conversation_id,
+        )
+
+
+def summarize_conversation(conversation_id):
+    state = frappe.cache().get_value(_state_key(conversation_id)) or _load_state(conversation_id)
+    keep_budget = get_history_budget() // 2
+    keep, kept_tokens = 0, 0
+    for query, answer, _ in reversed(state["turns"]):
+        tokens = estimate_tokens(query) + estimate_tokens(answer)
+        if kept_tokens + tokens > keep_budget:
+            break
+        keep += 1
+        kept_tokens += tokens
+    fold = len(state["turns"]) - keep
+    if fold <= 0:
+        return
+
+    provider = get_provider_config()
+    turns = "\n\n".join(f"User: {query}\nAssistant: {answer}" for query, answer, _ in state["turns"][:fold])
+    try:
+        summary = route_completion(
+            render("conversation_summary", summary=state["summary"] or "(none)", turns=turns),
+            provider["name"],
+            get_model_name(provider["name"]),
+            provider["api_key"],
+            "Conversation Summary",
+        ).strip()
+    except Exception as e:
+        frappe.log_error(f"Could not summarize conversation {conversation_id}: {e}", "AI Conversation Error")
+        return
+
+    # Turns may have been added while the summary was generated; drop only the ones folded in
+    folded_until = state["turns"][fold - 1][2]
+    with _state_lock(conversation_id):
+        state = frappe.cache().get_value(_state_key(conversation_id)) or state
+        state["summary"] = summary
+        state["summarized"] += fold
+        state["summarized_until"] = folded_until
+        state["turns"] = [turn for turn in state["turns"] if turn[2] > folded_until]
+        _save_state(conversation_id, state)
+    frappe.db.set_value(
+        "AI Conversation",
+        conversation_id,
+        {"summary": summary, "summarized_turns": state["summarized"], "summarized_until": state["summarized_until"]},
+        update_modified=False,
+    )
+    frappe.db.commit()
+
+
+def get_history_budget():
+    return frappe.utils.cint(frappe.conf.get("ai_assistant_conversation_tokens")) or DEFAULT_HISTORY_TOKENS
+
+
+def _load_state(conversation_id):
+    doc = frappe.db.get_value(
+        "AI Conversation", conversation_id, ["user", "summary", "summarized_turns", "summarized_until"], as_dict=True
+    )
+    if not doc:
+        frappe.throw(f"Conversation {conversation_id} not found.", frappe.DoesNotExistError)
+    filters = {"conversation": conversation_id}
+    if doc.summarized_until:
+        filters["query_date"] = [">", doc.summarized_until]
+    # The most recent turns, oldest first
+    rows = frappe.get_all(
+        "AI Query",
+        filters=filters,
+        fields=["query_text", "response_text", "query_date"],
+        order_by="query_date desc, name desc",
+        limit_page_length=MAX_REBUILD_TURNS,
+    )
+    return {
+        "user": doc.user,
+        "summary": doc.summary or "",
+        "summarized": doc.summarized_turns or 0,
+        "summarized_until": doc.summarized_until and str(doc.summarized_until),
+        "turns": [
+            [_clip(row.query_text or ""), _clip(row.response_text or ""), str(row.query_date)]
+            for row in reversed(rows)
+            if not _is_failed(row.response_text or "")
+        ],
+    }
+
+
+def _save_state(conversation_id, state):
+    frappe.cache().set_value(_state_key(conversation_id), state, expires_in_sec=STATE_TTL)
+
+
+def _state_key(conversation_id):
+    return f"{STATE_KEY}:{conversation_id}"
+
+
+def _state_lock(conversation_id):
+    cache = frappe.cache()
+    return cache.lock(
+        cache.make_key(f"{_state_key(conversation_id)}:lock"),
+        timeout=STATE_LOCK_TIMEOUT,
+        blocking_timeout=STATE_LOCK_TIMEOUT,
+    )
+
+
+def _is_failed(response):
+    # Error text from get_ai_response, or a command result with status "error" (logged as JSON)
+    if isinstance(response, str):
+        if is_error_response(response):
+            return True
+        if not response.startswith("{"):
+            return False
+        try:
+            response = json.loads(response)
+        except ValueError:
+            return False
+    return isinstance(response, dict) and response.get("status") == "error"
+
+
+def _clip(text):
+    return text if len(text) <= TURN_CHARS else f"{text[:TURN_CHARS]} …"
@@ -2,18 +2,30 @@ import frappe
 import os
 import PyPDF2
 import docx
-import openpyxl
-from PIL import Image
-import pytesseract
 import io
-from ai_assistant.ontime_ai_assistant.api.ai_service import get_ai_response
-import pdfplumber
-
-# Placeholder for ongoing processing tasks (consider using Frappe.cache or a DocType for persistence)
-processing_tasks = {}
+from ai_assistant.ontime_ai_assistant.api.ai_service import PROVIDER_MODELS, get_model_name, prepare_completion
+from ai_assistant.ontime_ai_assistant.api.chat_jobs import DEFAULT_QUEUE
+from ai_assistant.ontime_ai_assistant.api.chunked_analysis import DEFAULT_CHUNK_TOKENS, DEFAULT_CONCURRENCY, chunk_pages, make_token_counter, map_reduce
+from ai_assistant.ontime_ai_assistant.api.extraction_cache import file_digest, get_extraction_cache
+from ai_assistant.ontime_ai_assistant.api.http_client import configure_litellm
+from ai_assistant.ontime_ai_assistant.api.job_store import create_job, finish_job, get_job_for_user, set_job_progress
+from ai_assistant.ontime_ai_assistant.api.ocr import ocr_image_file
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config
+from ai_assistant.ontime_ai_assistant.api.pdf_extraction import PAGES_PER_RANGE, iter_pdf_pages
+from ai_assistant.ontime_ai_assistant.api.prompt_templates import get_system, render, template_key
+from ai_assistant.ontime_ai_assistant.api.spreadsheet_extraction import extract_workbook_profile
+
+# Extraction and analysis run in a background job. Its state (status, progress, result) lives in the
+# shared job store so any web worker can answer status requests, and the owner gets a realtime push
+# when the job finishes.
+
+JOB_KIND = "document_analysis"
+DOCUMENT_TYPES = ("PDF", "Word Document", "Excel Spreadsheet", "Image")
+# Share of the progress bar spent on extraction; the rest covers the AI analysis
+EXTRACTION_PROGRESS = 50
 
 @frappe.whitelist()
-def upload_document(file_url, document_name, document_type):
+def upload_document(file_url, document_name, document_type, analysis_prompt=None):
     try:
         # Ensure the file_url is a valid Frappe file URL
         if not file_url or not file_url.startswith("/files/"):
@@ -28,53 +40,61 @@ def upload_document(file_url, document_name, document_type):
         if not os.path.exists(file_path):
             frappe.throw(f"File not found at path: {file_path}")
 
-        extracted_content = ""
-        if document_type == "PDF":
-            extracted_content = extract_text_from_pdf(file_path)
-        elif document_type == "Word Document":
-            extracted_content = extract_text_from_docx(file_path)
-        elif document_type == "Excel Spreadsheet":
-            extracted_content = extract_text_from_xlsx(file_path)
-        elif document_type == "Image":
-            extracted_content = extract_text_from_image(file_path)
-        else:
+        if document_type not in DOCUMENT_TYPES:
             frappe.throw(f"Unsupported document type: {document_type}")
 
-        # Get AI Settings and Provider details
-        ai_settings = frappe.get_single("AI Settings")
-        default_ai_provider_name = ai_settings.default_ai_provider
-        ai_provider = frappe.get_doc("AI Provider", default_ai_provider_name)
-        api_key = ai_provider.api_key
+        # Get AI Provider details
+        provider = get_provider_config()
+
+        # Identical content analysed with the same provider and prompt is answered from the cache
+        digest = file_digest(file_path)
+        job_id = frappe.generate_hash(length=16)
+        cached = get_extraction_cache().get_result(
+            digest, document_type, provider["name"], get_analysis_model(provider), analysis_prompt or template_key("document_analysis")
+        )
+        if cached is not None:
+            create_job(job_id, JOB_KIND, progress=0, stage="Cached", document_name=document_name, file_url=file_url)
+            finish_job(job_id, "Completed", result=cached)
+            return {"success": True, "processor_id": job_id, "cached": True, "extracted_data": cached, "message": "Document analysis loaded from cache.", "file_url": file_url}
+
+        create_job(job_id, JOB_KIND, progress=0, stage="Queued", document_name=document_name, file_url=file_url)
 
-        # Send content to AI for analysis (as a background task)
-        # Using frappe.enqueue for background processing
-        task_id = frappe.enqueue(
+        # The API key is not passed to the job so it is never stored in the queue
+        frappe.enqueue(
             "ai_assistant.ontime_ai_assistant.api.document_analysis.analyze_document_with_ai",
+            queue=frappe.conf.get("ai_assistant_queue") or DEFAULT_QUEUE,
             timeout=600, # 10 minutes timeout
-            job_id=frappe.generate_hash(file_url + frappe.utils.now_datetime().isoformat()), # Unique job ID
-            is_async=True,
-            file_content=extracted_content,
+            job_id=job_id,
+            processor_id=job_id,
+            file_path=file_path,
+            digest=digest,
             document_name=document_name,
-            ai_provider_name=default_ai_provider_name,
-            api_key=api_key
+            document_type=document_type,
+            analysis_prompt=analysis_prompt,
+            ai_provider_name=provider["name"],
         )
-        # Store task status in a temporary dictionary. For production, consider a DocType or Redis cache.
-        processing_tasks[task_id] = {"status": "Processing", "extracted_data": None, "error": None}
 
-        return {"success": True, "processor_id": task_id, "message": "Document submitted for analysis. You can check status using get_document_analysis_status.", "file_url": file_url}
+        return {"success": True, "processor_id": job_id, "message": "Document submitted for analysis. You will be notified when it is ready.", "file_url": file_url}
 
     except Exception as e:
         frappe.log_error(f"Error in upload_document: {e}", "Document Analysis Error")
         return {"success": False, "error": str(e)}
 
-def analyze_document_with_ai(file_content, document_name, ai_provider_name, api_key):
+def analyze_document_with_ai(processor_id, file_path, digest, document_name, document_type, analysis_prompt, ai_provider_name):
     # This function runs in a background job
-    job_id = frappe.get_rq_job_id() # Get the job ID for updating status
-    
     try:
-        prompt = f"Analyze the following document content from \'{document_name}\' and extract key information, summarize it, and identify any relevant entities. If it\'s a structured document like an invoice or purchase order, extract line items, totals, dates, and parties. If it\'s a contract, identify key clauses, parties, and terms. If it\'s a general text, provide a concise summary and main topics. Return the output in a structured JSON format if possible, otherwise as a comprehensive summary.\n\nDocument Content:\n{file_content}"
-        
-        ai_response = get_ai_response(prompt, "Document Analysis", ai_provider_name, api_key)
+        cache = get_extraction_cache()
+        pages = cache.get_pages(digest, document_type)
+        if pages is None:
+            set_job_progress(processor_id, 0, stage="Extracting")
+            # Pages go to chunking as they are extracted and are cached once the last one is read
+            pages = _caching_pages(cache, digest, document_type, extract_document_pages(file_path, document_type, processor_id), processor_id)
+        else:
+            set_job_progress(processor_id, EXTRACTION_PROGRESS, stage="Analyzing")
+
+        # The instructions are the system message of every chunk and merge prompt (see prompt_templates)
+        instructions = analysis_prompt or get_system("document_analysis")
+        ai_response = analyze_pages(pages, instructions, document_name, ai_provider_name, processor_id, cache)
         
         # Attempt to parse as JSON, otherwise keep as string
         try:
@@ -82,22 +102,107 @@ def analyze_document_with_ai(file_content, document_name, ai_provider_name, api_
         except:
             extracted_data = ai_response
 
-        processing_tasks[job_id] = {"status": "Completed", "extracted_data": extracted_data, "error": None}
+        provider = get_provider_config(ai_provider_name)
+        cache.set_result(
+            digest, document_type, ai_provider_name, get_analysis_model(provider), analysis_prompt or template_key("document_analysis"), extracted_data
+        )
+        finish_job(processor_id, "Completed", result=extracted_data)
     except Exception as e:
         frappe.log_error(f"Error analyzing document with AI: {e}", "Document Analysis Error")
-        processing_tasks[job_id] = {"status": "Failed", "extracted_data": None, "error": str(e)}
+        finish_job(processor_id, "Failed", error=str(e))
+
+def get_analysis_model(provider):
+    model = get_model_name(provider["name"]) or PROVIDER_MODELS.get(provider["provider_type"])
+    if not model:
+        frappe.throw(f"AI Provider {provider['name']} not supported yet.")
+    return model
+
+def analyze_pages(pages, instructions, document_name, ai_provider_name, processor_id=None, cache=None):
+    # Documents that fit one prompt get a single call; larger ones are analysed chunk by chunk and merged
+    provider = get_provider_config(ai_provider_name)
+    model = get_analysis_model(provider)
+
+    configure_litellm()
+    complete = prepare_completion(ai_provider_name, model, provider["api_key"])
+    if cache:
+        # Chunk and merge answers are reused when the same content is analysed again
+        complete = cache.cached_completion(complete, ai_provider_name, model)
+    count_tokens = make_token_counter(model)
+    max_tokens = frappe.utils.cint(frappe.conf.get("ai_assistant_chunk_tokens")) or DEFAULT_CHUNK_TOKENS
+    concurrency = frappe.utils.cint(provider.get("max_concurrent_requests")) or DEFAULT_CONCURRENCY
+    site = frappe.local.site
+
+    def analyze_chunk(chunk, total):
+        if total == 1:
+            messages = render("document_analysis", system=instructions, site=site, document_name=document_name, content=chunk["text"])
+        else:
+            messages = render(
+                "document_chunk", system=instructions, site=site, document_name=document_name, part=chunk["index"] + 1, total=total,
+                first_page=chunk["first_page"], last_page=chunk["last_page"], content=chunk["text"],
+            )
+        return complete(messages)
+
+    def merge(partials):
+        analyses = "\n\n".join(f"--- Partial analysis {i} ---\n{partial}" for i, partial in enumerate(partials, 1))
+        return complete(render("document_reduce", system=instructions, site=site, document_name=document_name, analyses=analyses))
+
+    def report(done, total):
+        if processor_id:
+            progress = EXTRACTION_PROGRESS + (95 - EXTRACTION_PROGRESS) * done // total
+            set_job_progress(processor_id, progress, chunks_analysed=done, chunk_count=total)
+
+    return map_reduce(
+        chunk_pages(pages, max_tokens, count_tokens),
+        analyze_chunk,
+        merge,
+        max_tokens=max_tokens,
+        max_concurrency=concurrency,
+        count_tokens=count_tokens,
+        on_progress=report,
+    )
 
 @frappe.whitelist()
 def get_processing_status(processor_id):
-    status = processing_tasks.get(processor_id, {"status": "Unknown", "extracted_data": None, "error": "Processor ID not found or job not started."})
-    return {"success": True, "status": status["status"], "extracted_data": status["extracted_data"], "error": status["error"]}
+    job = get_job_for_user(processor_id)
+    if not job:
+        return {"success": True, "status": "Unknown", "progress": None, "extracted_data": None, "error": "Processor ID not found or expired."}
+    return {"success": True, "status": job["status"], "progress": job.get("progress"), "stage": job.get("stage"), "extracted_data": job["result"], "error": job["error"]}
+
+def extract_document_pages(file_path, document_type, processor_id=None):
+    # Yields (page_number, text); formats without pages are yielded as a single page
+    if document_type == "PDF":
+        yield from extract_pdf_pages(file_path, processor_id)
+    elif document_type == "Word Document":
+        yield 1, extract_text_from_docx(file_path)
+    elif document_type == "Excel Spreadsheet":
+        yield 1, extract_text_from_xlsx(file_path)
+    elif document_type == "Image":
+        yield 1, extract_text_from_image(file_path)
+    else:
+        frappe.throw(f"Unsupported document type: {document_type}")
+
+def extract_pdf_pages(file_path, processor_id=None):
+    page_count = []
+    for page_number, page_text in iter_pdf_pages(file_path, on_page_count=page_count.append):
+        yield page_number, page_text
+        if processor_id and page_number % PAGES_PER_RANGE == 0:
+            set_job_progress(processor_id, EXTRACTION_PROGRESS * page_number // page_count[0], pages_extracted=page_number, page_count=page_count[0])
+
+def _caching_pages(cache, digest, document_type, pages, processor_id):
+    # Passes pages through and caches them after the last one
+    extracted = []
+    for page in pages:
+        extracted.append(page)
+        yield page
+    # Extractors report failures as text; those are not worth keeping
+    if not any(text.startswith("Error extracting") for _, text in extracted):
+        cache.set_pages(digest, document_type, extracted)
+    set_job_progress(processor_id, EXTRACTION_PROGRESS, stage="Analyzing")
 
 def extract_text_from_pdf(file_path):
-    text = ""
+    # Pages are parsed in parallel and joined once; use iter_pdf_pages directly to process them as a stream
     try:
-        with pdfplumber.open(file_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() or ""
+        text = "\n".join(page_text for _, page_text in iter_pdf_pages(file_path))
     except Exception as e:
         frappe.log_error(f"Error extracting text from PDF {file_path}: {e}", "Document Extraction Error")
         text = f"Error extracting text from PDF: {e}"
@@ -115,15 +220,9 @@ def extract_text_from_docx(file_path):
     return text
 
 def extract_text_from_xlsx(file_path):
-    text = ""
+    # Schema, numeric column stats and a budgeted sample of rows rather than the full sheet
     try:
-        workbook = openpyxl.load_workbook(file_path)
-        for sheet_name in workbook.sheetnames:
-            sheet = workbook[sheet_name]
-            text += f"\n--- Sheet: {sheet_name} ---\n"
-            for row in sheet.iter_rows():
-                row_values = [str(cell.value) if cell.value is not None else "" for cell in row]
-                text += "\t".join(row_values) + "\n"
+        text = extract_workbook_profile(file_path)
     except Exception as e:
         frappe.log_error(f"Error extracting text from XLSX {file_path}: {e}", "Document Extraction Error")
         text = f"Error extracting text from XLSX: {e}"
@@ -132,10 +231,9 @@ def extract_text_from_xlsx(file_path):
 def extract_text_from_image(file_path):
     text = ""
     try:
-        # Ensure Tesseract is installed and configured in the environment
-        # For Frappe, you might need to ensure tesseract-ocr is installed on the server
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image, lang=\'eng+ara\') # Support English and Arabic
+        # Ensure Tesseract (with the eng, ara and osd traineddata) is installed on the server;
+        # tesserocr is used when available to keep one tesseract instance per worker
+        text = ocr_image_file(file_path)
     except Exception as e:
         frappe.log_error(f"Error extracting text from image {file_path}: {e}", "Document Extraction Error")
         text = f"Error extracting text from image: {e}"
@@ -0,0 +1,243 @@
+import gzip
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api.response_cache import normalize_query
+
+# Local retrieval index over ERPNext/Frappe documentation and this site's DocType metadata, used to
+# ground knowledge-base prompts with a few short snippets instead of the model's general knowledge.
+#
+# The index is built offline:
+#   bench --site <site> execute ai_assistant.ontime_ai_assistant.api.erp_docs_index.build_index
+# Markdown/text docs are read from the directory in site config "ai_assistant_docs_path".
+# Retrieval is BM25 over an inverted index held in memory once per process and site. When
+# "ai_assistant_embedding_model" is configured, snippet vectors are also written to a numpy file that
+# is memory-mapped at query time and used to re-rank the BM25 candidates (embedding credentials come
+# from the provider environment variables litellm reads, e.g. OPENAI_API_KEY).
+
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+SNIPPET_CHARS = 600
+MAX_DOCTYPE_FIELDS = 40
+RERANK_CANDIDATES = 50
+
+# site -> (index file mtime, index)
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index_path(*parts):
+    return frappe.get_site_path("private", "ai_assistant", "docs_index", *parts)
+
+
+def tokenize(text):
+    return normalize_query(text).split()
+
+
+def build_index():
+    snippets = list(_iter_doc_snippets()) + list(_iter_doctype_snippets())
+
+    postings = defaultdict(list)
+    doc_lengths = []
+    for doc_id, snippet in enumerate(snippets):
+        terms = Counter(tokenize(f"{snippet['title']} {snippet['text']}"))
+        doc_lengths.append(sum(terms.values()))
+        for term, tf in terms.items():
+            postings[term].append([doc_id, tf])
+
+    count = len(snippets)
+    avg_length = (sum(doc_lengths) / count) if count else 1
+    index = {
+        "version": INDEX_VERSION,
+        "snippets": snippets,
+        # BM25 length normalisation is precomputed per snippet so queries only multiply and add
+        "doc_norms": [BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length) for length in doc_lengths],
+        "idf": {term: math.log(1 + (count - len(p) + 0.5) / (len(p) + 0.5)) for term, p in postings.items()},
+        "postings": postings,
+    }
+
+    os.makedirs(get_index_path(), exist_ok=True)
+    if frappe.conf.get("ai_assistant_embedding_model") and snippets:
+        _write_vectors(snippets)
+
+    tmp_path = get_index_path("bm25.json.gz.tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, get_index_path("bm25.json.gz"))
+    return {"snippets": count, "terms": len(postings)}
+
+
+@frappe.whitelist()
+def rebuild_index():
+    frappe.only_for("System Manager")
+    frappe.enqueue("ai_assistant.ontime_ai_assistant.api.erp_docs_index.build_index", queue="long", timeout=3600)
+    return {"status": "queued"}
+
+
+def retrieve(query, k=3):
+    index = _load_index()
+    if not index:
+        return []
+
+    scores = defaultdict(float)
+    doc_norms = index["doc_norms"]
+    for term in set(tokenize(query)):
+        idf = index["idf"].get(term)
+        if idf is None:
+            continue
+        for doc_id, tf in index["postings"][term]:
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + doc_norms[doc_id])
+
+    if not scores:
+        return []
+
+    candidates = sorted(scores, key=scores.get, reverse=True)[:RERANK_CANDIDATES]
+    if index.get("vectors") is not None:
+        candidates = _rerank(query, candidates, index["vectors"])
+    return [index["snippets"][doc_id] for doc_id in candidates[:k]]
+
+
+def build_context(snippets, max_chars=1500):
+    # Compact, numbered context block for the prompt
+    lines = []
+    used = 0
+    for number, snippet in enumerate(snippets, 1):
+        line = f"[{number}] {snippet['title']}: {snippet['text']}"
+        if used + len(line) > max_chars:
+            line = line[: max(max_chars - used, 0)]
+        if not line:
+            break
+        lines.append(line)
+        used += len(line)
+    return "\n".join(lines)
+
+
+def _load_index():
+    site = frappe.local.site
+    path = get_index_path("bm25.json.gz")
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        _indexes.pop(site, None)
+        return None
+
+    loaded = _indexes.get(site)
+    if loaded and loaded[0] == mtime:
+        return loaded[1]
+
+    with _lock:
+        loaded = _indexes.get(site)
+        if not loaded or loaded[0] != mtime:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                index = json.load(f)
+            index["vectors"] = _open_vectors(len(index["snippets"]))
+            loaded = _indexes[site] = (mtime, index)
+    return loaded[1]
+
+
+def _iter_doc_snippets():
+    docs_path = frappe.conf.get("ai_assistant_docs_path")
+    if not docs_path or not os.path.isdir(docs_path):
+        return
+
+    for root, _, files in os.walk(docs_path):
+        for filename in sorted(files):
+            if not filename.endswith((".md", ".txt")):
+                continue
+            path = os.path.join(root, filename)
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                yield from _split_markdown(f.read(), os.path.relpath(path, docs_path))
+
+
+def _split_markdown(text, source):
+    # One snippet per heading section, long sections split on paragraph boundaries
+    title = os.path.splitext(os.path.basename(source))[0].replace("-", " ").title()
+    for section in re.split(r"\n(?=#{1,3} )", text):
+        heading, _, body = section.partition("\n")
+        if heading.startswith("#"):
+            section_title = heading.lstrip("#").strip()
+        else:
+            section_title, body = title, section
+
+        buffer = []
+        size = 0
+        for paragraph in re.split(r"\n\s*\n", body):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            if buffer and size + len(paragraph) > SNIPPET_CHARS:
+                yield {"title": section_title, "text": " ".join(buffer), "source": source}
+                buffer, size = [], 0
+            buffer.append(paragraph[:SNIPPET_CHARS])
+            size += len(paragraph)
+        if buffer:
+            yield {"title": section_title, "text": " ".join(buffer), "source": source}
+
+
+def _iter_doctype_snippets():
+    for doctype in frappe.get_all("DocType", filters={"istable": 0}, fields=["name", "module", "description"]):
+        meta = frappe.get_meta(doctype.name)
+        fields = [
+            f"{df.label} ({df.fieldtype}{' ' + df.options if df.fieldtype == 'Link' else ''})"
+            for df in meta.fields
+            if df.label and df.fieldtype not in ("Section Break", "Column Break", "Tab Break", "HTML", "Button")
+        ][:MAX_DOCTYPE_FIELDS]
+        text = f"DocType in module {doctype.module}. {doctype.description or ''} Fields: {', '.join(fields)}"
+        yield {"title": doctype.name, "text": " ".join(text.split())[:SNIPPET_CHARS], "source": f"doctype:{doctype.name}"}
+
+
+def _write_vectors(snippets, batch_size=64):
+    import numpy as np
+    from litellm import embedding
+
+    path = get_index_path("vectors.npy")
+    vectors = None
+    for start in range(0, len(snippets), batch_size):
+        batch = [f"{s['title']}: {s['text']}" for s in snippets[start : start + batch_size]]
+        result = embedding(model=frappe.conf.get("ai_assistant_embedding_model"), input=batch)
+        rows = np.asarray([item["embedding"] for item in result.data], dtype="float32")
+        rows /= np.linalg.norm(rows, axis=1, keepdims=True).clip(min=1e-12)
+        if vectors is None:
+            vectors = np.lib.format.open_memmap(path + ".tmp", mode="w+", dtype="float32", shape=(len(snippets), rows.shape[1]))
+        vectors[start : start + len(rows)] = rows
+    vectors.flush()
+    del vectors
+    os.replace(path + ".tmp", path)
+
+
+def _open_vectors(count):
+    path = get_index_path("vectors.npy")
+    if not frappe.conf.get("ai_assistant_embedding_model") or not os.path.exists(path):
+        return None
+    try:
+        import numpy as np
+
+        vectors = np.load(path, mmap_mode="r")
+    except ImportError:
+        return None
+    return vectors if vectors.shape[0] == count else None
+
+
+def _rerank(query, candidates, vectors):
+    import numpy as np
+    from litellm import embedding
+
+    try:
+        result = embedding(model=frappe.conf.get("ai_assistant_embedding_model"), input=[query])
+    except Exception as e:
+        frappe.log_error(f"Embedding failed, using BM25 order: {e}", "AI Docs Index Error")
+        return candidates
+
+    query_vector = np.asarray(result.data[0]["embedding"], dtype="float32")
+    query_vector /= max(float(np.linalg.norm(query_vector)), 1e-12)
+    similarities = vectors[candidates] @ query_vector
+    # Blend: BM25 rank order breaks ties between near-identical dense scores
+    order = sorted(range(len(candidates)), key=lambda i: (-round(float(similarities[i]), 3), i))
+    return [candidates[i] for i in order]
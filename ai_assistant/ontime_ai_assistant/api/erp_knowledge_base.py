@@ -1,35 +1,52 @@
 import frappe
-from ai_assistant.ontime_ai_assistant.api.ai_service import get_ai_response
-
-def get_erp_explanation(query, user_roles, ai_provider_name, api_key):
-    # This function will leverage the LLM to explain ERP terms or processes.
-    # In a more advanced setup, this could involve RAG (Retrieval Augmented Generation)
-    # where relevant snippets from ERPNext documentation are retrieved and provided to the LLM.
-
-    # For now, we'll rely on the LLM's general knowledge, but prompt it to be ERPNext-specific.
-    prompt = f"Explain \"{query}\" in the context of ERPNext. Provide a concise and clear explanation, and if applicable, mention relevant DocTypes or modules. If it's a process, outline the steps in ERPNext."
-
-    # Add role-based context to the prompt if necessary
+from ai_assistant.ontime_ai_assistant.api.ai_service import get_ai_response, get_model_name, is_error_response, publish_stream
+from ai_assistant.ontime_ai_assistant.api.metrics import record_cache_lookup
+from ai_assistant.ontime_ai_assistant.api.prompt_templates import render, render_text, template_key
+from ai_assistant.ontime_ai_assistant.api.response_cache import get_cached_response, make_scope, set_cached_response
+from ai_assistant.ontime_ai_assistant.api.erp_docs_index import build_context, retrieve
+
+def get_role_perspective(user_roles):
+    # Role-based context added to knowledge prompts; also part of the response cache scope
     if "Sales User" in user_roles:
-        prompt = f"{prompt} (from a sales perspective)"
+        return "sales"
     elif "Accounts User" in user_roles:
-        prompt = f"{prompt} (from an accounting perspective)"
+        return "accounting"
+    return None
 
-    response = get_ai_response(prompt, "ERP Explanation", ai_provider_name, api_key)
-    return response
+def get_erp_explanation(query, user_roles, ai_provider_name, api_key, stream_id=None):
+    # This function will leverage the LLM to explain ERP terms or processes.
+    # Relevant snippets from the local ERPNext documentation index are added to the prompt (RAG)
+    # when the index has been built; otherwise the LLM's general knowledge is used.
+    return _get_knowledge_response("ERP Explanation", "erp_explanation", query, user_roles, ai_provider_name, api_key, stream_id)
 
 
-def get_erp_steps(query, user_roles, ai_provider_name, api_key):
+def get_erp_steps(query, user_roles, ai_provider_name, api_key, stream_id=None):
     # This function will leverage the LLM to provide steps for ERPNext processes.
-    prompt = f"Outline the steps to \"{query}\" in ERPNext. Be specific and clear."
-
-    # Add role-based context to the prompt if necessary
-    if "Sales User" in user_roles:
-        prompt = f"{prompt} (from a sales perspective)"
-    elif "Accounts User" in user_roles:
-        prompt = f"{prompt} (from an accounting perspective)"
-
-    response = get_ai_response(prompt, "ERP Steps", ai_provider_name, api_key)
+    return _get_knowledge_response("ERP Steps", "erp_steps", query, user_roles, ai_provider_name, api_key, stream_id)
+
+
+def _get_knowledge_response(query_type, template, query, user_roles, ai_provider_name, api_key, stream_id=None):
+    # Users ask the same few hundred questions, so answers are cached per provider, model, perspective
+    # and prompt template version
+    perspective = get_role_perspective(user_roles)
+    perspective_text = ""
+    if perspective:
+        article = "an" if perspective[0] in "aeiou" else "a"
+        perspective_text = render_text("knowledge_perspective", article=article, perspective=perspective)
+
+    scope = make_scope(query_type, ai_provider_name, get_model_name(ai_provider_name), perspective, template_key(template))
+    response = get_cached_response(scope, query)
+    record_cache_lookup(query_type, response is not None)
+    if response is not None:
+        if stream_id:
+            publish_stream(stream_id, delta=response, done=True)
+        return response
+
+    context = build_context(retrieve(query))
+    context_text = render_text("knowledge_context", context=context) if context else ""
+
+    messages = render(template, query=query, perspective=perspective_text, context=context_text)
+    response = get_ai_response(messages[-1]["content"], query_type, ai_provider_name, api_key, stream=bool(stream_id), stream_id=stream_id, messages=messages)
+    if not is_error_response(response):
+        set_cached_response(scope, query, response)
     return response
-
-
@@ -0,0 +1,154 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import frappe
+
+# Content-addressed cache for document analysis, under the site's private files.
+#
+# Files are identified by the SHA-256 of their bytes, so the same invoice uploaded twice (under any
+# name) shares one entry. Three things are stored, each as a small gzipped JSON file:
+#   pages   - extracted text / OCR output per (digest, extractor version)
+#   llm     - every chunk and reduce completion, keyed by provider, model and the exact prompt
+#   result  - the final analysis per (digest, extractor version, provider, model, instructions)
+# Re-analysing with a new prompt therefore skips extraction, and an identical upload with the same
+# prompt is answered from the result entry without starting a job.
+#
+# Hits refresh the file mtime; the cache is trimmed oldest-first to the size in site config
+# "ai_assistant_extraction_cache_mb" (default 512) hourly and whenever enough has been written.
+
+EXTRACTOR_VERSIONS = {
+    # Bump when an extractor's output changes so stale text is not reused
+    "PDF": "pdf-2",
+    "Word Document": "docx-1",
+    "Excel Spreadsheet": "xlsx-1",
+    "Image": "image-2",
+}
+DEFAULT_MAX_MB = 512
+# Trimming leaves room below the limit so it does not run again on the next write
+TRIM_TARGET = 0.9
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_lock = threading.Lock()
+_written_since_trim = {}
+
+
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_extraction_cache():
+    max_mb = frappe.utils.cint(frappe.conf.get("ai_assistant_extraction_cache_mb")) or DEFAULT_MAX_MB
+    return ExtractionCache(frappe.get_site_path("private", "ai_assistant", "extraction_cache"), max_mb * 1024 * 1024)
+
+
+def trim_extraction_cache():
+    # Scheduled hourly
+    get_extraction_cache().trim()
+
+
+class ExtractionCache:
+    # Plain file operations only, so chunk worker threads can use it without frappe.local
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def get_pages(self, digest, document_type):
+        pages = self._read("pages", _key(digest, EXTRACTOR_VERSIONS.get(document_type, "")))
+        return [tuple(page) for page in pages] if pages is not None else None
+
+    def set_pages(self, digest, document_type, pages):
+        self._write("pages", _key(digest, EXTRACTOR_VERSIONS.get(document_type, "")), [list(page) for page in pages])
+
+    def get_result(self, digest, document_type, provider, model, instructions):
+        return self._read("result", self._result_key(digest, document_type, provider, model, instructions))
+
+    def set_result(self, digest, document_type, provider, model, instructions, result):
+        self._write("result", self._result_key(digest, document_type, provider, model, instructions), result)
+
+    def cached_completion(self, complete, provider, model):
+        # Wraps complete(messages) so repeated chunk and reduce prompts are answered from disk
+        def cached(messages):
+            key = _key(provider, model, json.dumps(messages, sort_keys=True))
+            text = self._read("llm", key)
+            if text is None:
+                text = complete(messages)
+                self._write("llm", key, text)
+            return text
+
+        return cached
+
+    def trim(self):
+        entries = []
+        total = 0
+        for directory, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        with _lock:
+            _written_since_trim[self.root] = 0
+        if total <= self.max_bytes:
+            return total
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * TRIM_TARGET:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+    def _result_key(self, digest, document_type, provider, model, instructions):
+        return _key(digest, EXTRACTOR_VERSIONS.get(document_type, ""), provider, model, instructions)
+
+    def _path(self, kind, key):
+        return os.path.join(self.root, kind, key[:2], f"{key}.json.gz")
+
+    def _read(self, kind, key):
+        path = self._path(kind, key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                value = json.load(f)
+        except (FileNotFoundError, EOFError, OSError, ValueError):
+            return None
+        try:
+            # mtime doubles as last-access time for eviction
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def _write(self, kind, key, value):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+        with _lock:
+            written = _written_since_trim.get(self.root, 0) + os.path.getsize(path)
+            _written_since_trim[self.root] = written
+        if written > self.max_bytes * (1 - TRIM_TARGET):
+            self.trim()
+
+
+def _key(*parts):
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode()).hexdigest()
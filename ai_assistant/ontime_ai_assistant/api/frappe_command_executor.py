@@ -1,12 +1,31 @@
 import frappe
 import frappe.utils
+import hashlib
+import hmac
 import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from frappe.model import default_fields, no_value_fields, table_fields
+from frappe.utils.password import get_encryption_key
+from ai_assistant.ontime_ai_assistant.api.aggregation import run_aggregation
+from ai_assistant.ontime_ai_assistant.api.bulk_commands import BULK_ACTIONS, run_bulk_command
+from ai_assistant.ontime_ai_assistant.api.permission_cache import has_permission
+
+# Read results are projected onto a small per-DocType field set and paginated with a keyset
+# cursor on (creation, name), so "show me" queries never scan past skipped rows or ship whole
+# documents. The cursor is an opaque token carrying the query and the last key seen; the chat
+# client passes it back to fetch the next page. It is signed with the site's encryption key, so a
+# client can neither change the query nor read another DocType through it.
+
+DEFAULT_PAGE_LENGTH = 20
+MAX_PAGE_LENGTH = 500
+MAX_LIST_FIELDS = 8
+KEYSET_ORDER = "creation desc, name desc"
 
 def check_permission(doctype, permtype, user):
-    if not frappe.has_permission(doctype, permtype=permtype, user=user):
+    if not has_permission(doctype, permtype, user):
         frappe.throw(f"You do not have permission to {permtype} {doctype}")
 
-def execute_frappe_command(command_type, doctype_name, data=None, filters=None, user=None, fields=None, group_by=None, order_by=None, limit_start=0, limit_page_length=20):
+def execute_frappe_command(command_type, doctype_name, data=None, filters=None, user=None, fields=None, group_by=None, order_by=None, limit_start=0, limit_page_length=20, aggregate=None):
     if data is None:
         data = {}
     if filters is None:
@@ -24,14 +43,25 @@ def execute_frappe_command(command_type, doctype_name, data=None, filters=None,
             frappe.db.commit()
             return {"status": "success", "message": f"{doctype_name} {doc.name} created successfully.", "name": doc.name}
 
+        elif command_type in BULK_ACTIONS:
+            # data is a list of rows; one permission check, one commit, a result per row
+            return run_bulk_command(command_type, doctype_name, data, user)
+
+        elif command_type in ("read", "report") and aggregate:
+            # Counts, totals and top-N are computed by the database; only the grouped rows come back
+            check_permission(doctype_name, "read", user)
+            return run_aggregation(doctype_name, aggregate, filters)
+
         elif command_type == "read":
             check_permission(doctype_name, "read", user)
             if "name" in filters:
-                doc = frappe.get_doc(doctype_name, filters["name"])
-                return {"status": "success", "data": doc.as_dict()}
+                # Parent fields only; child tables are not loaded for a chat answer
+                records = frappe.get_list(doctype_name, filters={"name": filters["name"]}, fields=get_detail_fields(doctype_name), limit_page_length=1)
+                if not records:
+                    return {"status": "error", "message": f"{doctype_name} {filters['name']} not found."}
+                return {"status": "success", "data": records[0]}
             else:
-                records = frappe.get_list(doctype_name, filters=filters, fields=fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length)
-                return {"status": "success", "data": records}
+                return read_records(doctype_name, filters, fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length)
 
         elif command_type == "update":
             check_permission(doctype_name, "write", user)
@@ -50,19 +80,21 @@ def execute_frappe_command(command_type, doctype_name, data=None, filters=None,
                 frappe.throw("Name filter is required for delete operation.")
             frappe.delete_doc(doctype_name, filters["name"])
             frappe.db.commit()
-            return {"status": "success", "message": f"{doctype_name} {filters["name"]} deleted successfully."}
+            return {"status": "success", "message": f"{doctype_name} {filters['name']} deleted successfully."}
 
         elif command_type == "report":
             check_permission(doctype_name, "read", user)
             # This can be extended to call specific Frappe reports or generate aggregated data
-            records = frappe.get_list(doctype_name, filters=filters, fields=fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length)
-            
+            result = read_records(doctype_name, filters, fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=limit_page_length)
+            records = result["data"]
+
             # Basic summarization for reports
-            summary = f"Found {len(records)} records for {doctype_name}."
+            summary = f"Found {len(records)}{'+' if result.get('next_cursor') else ''} records for {doctype_name}."
             if records and group_by:
                 summary += f" Grouped by {group_by}."
-            
-            return {"status": "success", "data": records, "summary": summary}
+
+            result["summary"] = summary
+            return result
 
         elif command_type == "create_doctype":
             check_permission("DocType", "create", user)
@@ -103,4 +135,108 @@ def execute_frappe_command(command_type, doctype_name, data=None, filters=None,
         frappe.log_error(frappe.get_traceback(), "Frappe Command Execution Error")
         return {"status": "error", "message": f"An error occurred: {str(e)}"}
 
+def fetch_next_page(cursor, user=None):
+    # Next page of a read started by execute_frappe_command; see read_records
+    try:
+        state = _decode_cursor(cursor)
+        _validate_fields(state["doctype"], state["fields"], state["filters"])
+        check_permission(state["doctype"], "read", user)
+        return _keyset_page(state["doctype"], state["filters"], state["fields"], state["page_length"], state["after"])
+    except frappe.exceptions.PermissionError as e:
+        return {"status": "error", "message": str(e)}
+    except (ValueError, KeyError, TypeError, IndexError, frappe.DoesNotExistError):
+        return {"status": "error", "message": "Invalid or expired cursor."}
+
+def read_records(doctype, filters, fields, group_by=None, order_by=None, limit_start=0, limit_page_length=DEFAULT_PAGE_LENGTH):
+    page_length = min(frappe.utils.cint(limit_page_length) or DEFAULT_PAGE_LENGTH, MAX_PAGE_LENGTH)
+    if not fields or fields == ["*"]:
+        fields = get_list_fields(doctype)
+
+    # Aggregates, groupings and custom sort orders have no stable (creation, name) key to resume from
+    if group_by or order_by or limit_start or not all(_is_plain_field(field) for field in fields):
+        records = frappe.get_list(doctype, filters=filters, fields=fields, group_by=group_by, order_by=order_by, limit_start=limit_start, limit_page_length=page_length)
+        return {"status": "success", "data": records, "fields": fields}
+
+    return _keyset_page(doctype, filters, fields, page_length)
+
+def get_list_fields(doctype):
+    # name, title, status and list view columns: what a user reads in a list, not the whole row
+    meta = frappe.get_meta(doctype)
+    fields = ["name"]
+    candidates = [meta.title_field, "status" if meta.has_field("status") else None]
+    candidates += [df.fieldname for df in meta.fields if df.in_list_view]
+    for fieldname in candidates:
+        if len(fields) >= MAX_LIST_FIELDS:
+            break
+        df = meta.get_field(fieldname) if fieldname else None
+        if df and df.fieldtype not in no_value_fields and fieldname not in fields:
+            fields.append(fieldname)
+    return fields
+
+def get_detail_fields(doctype):
+    meta = frappe.get_meta(doctype)
+    return ["name", "owner", "creation", "modified", "docstatus"] + [
+        df.fieldname for df in meta.fields if df.fieldtype not in no_value_fields and df.fieldtype not in table_fields
+    ]
+
+def _keyset_page(doctype, filters, fields, page_length, after=None):
+    query_filters = _filter_list(doctype, filters)
+    or_filters = None
+    if after:
+        # (creation, name) < after, written so the creation index still bounds the scan
+        creation, name = after
+        query_filters.append([doctype, "creation", "<=", creation])
+        or_filters = [[doctype, "creation", "<", creation], [doctype, "name", "<", name]]
+
+    query_fields = list(fields) + [field for field in ("name", "creation") if field not in fields]
+    records = frappe.get_list(doctype, filters=query_filters, or_filters=or_filters, fields=query_fields, order_by=KEYSET_ORDER, limit_page_length=page_length + 1)
+
+    next_cursor = None
+    if len(records) > page_length:
+        records = records[:page_length]
+        last = records[-1]
+        next_cursor = _encode_cursor(doctype, filters, fields, page_length, (str(last["creation"]), last["name"]))
+    for record in records:
+        for field in query_fields[len(fields):]:
+            record.pop(field, None)
+
+    return {"status": "success", "data": records, "fields": fields, "next_cursor": next_cursor}
+
+def _filter_list(doctype, filters):
+    if isinstance(filters, dict):
+        return [
+            [doctype, field, *condition] if isinstance(condition, (list, tuple)) else [doctype, field, "=", condition]
+            for field, condition in filters.items()
+        ]
+    return [list(condition) for condition in filters or []]
+
+def _is_plain_field(field):
+    return field.replace("_", "").replace("`", "").replace(".", "").isalnum()
+
+def _validate_fields(doctype, fields, filters):
+    # Every field a cursor reads or filters on must be a plain column of its DocType
+    if isinstance(filters, dict):
+        filter_fields = [(doctype, field) for field in filters]
+    else:
+        filter_fields = [(condition[0], condition[1]) if len(condition) == 4 else (doctype, condition[0]) for condition in filters or []]
+    for field_doctype, field in [(doctype, field) for field in fields] + filter_fields:
+        if not isinstance(field, str) or not _is_plain_field(field):
+            raise ValueError(f"Invalid field: {field}")
+        if field not in default_fields and not frappe.get_meta(field_doctype).has_field(field):
+            raise ValueError(f"Unknown field: {field_doctype}.{field}")
+
+def _sign(payload):
+    return hmac.new(get_encryption_key().encode(), payload, hashlib.sha256).hexdigest()
+
+def _encode_cursor(doctype, filters, fields, page_length, after):
+    state = {"doctype": doctype, "filters": filters, "fields": fields, "page_length": page_length, "after": after}
+    payload = urlsafe_b64encode(json.dumps(state, default=str, separators=(",", ":")).encode())
+    return f"{payload.decode()}.{_sign(payload)}"
 
+def _decode_cursor(cursor):
+    payload, _, signature = cursor.rpartition(".")
+    if not payload or not hmac.compare_digest(signature, _sign(payload.encode())):
+        raise ValueError("Cursor signature does not match")
+    state = json.loads(urlsafe_b64decode(payload.encode()))
+    state["page_length"] = min(frappe.utils.cint(state["page_length"]) or DEFAULT_PAGE_LENGTH, MAX_PAGE_LENGTH)
+    return state
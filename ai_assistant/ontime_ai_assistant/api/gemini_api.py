@@ -1,16 +1,24 @@
 import frappe
 import requests
 
+from ai_assistant.ontime_ai_assistant.api.http_client import get_session, get_timeout
+from ai_assistant.ontime_ai_assistant.api.metrics import track_llm_call
+
 @frappe.whitelist()
 def get_gemini_response(prompt, api_key):
-    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent?key=" + api_key
-    headers = {"Content-Type": "application/json"}
+    url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+    headers = {"Content-Type": "application/json", "x-goog-api-key": api_key}
     data = {"contents": [{"parts": [{"text": prompt}]}]}
 
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()  # Raise an exception for HTTP errors
-        result = response.json()
+        with track_llm_call("Gemini", "gemini-pro") as call_metrics:
+            # Pooled keep-alive session, so repeated calls reuse the TLS connection
+            response = get_session("gemini").post(url, headers=headers, json=data, timeout=get_timeout())
+            response.raise_for_status()  # Raise an exception for HTTP errors
+            result = response.json()
+            usage = result.get("usageMetadata") or {}
+            call_metrics["prompt_tokens"] = usage.get("promptTokenCount")
+            call_metrics["completion_tokens"] = usage.get("candidatesTokenCount")
         return result["candidates"][0]["content"]["parts"][0]["text"]
     except requests.exceptions.RequestException as e:
         frappe.log_error(f"Gemini API request failed: {e}", "Gemini API Error")
@@ -0,0 +1,92 @@
+import os
+import threading
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+
+# Per-process HTTP clients for the AI providers. Connections are pooled and kept alive so repeated
+# calls to the same provider skip the TCP/TLS handshake. Clients are rebuilt after a fork, since
+# pooled sockets must never be shared between worker processes.
+#
+# Site config: ai_assistant_connect_timeout / ai_assistant_read_timeout (seconds)
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 120
+POOL_SIZE = 10
+KEEPALIVE_EXPIRY = 60
+
+_sessions = {}
+_litellm_pid = None
+_pid = None
+_lock = threading.Lock()
+
+
+def get_timeout():
+    # (connect, read) tuple as accepted by requests
+    return (
+        frappe.utils.flt(frappe.conf.get("ai_assistant_connect_timeout")) or DEFAULT_CONNECT_TIMEOUT,
+        frappe.utils.flt(frappe.conf.get("ai_assistant_read_timeout")) or DEFAULT_READ_TIMEOUT,
+    )
+
+
+def build_session(pool_size=POOL_SIZE):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session(provider):
+    global _pid
+    session = _sessions.get(provider)
+    if session is not None and _pid == os.getpid():
+        return session
+
+    with _lock:
+        if _pid != os.getpid():
+            _sessions.clear()
+            _pid = os.getpid()
+        if provider not in _sessions:
+            _sessions[provider] = build_session()
+        return _sessions[provider]
+
+
+def configure_litellm():
+    # litellm reuses one httpx client for OpenAI-compatible providers; HTTP/2 when the h2 package is installed
+    global _litellm_pid
+    if _litellm_pid == os.getpid():
+        return
+
+    with _lock:
+        if _litellm_pid == os.getpid():
+            return
+
+        import litellm
+
+        connect_timeout, read_timeout = get_timeout()
+        litellm.request_timeout = read_timeout
+        try:
+            import httpx
+        except ImportError:
+            _litellm_pid = os.getpid()
+            return
+
+        try:
+            import h2  # noqa: F401
+
+            http2 = True
+        except ImportError:
+            http2 = False
+
+        litellm.client_session = httpx.Client(
+            http2=http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=POOL_SIZE * 2,
+                max_keepalive_connections=POOL_SIZE,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        _litellm_pid = os.getpid()
@@ -0,0 +1,371 @@
+import re
+from collections import deque
+
+# Declarative intent table for the chat parser.
+#
+# Each intent lists trigger groups: the query must contain at least one phrase from every group
+# (English and Arabic phrases live side by side). Phrases match whole words only, so "top" does not
+# match inside "stop". Entity patterns are tried in order against the original query and fill `data`
+# or `filters`; `data` is dropped when no data entity is found. Values equal to TODAY are resolved by
+# the caller.
+#
+# Reporting intents carry an "aggregate" spec (see aggregation.plan_aggregation); modifiers can refine
+# it ("by customer", "per month") and "top N" in the query sets how many groups are returned. They need
+# an explicit report verb, so questions such as "what's the total cost of sales returns?" still go to
+# the LLM.
+#
+# Bulk intents name a "bulk_field": its entity is read as a list ("A, B and C") and expanded into
+# one row per value in `rows`. Items are separated by commas; "and" only separates the last item of a
+# comma-separated list, so "Research and Development, Tools" is two items.
+#
+# Scoring: the longest matched phrase of every group counts its length, a leading verb (first group
+# matched at the start of the query) earns ANCHOR_BONUS, and `priority` breaks remaining ties.
+
+TODAY = "__today__"
+ANCHOR_BONUS = 20
+
+_LIST_SEPARATOR = re.compile(r"\s*[,،]\s*")
+_LAST_ITEM_SEPARATOR = re.compile(r"\s+(?:and\s+|و)", re.IGNORECASE)
+_REPORT_VERBS = ["show", "list", "report", "give me", "اعرض", "أظهر", "تقرير"]
+_TOP_N = re.compile(r"\b(?:top|أعلى|أفضل)\s+(\d+)", re.IGNORECASE)
+_SALES_REPORT_MODIFIERS = [
+    {"phrases": ["average", "متوسط"], "aggregate": {"measure": "avg"}},
+    {"phrases": ["by customer", "per customer", "حسب العميل"], "aggregate": {"dimension": "customer"}},
+    {"phrases": ["by territory", "per territory", "حسب المنطقة"], "aggregate": {"dimension": "territory"}},
+    {"phrases": ["by customer group", "حسب مجموعة العملاء"], "aggregate": {"dimension": "customer_group"}},
+    {"phrases": ["daily", "per day", "يوميا"], "aggregate": {"time_bucket": "day"}},
+    {"phrases": ["monthly", "per month", "by month", "شهريا"], "aggregate": {"time_bucket": "month"}},
+    {"phrases": ["quarterly", "per quarter", "ربع سنوي"], "aggregate": {"time_bucket": "quarter"}},
+    {"phrases": ["yearly", "per year", "by year", "سنويا"], "aggregate": {"time_bucket": "year"}},
+]
+
+INTENTS = [
+    {
+        "name": "bulk_create_item_groups",
+        "command_type": "bulk_create",
+        "doctype": "Item Group",
+        "triggers": [["create", "أنشئ"], ["item groups", "مجموعات أصناف"]],
+        "data_entities": {"item_group_name": [r"(?:named|called|for|باسم|بأسماء)\s+(.+)"]},
+        "data": {"is_group": 1},
+        "bulk_field": "item_group_name",
+    },
+    {
+        "name": "create_item_group",
+        "command_type": "create",
+        "doctype": "Item Group",
+        "triggers": [["create", "أنشئ"], ["item group", "مجموعة أصناف"]],
+        "data_entities": {"item_group_name": [r"(?:for|باسم|بخصوص)\s+([\w\s]+)"]},
+        "data": {"is_group": 1},
+    },
+    {
+        "name": "create_customer",
+        "command_type": "create",
+        "doctype": "Customer",
+        "triggers": [["create", "أنشئ"], ["customer", "عميل"]],
+        "data_entities": {"customer_name": [r"named\s+([\w\s]+)", r"باسم\s+([\w\s]+)"]},
+        "ner_fallback": "customer_name",
+    },
+    {
+        "name": "create_sales_order",
+        "command_type": "create",
+        "doctype": "Sales Order",
+        "triggers": [["create", "أنشئ"], ["sales order", "أمر بيع"]],
+        "data_entities": {"customer": [r"for\s+([\w\s]+)", r"لـ\s+([\w\s]+)"]},
+        "data": {"naming_series": "SO-"},
+        "response_message": "Sales Order creation initiated. Please provide more details like items and quantities.",
+    },
+    {
+        "name": "read_overdue_invoices",
+        "command_type": "read",
+        "doctype": "Sales Invoice",
+        "triggers": [["show me", "اعرض لي"], ["overdue invoices", "فواتير متأخرة"]],
+        "filters": {"due_date": ["<=", TODAY], "outstanding_amount": [">", 0]},
+        "modifiers": [
+            {
+                "phrases": ["for april", "لشهر أبريل"],
+                "filters": {"posting_date": ["between", ["2025-04-01", "2025-04-30"]]},
+            },
+        ],
+    },
+    {
+        "name": "read_client_quotations",
+        "command_type": "read",
+        "doctype": "Quotation",
+        "triggers": [["show me", "اعرض لي"], ["quotations for client", "عروض أسعار للعميل"]],
+        "filter_entities": {"customer_name": [r"for client\s+([\w\s]+)", r"للعميل\s+([\w\s]+)"]},
+    },
+    {
+        "name": "read_sales_invoices_today",
+        "command_type": "read",
+        "doctype": "Sales Invoice",
+        "triggers": [["show me", "اعرض لي"], ["sales invoices today", "فواتير البيع اليوم"]],
+        "filters": {"posting_date": TODAY},
+        "aggregate": {"measure": "count"},
+    },
+    {
+        "name": "report_sales_totals",
+        "command_type": "report",
+        "doctype": "Sales Invoice",
+        "triggers": [_REPORT_VERBS, ["total", "sum of", "average", "إجمالي", "مجموع", "متوسط"], ["sales", "المبيعات"]],
+        "filters": {"docstatus": 1},
+        "aggregate": {"measure": "sum", "field": "grand_total"},
+        "modifiers": _SALES_REPORT_MODIFIERS,
+    },
+    {
+        "name": "report_top_customers",
+        "command_type": "report",
+        "doctype": "Sales Invoice",
+        "triggers": [_REPORT_VERBS, ["top", "best", "أفضل", "أعلى"], ["customers", "العملاء"]],
+        "filters": {"docstatus": 1},
+        "aggregate": {"measure": "sum", "field": "grand_total", "dimension": "customer"},
+        "modifiers": _SALES_REPORT_MODIFIERS,
+    },
+    {
+        "name": "analyze_document",
+        "command_type": "analyze_document",
+        "triggers": [["analyze", "تحليل"], ["excel", "pdf", "word", "image"]],
+        "response_message": "Please upload the file for analysis. File analysis functionality is under development.",
+    },
+    {
+        "name": "upload_document",
+        "command_type": "upload_document",
+        "triggers": [["upload", "رفع"], ["pdf", "word", "excel", "image"]],
+        "response_message": "Please upload the file. File upload functionality is under development.",
+    },
+    {
+        "name": "navigate_customer_list",
+        "command_type": "navigate",
+        "triggers": [["go to", "افتح"], ["customer list", "قائمة العملاء"]],
+        "response_message": {"status": "navigate", "path": "/app/customer", "message": "Opening Customer List."},
+    },
+    {
+        "name": "navigate_item_group_settings",
+        "command_type": "navigate",
+        "triggers": [["go to", "افتح"], ["item group settings", "إعدادات مجموعة الأصناف"]],
+        "response_message": {"status": "navigate", "path": "/app/item-group", "message": "Opening Item Group settings."},
+    },
+    {
+        "name": "explain_term",
+        "command_type": "what is",
+        "triggers": [["what is", "ما هو", "define", "ما معنى"]],
+    },
+    {
+        "name": "explain_steps",
+        "command_type": "how to",
+        "triggers": [["how to", "steps for", "كيف", "خطوات"]],
+    },
+    {
+        "name": "generate_script",
+        "command_type": "generate_script",
+        "triggers": [["generate script", "إنشاء سكريبت"]],
+        "script_type": "Python Script",
+        "modifiers": [
+            {"phrases": ["client script", "سكريبت عميل"], "script_type": "Client Script"},
+            {"phrases": ["server script", "سكريبت خادم"], "script_type": "Server Script"},
+        ],
+    },
+]
+
+
+class AhoCorasick:
+    # Multi-pattern substring matcher: one pass over the text reports every phrase occurrence
+
+    def __init__(self, phrases):
+        self.phrases = list(phrases)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for phrase_id, phrase in enumerate(self.phrases):
+            node = 0
+            for char in phrase:
+                nxt = self._goto[node].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append(phrase_id)
+
+        # Breadth-first pass so every failure link points at an already finished, shallower node
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(char, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def iter_matches(self, text):
+        # Yields (start_index, phrase_id) for every occurrence, overlapping ones included
+        goto, fail, out, phrases = self._goto, self._fail, self._out, self.phrases
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for phrase_id in out[node]:
+                yield index - len(phrases[phrase_id]) + 1, phrase_id
+
+
+class IntentRouter:
+    def __init__(self, intents):
+        self.intents = intents
+        phrase_ids = {}
+        # phrase id -> list of (intent_index, group_index); negative group indexes mark modifier phrases
+        self._phrase_targets = []
+
+        def register(phrase, target):
+            phrase = phrase.lower()
+            if phrase not in phrase_ids:
+                phrase_ids[phrase] = len(self._phrase_targets)
+                self._phrase_targets.append([])
+            self._phrase_targets[phrase_ids[phrase]].append(target)
+
+        self._compiled = []
+        for intent_index, intent in enumerate(intents):
+            for group_index, group in enumerate(intent["triggers"]):
+                for phrase in group:
+                    register(phrase, (intent_index, group_index))
+            for modifier_index, modifier in enumerate(intent.get("modifiers", [])):
+                for phrase in modifier["phrases"]:
+                    register(phrase, (intent_index, -1 - modifier_index))
+            self._compiled.append({
+                "data_entities": _compile_entities(intent.get("data_entities")),
+                "filter_entities": _compile_entities(intent.get("filter_entities")),
+            })
+
+        self._matcher = AhoCorasick(sorted(phrase_ids, key=phrase_ids.get))
+
+    def route(self, query):
+        lower_query = query.lower()
+        hits = {}
+        for start, phrase_id in self._matcher.iter_matches(lower_query):
+            length = len(self._matcher.phrases[phrase_id])
+            if not _on_word_boundaries(lower_query, start, start + length):
+                continue
+            for intent_index, group_index in self._phrase_targets[phrase_id]:
+                groups = hits.setdefault(intent_index, {})
+                best = groups.get(group_index)
+                if best is None or length > best[1]:
+                    groups[group_index] = (start, length)
+
+        best_match = None
+        for intent_index, groups in hits.items():
+            intent = self.intents[intent_index]
+            if any(group_index not in groups for group_index in range(len(intent["triggers"]))):
+                continue
+            score = sum(length for group_index, (_, length) in groups.items() if group_index >= 0)
+            if groups[0][0] == 0:
+                score += ANCHOR_BONUS
+            score += intent.get("priority", 0)
+            if best_match is None or score > best_match[0] or (score == best_match[0] and intent_index < best_match[1]):
+                best_match = (score, intent_index, groups)
+
+        if best_match is None:
+            return None
+        score, intent_index, groups = best_match
+        return self._build_result(query, lower_query, intent_index, groups, score)
+
+    def _build_result(self, query, lower_query, intent_index, groups, score):
+        intent = self.intents[intent_index]
+        compiled = self._compiled[intent_index]
+        result = {
+            "name": intent["name"],
+            "command_type": intent["command_type"],
+            "doctype": intent.get("doctype"),
+            "score": score,
+            "data": dict(intent.get("data", {})),
+            "filters": dict(intent.get("filters", {})),
+            "fields": list(intent.get("fields", ["*"])),
+            "aggregate": dict(intent["aggregate"]) if "aggregate" in intent else None,
+            "rows": None,
+            "response_message": intent.get("response_message"),
+            "script_type": intent.get("script_type"),
+            "ner_fallback": intent.get("ner_fallback"),
+            "entities": {},
+        }
+
+        for group_index in groups:
+            if group_index < 0:
+                modifier = intent["modifiers"][-1 - group_index]
+                result["filters"].update(modifier.get("filters", {}))
+                if result["aggregate"] is not None:
+                    result["aggregate"].update(modifier.get("aggregate", {}))
+                if "script_type" in modifier:
+                    result["script_type"] = modifier["script_type"]
+
+        for target, entities in (("data", compiled["data_entities"]), ("filters", compiled["filter_entities"])):
+            for field, patterns in entities.items():
+                value = _search(patterns, query)
+                if value:
+                    result["entities"][field] = value
+                    result[target][field] = value.title()
+
+        if result["aggregate"] is not None:
+            top = _TOP_N.search(query)
+            if top:
+                result["aggregate"]["top"] = int(top.group(1))
+
+        # Create payloads are only sent once the record name was found in the query
+        if compiled["data_entities"] and not any(field in result["entities"] for field in compiled["data_entities"]):
+            result["data"] = {}
+
+        bulk_field = intent.get("bulk_field")
+        if bulk_field and bulk_field in result["entities"]:
+            values = [value.strip(" .").title() for value in _split_list(result["entities"][bulk_field])]
+            result["rows"] = [{**result["data"], bulk_field: value} for value in values if value]
+
+        # Query text with the leading trigger phrase removed, e.g. the term for "what is ..."
+        start, length = groups[0]
+        source = query if len(query) == len(lower_query) else lower_query
+        result["remainder"] = (source[:start] + source[start + length:]).strip()
+        return result
+
+
+def _split_list(text):
+    items = _LIST_SEPARATOR.split(text)
+    if len(items) > 1:
+        # "A, B and C": the conjunction before the last item separates it as well
+        items[-1:] = _LAST_ITEM_SEPARATOR.split(items[-1], maxsplit=1)
+    return items
+
+
+def _on_word_boundaries(text, start, end):
+    # The characters around a match must not continue a word
+    return (start == 0 or not _is_word_char(text[start - 1])) and (end == len(text) or not _is_word_char(text[end]))
+
+
+def _is_word_char(char):
+    return char.isalnum() or char == "_"
+
+
+def _compile_entities(entities):
+    return {field: [re.compile(pattern, re.IGNORECASE) for pattern in patterns] for field, patterns in (entities or {}).items()}
+
+
+def _search(patterns, query):
+    for pattern in patterns:
+        match = pattern.search(query)
+        if match:
+            return match.group(1).strip()
+    return None
+
+
+_router = None
+
+
+def get_router():
+    global _router
+    if _router is None:
+        _router = IntentRouter(INTENTS)
+    return _router
+
+
+def route(query):
+    return get_router().route(query)
@@ -0,0 +1,77 @@
+import frappe
+
+# Job state shared between web and RQ workers, kept in the site cache (Redis) with a TTL.
+# Owners are notified over realtime when a job finishes so clients do not have to poll.
+
+JOB_KEY = "ai_assistant:job"
+JOB_TTL = 60 * 60
+JOB_EVENT = "ai_assistant_job"
+PROGRESS_EVENT = "ai_assistant_job_progress"
+
+FINAL_STATUSES = ("Completed", "Failed")
+
+
+def create_job(job_id, kind, **fields):
+    job = {
+        "job_id": job_id,
+        "kind": kind,
+        "status": "Queued",
+        "user": frappe.session.user,
+        "created": frappe.utils.now(),
+        "result": None,
+        "error": None,
+    }
+    job.update(fields)
+    _save(job)
+    return job
+
+
+def update_job(job_id, **fields):
+    job = get_job(job_id)
+    if not job:
+        return None
+    job.update(fields)
+    _save(job)
+    return job
+
+
+def set_job_progress(job_id, progress, **fields):
+    # progress is a percentage; callers report at coarse steps (per page range, per chunk)
+    job = update_job(job_id, status="Running", progress=progress, **fields)
+    if job:
+        frappe.publish_realtime(
+            PROGRESS_EVENT,
+            {"job_id": job_id, "kind": job["kind"], "progress": progress, "stage": job.get("stage")},
+            user=job["user"],
+        )
+    return job
+
+
+def finish_job(job_id, status, result=None, error=None):
+    fields = {"status": status, "result": result, "error": error, "finished": frappe.utils.now()}
+    if status == "Completed":
+        fields["progress"] = 100
+    job = update_job(job_id, **fields)
+    if job:
+        frappe.publish_realtime(
+            JOB_EVENT,
+            {"job_id": job_id, "kind": job["kind"], "status": status, "result": result, "error": error},
+            user=job["user"],
+        )
+    return job
+
+
+def get_job(job_id):
+    return frappe.cache().get_value(f"{JOB_KEY}:{job_id}")
+
+
+def get_job_for_user(job_id):
+    # Jobs are private to the user who started them
+    job = get_job(job_id)
+    if job and job["user"] != frappe.session.user and frappe.session.user != "Administrator":
+        return None
+    return job
+
+
+def _save(job):
+    frappe.cache().set_value(f"{JOB_KEY}:{job['job_id']}", job, expires_in_sec=JOB_TTL)
@@ -0,0 +1,303 @@
+import hmac
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import frappe
+
+# Token, latency and cache metrics for every LLM call.
+#
+# Calls are recorded into per-process histograms and counters (a dict update under a lock), which
+# are added to a Redis hash at most every FLUSH_INTERVAL seconds from the after_request / after_job
+# hooks, so all workers of a site aggregate into one set of series. The series are exposed as
+# Prometheus text at /api/method/ai_assistant.ontime_ai_assistant.api.metrics.prometheus (System
+# Manager, or "Authorization: Bearer <ai_assistant_metrics_token>" from site config) and summarised on
+# the "AI Metrics" desk page.
+#
+# Labels are provider, model and intent (the query type). Per-user cost is deliberately not a label,
+# since it would create a series per user; it is available from the AI Query log.
+#
+# Recording functions take the site explicitly when called from worker threads without frappe.local.
+
+METRICS_KEY = "ai_assistant:metrics"
+FLUSH_INTERVAL = 15
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536)
+HISTOGRAMS = {
+    "ai_llm_latency_ms": LATENCY_BUCKETS_MS,
+    "ai_llm_time_to_first_token_ms": LATENCY_BUCKETS_MS,
+    "ai_llm_prompt_tokens": TOKEN_BUCKETS,
+    "ai_llm_completion_tokens": TOKEN_BUCKETS,
+    "ai_prompt_template_tokens": TOKEN_BUCKETS,
+}
+HELP = {
+    "ai_llm_latency_ms": "Total latency of LLM calls in milliseconds",
+    "ai_llm_time_to_first_token_ms": "Time to the first streamed token in milliseconds",
+    "ai_llm_prompt_tokens": "Prompt tokens per LLM call",
+    "ai_llm_completion_tokens": "Completion tokens per LLM call",
+    "ai_llm_requests_total": "LLM calls",
+    "ai_llm_errors_total": "Failed LLM calls",
+    "ai_llm_coalesced_total": "Requests answered by an identical LLM call already in flight",
+    "ai_cache_requests_total": "Answer cache lookups by result",
+    "ai_prompt_template_tokens": "Estimated prompt tokens per rendered template",
+}
+
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = {}
+
+
+def observe(name, value, site=None, **labels):
+    buckets = HISTOGRAMS[name]
+    key = _series_key(site, name, labels)
+    with _lock:
+        values = _pending_series(key).setdefault("histogram", [0] * (len(buckets) + 1) + [0.0, 0])
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+
+def inc(name, value=1, site=None, **labels):
+    key = _series_key(site, name, labels)
+    with _lock:
+        series = _pending_series(key)
+        series["counter"] = series.get("counter", 0) + value
+
+
+def record_llm_call(provider, model, latency_ms, prompt_tokens=None, completion_tokens=None, ttft_ms=None, error=False, intent=None, site=None):
+    labels = {"provider": provider or "", "model": model or "", "intent": intent or ""}
+    inc("ai_llm_requests_total", site=site, **labels)
+    if error:
+        inc("ai_llm_errors_total", site=site, **labels)
+    observe("ai_llm_latency_ms", latency_ms, site=site, **labels)
+    if ttft_ms is not None:
+        observe("ai_llm_time_to_first_token_ms", ttft_ms, site=site, **labels)
+    if prompt_tokens:
+        observe("ai_llm_prompt_tokens", prompt_tokens, site=site, **labels)
+    if completion_tokens:
+        observe("ai_llm_completion_tokens", completion_tokens, site=site, **labels)
+
+
+@contextmanager
+def track_llm_call(provider, model, intent=None, site=None):
+    # Times the block; the caller fills call["prompt_tokens"], ["completion_tokens"], ["ttft_ms"]
+    call = {}
+    start = time.monotonic()
+    try:
+        yield call
+    except Exception:
+        record_llm_call(provider, model, (time.monotonic() - start) * 1000, error=True, intent=intent, site=site)
+        raise
+    record_llm_call(
+        provider,
+        model,
+        (time.monotonic() - start) * 1000,
+        prompt_tokens=call.get("prompt_tokens"),
+        completion_tokens=call.get("completion_tokens"),
+        ttft_ms=call.get("ttft_ms"),
+        error=call.get("error", False),
+        intent=intent,
+        site=site,
+    )
+
+
+def record_cache_lookup(kind, hit):
+    inc("ai_cache_requests_total", kind=kind, result="hit" if hit else "miss")
+
+
+def current_site():
+    return getattr(frappe.local, "site", None)
+
+
+def flush_if_due():
+    # after_request / after_job hook
+    site = current_site()
+    if not site or not _pending.get(site):
+        return
+    now = time.monotonic()
+    if now - _last_flush.get(site, 0) < FLUSH_INTERVAL:
+        return
+    _last_flush[site] = now
+    flush()
+
+
+def flush():
+    site = current_site()
+    with _lock:
+        pending = _pending.pop(site, None)
+    if not pending:
+        return
+
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(METRICS_KEY)
+        pipe = cache.pipeline()
+        for (name, label_text), series in pending.items():
+            prefix = f"{name}\x1f{label_text}\x1f"
+            if "counter" in series:
+                pipe.hincrbyfloat(key, prefix + "total", series["counter"])
+            if "histogram" in series:
+                values = series["histogram"]
+                for index, count in enumerate(values[:-2]):
+                    if count:
+                        pipe.hincrbyfloat(key, prefix + _bucket_label(name, index), count)
+                pipe.hincrbyfloat(key, prefix + "sum", values[-2])
+                pipe.hincrbyfloat(key, prefix + "count", values[-1])
+        pipe.execute()
+    except Exception as e:
+        frappe.log_error(f"Could not flush AI metrics: {e}", "AI Metrics Error")
+
+
+def get_series():
+    # {(name, label_text): {"total" | "sum" | "count" | bucket upper bound: value}}
+    cache = frappe.cache()
+    # Raw read: the values are plain numbers written by HINCRBYFLOAT, not pickled cache values
+    raw = cache.pipeline().hgetall(cache.make_key(METRICS_KEY)).execute()[0]
+    series = {}
+    for field, value in raw.items():
+        field = field.decode() if isinstance(field, bytes) else field
+        name, label_text, part = field.split("\x1f")
+        series.setdefault((name, label_text), {})[part] = float(value)
+    return series
+
+
+def render_prometheus():
+    lines = []
+    seen = set()
+    for (name, label_text), values in sorted(get_series().items()):
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {name} {'histogram' if name in HISTOGRAMS else 'counter'}")
+
+        if name not in HISTOGRAMS:
+            lines.append(f"{name}{{{label_text}}} {_format(values.get('total', 0))}")
+            continue
+
+        separator = "," if label_text else ""
+        cumulative = 0
+        for upper in [*map(str, HISTOGRAMS[name]), "+Inf"]:
+            cumulative += values.get(upper, 0)
+            lines.append(f'{name}_bucket{{{label_text}{separator}le="{upper}"}} {_format(cumulative)}')
+        lines.append(f"{name}_sum{{{label_text}}} {_format(values.get('sum', 0))}")
+        lines.append(f"{name}_count{{{label_text}}} {_format(values.get('count', 0))}")
+    return "\n".join(lines) + "\n"
+
+
+@frappe.whitelist(allow_guest=True)
+def prometheus():
+    _check_scrape_access()
+    flush()
+    from werkzeug.wrappers import Response
+
+    return Response(render_prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@frappe.whitelist()
+def get_metrics_summary():
+    # One row per provider / model / intent for the desk page
+    frappe.only_for("System Manager")
+    flush()
+    rows = {}
+    cache_rows = {}
+    for (name, label_text), values in get_series().items():
+        labels = parse_labels(label_text)
+        if name == "ai_cache_requests_total":
+            row = cache_rows.setdefault(labels.get("kind", ""), {"kind": labels.get("kind", ""), "hits": 0, "misses": 0})
+            row["hits" if labels.get("result") == "hit" else "misses"] += int(values.get("total", 0))
+            continue
+        if not name.startswith("ai_llm_"):
+            # Prompt template series are summarised by prompt_templates.get_template_report
+            continue
+
+        row = rows.setdefault(
+            (labels.get("provider"), labels.get("model"), labels.get("intent")),
+            {"provider": labels.get("provider"), "model": labels.get("model"), "intent": labels.get("intent"), "requests": 0, "errors": 0, "coalesced": 0},
+        )
+        if name == "ai_llm_requests_total":
+            row["requests"] = int(values.get("total", 0))
+        elif name == "ai_llm_errors_total":
+            row["errors"] = int(values.get("total", 0))
+        elif name == "ai_llm_coalesced_total":
+            row["coalesced"] = int(values.get("total", 0))
+        elif name == "ai_llm_latency_ms":
+            row["latency_avg_ms"] = _average(values)
+            row["latency_p50_ms"] = _quantile(name, values, 0.5)
+            row["latency_p95_ms"] = _quantile(name, values, 0.95)
+        elif name == "ai_llm_time_to_first_token_ms":
+            row["ttft_avg_ms"] = _average(values)
+        elif name == "ai_llm_prompt_tokens":
+            row["prompt_tokens"] = int(values.get("sum", 0))
+        elif name == "ai_llm_completion_tokens":
+            row["completion_tokens"] = int(values.get("sum", 0))
+
+    return {
+        "calls": sorted(rows.values(), key=lambda row: -row["requests"]),
+        "cache": sorted(cache_rows.values(), key=lambda row: row["kind"]),
+    }
+
+
+@frappe.whitelist()
+def reset_metrics():
+    frappe.only_for("System Manager")
+    with _lock:
+        _pending.pop(current_site(), None)
+    frappe.cache().delete_value(METRICS_KEY)
+
+
+def _series_key(site, name, labels):
+    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+    return site or current_site(), name, label_text
+
+
+def _pending_series(key):
+    # Caller holds _lock for the lookup and the update, so flush() cannot pop the site's dict in between
+    site, name, label_text = key
+    return _pending.setdefault(site, {}).setdefault((name, label_text), {})
+
+
+def _bucket_label(name, index):
+    buckets = HISTOGRAMS[name]
+    return str(buckets[index]) if index < len(buckets) else "+Inf"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def parse_labels(label_text):
+    return {key: re.sub(r"\\(.)", r"\1", value) for key, value in _LABEL.findall(label_text)}
+
+
+def _average(values):
+    return round(values["sum"] / values["count"], 1) if values.get("count") else None
+
+
+def _quantile(name, values, q):
+    # Upper bound of the bucket containing the quantile, as Prometheus' histogram_quantile would bound it
+    total = values.get("count", 0)
+    if not total:
+        return None
+    cumulative = 0
+    for upper in HISTOGRAMS[name]:
+        cumulative += values.get(str(upper), 0)
+        if cumulative >= q * total:
+            return upper
+    return None
+
+
+def _format(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _check_scrape_access():
+    token = frappe.conf.get("ai_assistant_metrics_token")
+    header = frappe.get_request_header("Authorization") or ""
+    if token and header.startswith("Bearer ") and hmac.compare_digest(header[7:].strip(), token):
+        return
+    frappe.only_for("System Manager")
@@ -0,0 +1,69 @@
+import threading
+
+import frappe
+
+# spaCy pipelines are loaded lazily, once per process, the first time a language is needed.
+# Components the chat parser never reads are excluded at load time so they are neither
+# deserialized nor kept in memory. The chat parser only needs tokens and named entities.
+MODEL_SPECS = {
+    "en": {
+        "model": "en_core_web_sm",
+        "exclude": ["parser", "tagger", "attribute_ruler", "lemmatizer", "senter", "textcat"],
+    },
+    "ar": {
+        "model": "ar_core_news_sm",
+        "exclude": ["parser", "tagger", "morphologizer", "attribute_ruler", "lemmatizer", "senter", "textcat"],
+    },
+}
+
+_pipelines = {}
+_missing = set()
+_lock = threading.Lock()
+
+
+def detect_language(text):
+    # Simple heuristic: any character in the Arabic block means the query is Arabic
+    return "ar" if any("\u0600" <= char <= "\u06FF" for char in text) else "en"
+
+
+def get_pipeline(lang):
+    # Returns the loaded pipeline for `lang`, or None when spaCy or the model is unavailable
+    nlp = _pipelines.get(lang)
+    if nlp is not None or lang in _missing:
+        return nlp
+
+    with _lock:
+        if lang in _pipelines or lang in _missing:
+            return _pipelines.get(lang)
+
+        spec = MODEL_SPECS.get(lang)
+        if not spec:
+            _missing.add(lang)
+            return None
+
+        try:
+            import spacy
+
+            _pipelines[lang] = spacy.load(spec["model"], exclude=spec["exclude"])
+        except (ImportError, OSError):
+            _missing.add(lang)
+            frappe.log_error(
+                f"spaCy model {spec['model']} not found. Please run: python3 -m spacy download {spec['model']}",
+                "NLP Model Error",
+            )
+        return _pipelines.get(lang)
+
+
+def extract_entities(text, lang, labels=("PERSON", "ORG", "GPE")):
+    nlp = get_pipeline(lang)
+    if nlp is None:
+        return []
+    return [ent.text for ent in nlp(text).ents if ent.label_ in labels]
+
+
+def preload():
+    # Hooked into before_request so web workers warm the models once, on their first request.
+    # Languages are opt-in via site config, e.g. "ai_assistant_preload_nlp_models": ["en", "ar"]
+    for lang in frappe.conf.get("ai_assistant_preload_nlp_models") or []:
+        if lang not in _pipelines and lang not in _missing:
+            get_pipeline(lang)
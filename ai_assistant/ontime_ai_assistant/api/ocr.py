@@ -0,0 +1,242 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# OCR for uploaded images and scanned PDF pages.
+#
+# Each image is normalised first: EXIF rotation applied, grayscale, downsampled so the longest side
+# is at most MAX_SIDE (phone photos are often 4000px+, which only slows tesseract down) and
+# binarised with an Otsu threshold. The script is then detected with tesseract's OSD so only the
+# language that is actually present is recognised ("eng" or "ara"; both when detection is unsure).
+#
+# With tesserocr installed, tesseract runs in-process: one API object per language lives for the
+# whole worker, and the page is split into text regions (bands separated by blank rows) that are each
+# detected and recognised on their own, so mixed Arabic/English pages get the right model per block.
+# Without it, pytesseract starts a subprocess per call, so detection and recognition are done once per
+# page to keep the number of processes low.
+#
+# Multi-page inputs (TIFF frames, scanned PDFs via pdf_extraction) are spread over a process pool.
+
+MAX_SIDE = 2500
+RENDER_DPI = 300
+DEFAULT_LANGS = "eng+ara"
+SCRIPT_LANGS = {"Latin": "eng", "Arabic": "ara"}
+MIN_SCRIPT_CONFIDENCE = 1.0
+# Regions shorter than this are too small for script detection and reuse the previous region's language
+MIN_DETECT_HEIGHT = 60
+MAX_REGIONS = 24
+# Rows lighter than this mean (0 = black, 255 = white) count as blank
+BLANK_ROW = 250
+
+_engine = None
+_engine_pid = None
+_engine_lock = threading.Lock()
+
+
+def ocr_image_file(file_path, workers=None):
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        frame_count = getattr(image, "n_frames", 1)
+        if frame_count == 1:
+            return ocr_image(image)
+
+    from ai_assistant.ontime_ai_assistant.api.pdf_extraction import get_worker_count
+
+    workers = workers or get_worker_count()
+    if workers <= 1:
+        return "\n\n".join(_ocr_frame(file_path, index) for index in range(frame_count))
+    with ProcessPoolExecutor(max_workers=min(workers, frame_count)) as pool:
+        return "\n\n".join(pool.map(_ocr_frame, [file_path] * frame_count, range(frame_count)))
+
+
+def ocr_image(image):
+    image = preprocess(image)
+    engine = get_engine()
+    if not engine.per_region:
+        return engine.text(image, engine.language(image)).strip()
+
+    parts = []
+    lang = None
+    width = image.size[0]
+    for top, bottom in text_regions(image):
+        region = image.crop((0, top, width, bottom))
+        if bottom - top >= MIN_DETECT_HEIGHT or lang is None:
+            lang = engine.language(region)
+        text = engine.text(region, lang).strip()
+        if text:
+            parts.append(text)
+    return "\n".join(parts)
+
+
+def ocr_pdf_pages(file_path, page_numbers):
+    # Renders and OCRs the given 1-based pages; runs inside pdf_extraction's worker processes
+    return {page_number: ocr_image(image) for page_number, image in render_pdf_pages(file_path, page_numbers)}
+
+
+def render_pdf_pages(file_path, page_numbers):
+    try:
+        import fitz
+    except ImportError:
+        fitz = None
+
+    if fitz:
+        from PIL import Image
+
+        with fitz.open(file_path) as pdf:
+            for page_number in page_numbers:
+                pixmap = pdf.load_page(page_number - 1).get_pixmap(dpi=RENDER_DPI, colorspace=fitz.csGRAY)
+                yield page_number, Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+        return
+
+    import pdfplumber
+
+    with pdfplumber.open(file_path) as pdf:
+        for page_number in page_numbers:
+            page = pdf.pages[page_number - 1]
+            yield page_number, page.to_image(resolution=RENDER_DPI).original
+            page.flush_cache()
+
+
+def preprocess(image):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(image).convert("L")
+    width, height = image.size
+    if max(width, height) > MAX_SIDE:
+        scale = MAX_SIDE / max(width, height)
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    image = ImageOps.autocontrast(image)
+    threshold = otsu_threshold(image.histogram())
+    return image.point([0 if value <= threshold else 255 for value in range(256)])
+
+
+def otsu_threshold(histogram):
+    total = sum(histogram)
+    weighted_total = sum(value * count for value, count in enumerate(histogram))
+    background = weighted_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for value, count in enumerate(histogram):
+        background += count
+        if not background:
+            continue
+        foreground = total - background
+        if not foreground:
+            break
+        weighted_background += value * count
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = value, variance
+    return best_threshold
+
+
+def text_regions(image):
+    # (top, bottom) bands of text, split where a run of blank rows is taller than a typical line gap
+    from PIL import Image
+
+    height = image.size[1]
+    row_means = list(image.resize((1, height), Image.BOX).getdata())
+    min_gap = max(12, height // 100)
+
+    regions = []
+    start = last_ink = None
+    for row, mean in enumerate(row_means):
+        if mean >= BLANK_ROW:
+            continue
+        if start is None:
+            start = row
+        elif row - last_ink > min_gap:
+            regions.append((start, last_ink + 1))
+            start = row
+        last_ink = row
+    if start is not None:
+        regions.append((start, last_ink + 1))
+
+    # Very fragmented pages (tables, forms) are merged back into fewer, larger regions
+    while len(regions) > MAX_REGIONS:
+        regions = [
+            (regions[i][0], regions[min(i + 1, len(regions) - 1)][1]) for i in range(0, len(regions), 2)
+        ]
+
+    pad = min_gap // 2
+    return [(max(0, top - pad), min(height, bottom + pad)) for top, bottom in regions]
+
+
+def get_engine():
+    # One engine per process; tesseract handles are not shareable across a fork
+    global _engine, _engine_pid
+    if _engine_pid != os.getpid():
+        with _engine_lock:
+            if _engine_pid != os.getpid():
+                try:
+                    _engine = _TesserocrEngine()
+                except ImportError:
+                    _engine = _PytesseractEngine()
+                _engine_pid = os.getpid()
+    return _engine
+
+
+class _TesserocrEngine:
+    per_region = True
+
+    def __init__(self):
+        import tesserocr
+
+        self.tesserocr = tesserocr
+        self.apis = {}
+        self.lock = threading.Lock()
+
+    def _api(self, lang, psm):
+        key = (lang, psm)
+        if key not in self.apis:
+            self.apis[key] = self.tesserocr.PyTessBaseAPI(lang=lang, psm=psm)
+        return self.apis[key]
+
+    def language(self, image):
+        with self.lock:
+            api = self._api("osd", self.tesserocr.PSM.OSD_ONLY)
+            api.SetImage(image)
+            result = api.DetectOrientationScript()
+        return _script_lang(result and result.get("script_name"), result and result.get("script_conf"))
+
+    def text(self, image, lang):
+        with self.lock:
+            api = self._api(lang, self.tesserocr.PSM.AUTO)
+            api.SetImage(image)
+            return api.GetUTF8Text()
+
+
+class _PytesseractEngine:
+    per_region = False
+
+    def __init__(self):
+        import pytesseract
+
+        self.pytesseract = pytesseract
+
+    def language(self, image):
+        try:
+            result = self.pytesseract.image_to_osd(image, output_type=self.pytesseract.Output.DICT)
+        except self.pytesseract.TesseractError:
+            # Too little text for OSD
+            return DEFAULT_LANGS
+        return _script_lang(result.get("script"), result.get("script_conf"))
+
+    def text(self, image, lang):
+        return self.pytesseract.image_to_string(image, lang=lang)
+
+
+def _script_lang(script, confidence):
+    if not script or (confidence or 0) < MIN_SCRIPT_CONFIDENCE:
+        return DEFAULT_LANGS
+    return SCRIPT_LANGS.get(script, DEFAULT_LANGS)
+
+
+def _ocr_frame(file_path, index):
+    from PIL import Image
+
+    with Image.open(file_path) as image:
+        image.seek(index)
+        return ocr_image(image.copy())
@@ -1,11 +1,20 @@
 import frappe
 from litellm import completion
 
+from ai_assistant.ontime_ai_assistant.api.http_client import configure_litellm, get_timeout
+from ai_assistant.ontime_ai_assistant.api.metrics import track_llm_call
+
 @frappe.whitelist()
 def get_openai_response(prompt, api_key, model="gpt-3.5-turbo"):
     try:
+        configure_litellm()
         messages = [{"role": "user", "content": prompt}]
-        response = completion(model=model, messages=messages, api_key=api_key)
+        with track_llm_call("OpenAI", model) as call_metrics:
+            response = completion(model=model, messages=messages, api_key=api_key, timeout=get_timeout()[1])
+            usage = getattr(response, "usage", None)
+            if usage:
+                call_metrics["prompt_tokens"] = usage.prompt_tokens
+                call_metrics["completion_tokens"] = usage.completion_tokens
         return response.choices[0].message.content
     except Exception as e:
         frappe.log_error(f"OpenAI API request failed: {e}", "OpenAI API Error")
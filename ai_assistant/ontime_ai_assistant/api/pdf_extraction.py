@@ -0,0 +1,159 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import frappe
+
+# Page-streaming PDF text extraction.
+#
+# Pages are read with a fast text extractor (PyMuPDF when installed, otherwise PyPDF2) and only the
+# pages whose fast text looks unusable are re-read with pdfplumber's layout analysis; pages with no text
+# layer at all are rendered and OCRed. Small files are read from the one document opened to count and
+# probe their pages. Large files are split into page ranges that run on a process pool; results are
+# yielded in page order while at most a few ranges are in flight, so memory stays bounded by the
+# window, not by the page count.
+#
+# Workers only receive a path and a page range and never touch frappe, so they are safe to fork.
+#
+# Site config: ai_assistant_pdf_workers (processes, default min(4, cpu count); 1 disables the pool)
+
+PAGES_PER_RANGE = 16
+# Files up to this many pages are read inline; starting a pool costs more than it saves
+INLINE_PAGE_LIMIT = 24
+MAX_WORKERS = 4
+# Fast-path text shorter than this (after whitespace) is treated as needing layout analysis
+MIN_PAGE_CHARS = 20
+# Scanned pages are OCRed (see ocr.py) in ranges this small so every worker gets a share
+OCR_PAGES_PER_RANGE = 2
+SCAN_PROBE_PAGES = 3
+
+_GARBLED = re.compile(r"\(cid:\d+\)|\ufffd")
+
+
+def iter_pdf_pages(file_path, workers=None, pages_per_range=PAGES_PER_RANGE, on_page_count=None):
+    # Yields (page_number, text) in page order, page numbers starting at 1; on_page_count(count) is
+    # called once the document is open, before the first page
+    workers = workers or get_worker_count()
+    with _TextLayer(file_path) as document:
+        page_count = document.page_count
+        if on_page_count:
+            on_page_count(page_count)
+        if _is_scanned(document):
+            # OCR dominates, so even short scans are worth spreading over the pool in small ranges
+            pages_per_range = OCR_PAGES_PER_RANGE
+            inline_limit = 1
+        else:
+            inline_limit = INLINE_PAGE_LIMIT
+        ranges = [(start, min(start + pages_per_range, page_count)) for start in range(0, page_count, pages_per_range)]
+
+        if workers <= 1 or page_count <= inline_limit:
+            # Read inline from the document already open
+            for start, end in ranges:
+                yield from _extract_range(document, file_path, start, end)
+            return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges))) as pool:
+        window = workers * 2
+        futures = [pool.submit(extract_page_range, file_path, start, end) for start, end in ranges[:window]]
+        next_range = len(futures)
+        while futures:
+            pages = futures.pop(0).result()
+            if next_range < len(ranges):
+                futures.append(pool.submit(extract_page_range, file_path, *ranges[next_range]))
+                next_range += 1
+            yield from pages
+
+
+def extract_page_range(file_path, start, end):
+    # Runs in a worker process; returns [(page_number, text)] for pages [start, end)
+    with _TextLayer(file_path) as document:
+        return _extract_range(document, file_path, start, end)
+
+
+def _extract_range(document, file_path, start, end):
+    pages = [(number + 1, document.page_text(number)) for number in range(start, end)]
+    needs_layout = [index for index, (_, text) in enumerate(pages) if _needs_layout(text)]
+    if needs_layout:
+        import pdfplumber
+
+        with pdfplumber.open(file_path) as pdf:
+            for index in needs_layout:
+                page_number = pages[index][0]
+                page = pdf.pages[page_number - 1]
+                pages[index] = (page_number, page.extract_text() or pages[index][1])
+                # pdfplumber caches parsed layout objects per page; drop them as we go
+                page.flush_cache()
+
+        # Still no usable text: a scanned page
+        scanned = [index for index in needs_layout if _needs_ocr(pages[index][1])]
+        if scanned:
+            from ai_assistant.ontime_ai_assistant.api.ocr import ocr_pdf_pages
+
+            texts = ocr_pdf_pages(file_path, [pages[index][0] for index in scanned])
+            for index in scanned:
+                page_number = pages[index][0]
+                pages[index] = (page_number, texts.get(page_number) or pages[index][1])
+    return pages
+
+
+class _TextLayer:
+    # The PDF's text layer through PyMuPDF, or PyPDF2 when PyMuPDF is not installed
+
+    def __init__(self, file_path):
+        try:
+            import fitz
+        except ImportError:
+            fitz = None
+
+        self._file = None
+        if fitz:
+            self._pdf = fitz.open(file_path)
+            self.page_count = self._pdf.page_count
+        else:
+            import PyPDF2
+
+            self._file = open(file_path, "rb")
+            self._pdf = PyPDF2.PdfReader(self._file)
+            self.page_count = len(self._pdf.pages)
+
+    def page_text(self, number):
+        # number is 0-based
+        if self._file is None:
+            return self._pdf.load_page(number).get_text("text")
+        try:
+            return self._pdf.pages[number].extract_text() or ""
+        except Exception:
+            return ""
+
+    def close(self):
+        if self._file is None:
+            self._pdf.close()
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _is_scanned(document):
+    # Probes the first pages; a PDF without a text layer there is treated as a scan
+    probe = min(SCAN_PROBE_PAGES, document.page_count)
+    return probe > 0 and all(_needs_ocr(document.page_text(number)) for number in range(probe))
+
+
+def _needs_ocr(text):
+    return len("".join(text.split())) < MIN_PAGE_CHARS
+
+
+def _needs_layout(text):
+    if _needs_ocr(text):
+        return True
+    stripped = "".join(text.split())
+    return len(_GARBLED.findall(text)) * 10 > len(stripped)
+
+
+def get_worker_count():
+    return frappe.utils.cint(frappe.conf.get("ai_assistant_pdf_workers")) or min(MAX_WORKERS, os.cpu_count() or 1)
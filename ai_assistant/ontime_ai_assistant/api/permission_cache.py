@@ -0,0 +1,68 @@
+import frappe
+
+# Per-user authorization snapshot for the chat command path.
+#
+# The user's roles are kept as a frozenset in the site cache under the user and a site-wide version,
+# so the chat path does not rebuild them on every message. DocType-level (doctype, permtype)
+# decisions are memoised on frappe.local for the rest of the request only: the Role Permission
+# Manager writes Custom DocPerm rows without document events, so a decision cached across requests
+# could outlive a revoked permission.
+#
+# Saving a Role or clearing the whole cache bumps the version (see hooks.py); saving a User (roles are
+# saved with the user) drops only that user's snapshot. Document-level checks (owner, user
+# permissions on a specific record) are not memoised: insert(), save() and get_list() apply them.
+
+VERSION_KEY = "ai_assistant:permission_version"
+# {user}:{version} -> frozenset of the user's roles
+SNAPSHOT_KEY = "ai_assistant:user_roles"
+SNAPSHOT_TTL = 6 * 60 * 60
+
+
+def get_user_roles(user=None):
+    return get_snapshot(user)["roles"]
+
+
+def has_permission(doctype, permtype="read", user=None):
+    snapshot = get_snapshot(user)
+    key = (doctype, permtype)
+    allowed = snapshot["decisions"].get(key)
+    if allowed is None:
+        allowed = snapshot["decisions"][key] = bool(frappe.has_permission(doctype, permtype=permtype, user=snapshot["user"]))
+    return allowed
+
+
+def get_snapshot(user=None):
+    user = user or frappe.session.user
+    snapshots = getattr(frappe.local, "ai_permission_snapshots", None)
+    if snapshots is None:
+        snapshots = frappe.local.ai_permission_snapshots = {}
+    snapshot = snapshots.get(user)
+    if snapshot is None:
+        version = _get_version()
+        key = _snapshot_key(user, version)
+        roles = frappe.cache().get_value(key)
+        if roles is None:
+            roles = frozenset(frappe.get_roles(user))
+            frappe.cache().set_value(key, roles, expires_in_sec=SNAPSHOT_TTL)
+        snapshot = snapshots[user] = {"user": user, "version": version, "roles": roles, "decisions": {}}
+    return snapshot
+
+
+def bump_permission_version(doc=None, method=None):
+    # doc_events hook for Role and clear_cache hook; old snapshots expire with their TTL
+    frappe.cache().set_value(VERSION_KEY, frappe.generate_hash(length=12))
+    frappe.local.ai_permission_snapshots = {}
+
+
+def clear_user_snapshot(doc, method=None):
+    # doc_events hook for User
+    frappe.cache().delete_value(_snapshot_key(doc.name, _get_version()))
+    (getattr(frappe.local, "ai_permission_snapshots", None) or {}).pop(doc.name, None)
+
+
+def _snapshot_key(user, version):
+    return f"{SNAPSHOT_KEY}:{user}:{version}"
+
+
+def _get_version():
+    return frappe.cache().get_value(VERSION_KEY) or ""
@@ -0,0 +1,183 @@
+import hashlib
+import re
+import threading
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api import metrics
+from ai_assistant.ontime_ai_assistant.api.chunked_analysis import estimate_tokens, make_token_counter
+
+# Registry of every prompt the app sends.
+#
+# A template has a static "system" part (instructions without placeholders) and a "user" part that
+# is formatted with the request's values. The system part is sent first and unchanged, so provider
+# prompt caches can reuse it across requests (see ai_service.apply_prompt_caching). Callers with
+# their own instructions, such as a custom document analysis prompt, pass them as `system`.
+#
+# Every template carries a version and the fingerprint of its text. FINGERPRINTS pins the fingerprint
+# of each (name, version): editing a template without bumping its version and updating the pin shows
+# up as "changed" in get_template_report. Cache scopes use template_key(), so answers produced by an
+# old version are not served after a bump.
+#
+# Token cost: the static part is counted once per process with each provider model's tokenizer; every
+# render records the estimated size of the full prompt in the ai_prompt_template_tokens histogram.
+
+TEMPLATES = {
+    "erp_explanation": {
+        "version": 1,
+        "system": "You are an ERPNext expert. Provide a concise and clear explanation, and if applicable, mention relevant DocTypes or modules. If it's a process, outline the steps in ERPNext.",
+        "user": "Explain \"{query}\" in the context of ERPNext.{perspective}{context}",
+    },
+    "erp_steps": {
+        "version": 1,
+        "system": "You are an ERPNext expert. Outline processes as specific and clear numbered steps.",
+        "user": "Outline the steps to \"{query}\" in ERPNext.{perspective}{context}",
+    },
+    "knowledge_perspective": {
+        "version": 1,
+        "user": " (from {article} {perspective} perspective)",
+    },
+    "knowledge_context": {
+        "version": 1,
+        "user": "\nBase the answer on these ERPNext reference notes and keep it short:\n{context}",
+    },
+    "role_hint": {
+        "version": 1,
+        "user": "{query} related to {perspective}",
+    },
+    "script_generation": {
+        "version": 1,
+        "system": "You write Frappe and ERPNext scripts. Provide only the code, without any additional explanations or text.",
+        "user": "Generate a {script_type} for the following request: {prompt}",
+    },
+    "document_analysis": {
+        "version": 1,
+        "system": "Analyze the document content you are given and extract key information, summarize it, and identify any relevant entities. If it's a structured document like an invoice or purchase order, extract line items, totals, dates, and parties. If it's a contract, identify key clauses, parties, and terms. If it's a general text, provide a concise summary and main topics. Return the output in a structured JSON format if possible, otherwise as a comprehensive summary.",
+        "user": "Document: {document_name}\n\nDocument Content:\n{content}",
+    },
+    "document_chunk": {
+        "version": 1,
+        "user": "Document: {document_name}\n\nThis is part {part} of {total} of the document (pages {first_page}-{last_page}). Analyze only this part; report facts, entities, line items and amounts exactly as they appear so the parts can be combined later.\n\nDocument Content:\n{content}",
+    },
+    "document_reduce": {
+        "version": 1,
+        "user": "The document '{document_name}' was analyzed in parts. Combine the partial analyses below into one final result that follows the instructions.\n\nMerge duplicate entities and line items, keep every distinct fact, and recompute totals where the parts overlap. Return the final output in a structured JSON format if possible.\n\n{analyses}",
+    },
+    "conversation_system": {
+        "version": 1,
+        "system": "You are an assistant inside ERPNext. Use the earlier conversation to resolve follow-up questions.",
+        "user": "Summary of the earlier conversation:\n{summary}",
+    },
+    "conversation_summary": {
+        "version": 1,
+        "system": "You summarize conversations between an ERPNext user and an assistant. Keep the facts a follow-up question may refer to: documents, parties, filters, dates, figures and open requests. Write at most 200 words.",
+        "user": "Current summary:\n{summary}\n\nNew turns:\n{turns}",
+    },
+}
+
+# (name, version) -> fingerprint of that version's text; update together with the version
+FINGERPRINTS = {
+    ("erp_explanation", 1): "0bc44dbae1b5",
+    ("erp_steps", 1): "efe827862bc4",
+    ("knowledge_perspective", 1): "0c6e016c7c98",
+    ("knowledge_context", 1): "772fbe70b460",
+    ("role_hint", 1): "99b933042282",
+    ("script_generation", 1): "0a5240bf5f51",
+    ("document_analysis", 1): "a37860366555",
+    ("document_chunk", 1): "086b61801787",
+    ("document_reduce", 1): "dbd2e65cb378",
+    ("conversation_system", 1): "d3594bb4bf2e",
+    ("conversation_summary", 1): "542d0aa5fe45",
+}
+
+_PLACEHOLDER = re.compile(r"\{\w+\}")
+
+_lock = threading.Lock()
+_static_tokens = {}
+
+
+def render(name, system=None, site=None, **values):
+    # Returns the messages for a template: the static system part (or the caller's), then the user part.
+    # Worker threads pass the site, which frappe.local does not carry there
+    template = TEMPLATES[name]
+    system = system or template.get("system")
+    user = template["user"].format(**values)
+    messages = [{"role": "system", "content": system}] if system else []
+    messages.append({"role": "user", "content": user})
+    record_render(name, messages, site)
+    return messages
+
+
+def record_render(name, messages, site=None):
+    # For callers that assemble the messages themselves (conversation history)
+    metrics.observe(
+        "ai_prompt_template_tokens",
+        sum(estimate_tokens(message["content"]) for message in messages),
+        site=site,
+        template=name,
+        version=TEMPLATES[name]["version"],
+    )
+
+
+def render_text(name, **values):
+    # Fragments and single-string prompts
+    return TEMPLATES[name]["user"].format(**values)
+
+
+def get_system(name):
+    return TEMPLATES[name].get("system")
+
+
+def template_key(name):
+    template = TEMPLATES[name]
+    return f"{name}@{template['version']}:{fingerprint(name)}"
+
+
+def fingerprint(name):
+    template = TEMPLATES[name]
+    text = f"{template.get('system') or ''}\x1f{template['user']}"
+    return hashlib.sha256(text.encode()).hexdigest()[:12]
+
+
+def static_tokens(name, model):
+    # Tokens of the fixed text (system part and the user part without its placeholders) for a model
+    template = TEMPLATES[name]
+    key = (name, template["version"], model)
+    with _lock:
+        if key in _static_tokens:
+            return _static_tokens[key]
+    count_tokens = make_token_counter(model)
+    static_text = "\n".join(filter(None, [template.get("system"), _PLACEHOLDER.sub("", template["user"])]))
+    tokens = count_tokens(static_text)
+    with _lock:
+        _static_tokens[key] = tokens
+    return tokens
+
+
+@frappe.whitelist()
+def get_template_report():
+    frappe.only_for("System Manager")
+    from ai_assistant.ontime_ai_assistant.api.ai_service import PROVIDER_MODELS
+
+    metrics.flush()
+    usage = {}
+    for (metric, label_text), values in metrics.get_series().items():
+        if metric == "ai_prompt_template_tokens":
+            labels = metrics.parse_labels(label_text)
+            if labels.get("version") == str(TEMPLATES.get(labels.get("template"), {}).get("version")):
+                usage[labels["template"]] = values
+
+    rows = []
+    for name, template in TEMPLATES.items():
+        values = usage.get(name, {})
+        rows.append({
+            "template": name,
+            "version": template["version"],
+            "fingerprint": fingerprint(name),
+            "changed": FINGERPRINTS.get((name, template["version"])) != fingerprint(name),
+            "static_tokens": {provider: static_tokens(name, model) for provider, model in PROVIDER_MODELS.items()},
+            "renders": int(values.get("count", 0)),
+            "avg_tokens": round(values["sum"] / values["count"]) if values.get("count") else None,
+            "total_tokens": int(values.get("sum", 0)),
+        })
+    return sorted(rows, key=lambda row: -row["total_tokens"])
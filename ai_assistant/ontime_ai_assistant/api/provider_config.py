@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+import frappe
+from frappe.utils.password import decrypt, encrypt, get_decrypted_password
+
+# Resolved provider configs are looked up in three tiers before touching the database:
+#   1. frappe.local, for the rest of the current request or job
+#   2. an in-process LRU, keyed by a version stamp kept in Redis
+#   3. the site cache (Redis), shared by every worker; the API key is stored encrypted there
+# AI Provider / AI Settings updates replace the version stamp, which retires every tier at once.
+
+CACHE_KEY = "ai_assistant:provider_config"
+VERSION_KEY = "ai_assistant:provider_version"
+CACHE_TTL = 6 * 60 * 60
+LRU_SIZE = 32
+ROUTING_KEY = "__routing__"
+
+_lru = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_provider_config(provider_name=None):
+    # Returns {"name", "provider_type", "api_endpoint", "max_concurrent_requests", "api_key"};
+    # the default provider when no name is given
+    return _resolve(provider_name or "", lambda version: _load_config(provider_name, version))
+
+
+def get_routing_settings():
+    # Returns {"providers": [names in fallback order], "hedge_after_ms", "failure_threshold", "cooldown"}
+    return _resolve(ROUTING_KEY, _load_routing_settings)
+
+
+def _resolve(key, loader):
+    request_cache = getattr(frappe.local, "ai_provider_configs", None)
+    if request_cache is None:
+        request_cache = frappe.local.ai_provider_configs = {}
+
+    if key in request_cache:
+        return request_cache[key]
+
+    lru_key = (frappe.local.site, key, _get_version())
+    with _lock:
+        value = _lru.get(lru_key)
+        if value is not None:
+            _lru.move_to_end(lru_key)
+
+    if value is None:
+        value = loader(lru_key[2])
+        with _lock:
+            _lru[lru_key] = value
+            while len(_lru) > LRU_SIZE:
+                _lru.popitem(last=False)
+
+    request_cache[key] = value
+    return value
+
+
+def clear_provider_cache(doc=None, method=None):
+    frappe.cache().set_value(VERSION_KEY, frappe.generate_hash(length=12))
+    frappe.cache().delete_keys(CACHE_KEY)
+    frappe.local.ai_provider_configs = {}
+    with _lock:
+        _lru.clear()
+
+
+def _get_version():
+    version = frappe.cache().get_value(VERSION_KEY)
+    if not version:
+        version = frappe.generate_hash(length=12)
+        frappe.cache().set_value(VERSION_KEY, version)
+    return version
+
+
+def _load_config(provider_name, version):
+    cache_key = f"{CACHE_KEY}:{version}:{provider_name or 'default'}"
+    cached = frappe.cache().get_value(cache_key)
+    if cached:
+        config = dict(cached)
+        config["api_key"] = decrypt(config.pop("encrypted_api_key")) if config.get("encrypted_api_key") else None
+        return config
+
+    name = provider_name or frappe.db.get_single_value("AI Settings", "default_ai_provider")
+    if not name:
+        frappe.throw("Default AI Provider is not set in AI Settings.")
+
+    config = frappe.db.get_value(
+        "AI Provider", name, ["name", "provider_type", "api_endpoint", "max_concurrent_requests"], as_dict=True
+    )
+    if not config:
+        frappe.throw(f"AI Provider {name} not found.")
+
+    config = dict(config)
+    config["api_key"] = get_decrypted_password("AI Provider", name, "api_key", raise_exception=False)
+
+    cached = {k: v for k, v in config.items() if k != "api_key"}
+    cached["encrypted_api_key"] = encrypt(config["api_key"]) if config["api_key"] else None
+    frappe.cache().set_value(cache_key, cached, expires_in_sec=CACHE_TTL)
+    return config
+
+
+def _load_routing_settings(version):
+    cache_key = f"{CACHE_KEY}:{version}:{ROUTING_KEY}"
+    settings = frappe.cache().get_value(cache_key)
+    if settings:
+        return settings
+
+    ai_settings = frappe.get_single("AI Settings")
+    providers = [ai_settings.default_ai_provider] if ai_settings.default_ai_provider else []
+    for row in ai_settings.get("fallback_providers") or []:
+        if row.ai_provider and row.ai_provider not in providers:
+            providers.append(row.ai_provider)
+
+    settings = {
+        "providers": providers,
+        "hedge_after_ms": frappe.utils.cint(ai_settings.hedge_after_ms),
+        "failure_threshold": frappe.utils.cint(ai_settings.circuit_breaker_failures) or 3,
+        "cooldown": frappe.utils.cint(ai_settings.circuit_breaker_cooldown) or 30,
+    }
+    frappe.cache().set_value(cache_key, settings, expires_in_sec=CACHE_TTL)
+    return settings
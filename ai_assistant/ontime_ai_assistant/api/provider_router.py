@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Routes a completion across the providers configured in AI Settings (default first, then the
+# fallback table). Each provider keeps, per process, a circuit breaker and a rolling window of
+# latencies. A provider that fails `failure_threshold` times in a row is skipped for `cooldown`
+# seconds, then gets a single trial request (half-open). With hedging enabled, a second request
+# goes to the next provider once the first has been running longer than the latency budget
+# (min(hedge_after_ms, p95)), and the first successful answer wins.
+#
+# Calls run on a small thread pool and must not touch frappe.local; callers pass plain functions.
+
+LATENCY_WINDOW = 200
+MIN_SAMPLES_FOR_P95 = 20
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class ProviderStats:
+    def __init__(self):
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class AllProvidersFailed(Exception):
+    pass
+
+
+def get_stats(provider):
+    with _stats_lock:
+        stats = _stats.get(provider)
+        if stats is None:
+            stats = _stats[provider] = ProviderStats()
+        return stats
+
+
+def get_latency_report():
+    with _stats_lock:
+        providers = list(_stats)
+    report = {}
+    for provider in providers:
+        stats = get_stats(provider)
+        report[provider] = {
+            "p50_ms": stats.percentile(50),
+            "p95_ms": stats.percentile(95),
+            "samples": len(stats.latencies),
+            "circuit_open": stats.open_until > time.monotonic(),
+            "consecutive_failures": stats.consecutive_failures,
+        }
+    return report
+
+
+def is_available(provider):
+    return get_stats(provider).open_until <= time.monotonic()
+
+
+def _acquire_trial(provider):
+    # After the cooldown (half-open), only one request at a time probes a tripped provider
+    stats = get_stats(provider)
+    with _stats_lock:
+        if not stats.open_until:
+            return True
+        if stats.trial_in_flight:
+            return False
+        stats.trial_in_flight = True
+        return True
+
+
+def record_success(provider, latency_ms):
+    stats = get_stats(provider)
+    with _stats_lock:
+        stats.latencies.append(latency_ms)
+        stats.consecutive_failures = 0
+        stats.open_until = 0.0
+        stats.trial_in_flight = False
+
+
+def record_failure(provider, failure_threshold, cooldown):
+    stats = get_stats(provider)
+    with _stats_lock:
+        stats.consecutive_failures += 1
+        stats.trial_in_flight = False
+        if stats.consecutive_failures >= failure_threshold:
+            stats.open_until = time.monotonic() + cooldown
+
+
+def route(calls, hedge_after_ms=0, failure_threshold=3, cooldown=30):
+    # `calls` is an ordered list of (provider, fn); returns (provider, result) of the first success
+    candidates = [(provider, fn) for provider, fn in calls if is_available(provider)] or calls[:1]
+    candidates = iter(candidates)
+    pending = {}
+    errors = []
+    hedged = False
+
+    def attempt(provider, fn):
+        start = time.monotonic()
+        try:
+            result = fn()
+        except Exception:
+            record_failure(provider, failure_threshold, cooldown)
+            raise
+        record_success(provider, (time.monotonic() - start) * 1000)
+        return result
+
+    def submit_next():
+        for provider, fn in candidates:
+            if _acquire_trial(provider):
+                pending[_get_executor().submit(attempt, provider, fn)] = provider
+                return True
+        return False
+
+    if not submit_next():
+        raise AllProvidersFailed("No AI provider is available.")
+
+    while pending:
+        budget = None
+        if hedge_after_ms and not hedged:
+            budget = _hedge_budget(next(iter(pending.values())), hedge_after_ms) / 1000
+
+        done, _ = wait(pending, timeout=budget, return_when=FIRST_COMPLETED)
+        if not done:
+            # Latency budget exceeded: race the next provider against the slow one
+            hedged = True
+            submit_next()
+            continue
+
+        for future in done:
+            provider = pending.pop(future)
+            try:
+                return provider, future.result()
+            except Exception as e:
+                errors.append(f"{provider}: {e}")
+                if not pending:
+                    submit_next()
+
+    raise AllProvidersFailed("; ".join(errors) or "No AI provider is available.")
+
+
+def _hedge_budget(provider, hedge_after_ms):
+    stats = get_stats(provider)
+    if len(stats.latencies) >= MIN_SAMPLES_FOR_P95:
+        return min(hedge_after_ms, stats.percentile(95))
+    return hedge_after_ms
+
+
+def _get_executor():
+    # Threads do not survive a fork, so each worker process builds its own pool
+    global _executor, _executor_pid
+    if _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ai-provider")
+                _executor_pid = os.getpid()
+    return _executor
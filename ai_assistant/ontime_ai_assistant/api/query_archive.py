@@ -0,0 +1,79 @@
+import gzip
+import json
+import os
+
+import frappe
+
+# Retention for AI Query: rows older than the retention period are copied, in chunks, to gzipped
+# JSON-lines files under private/ai_assistant/query_archive (one file per month of query_date) and
+# then deleted, so the table only holds recent traffic. Each chunk is appended as its own gzip member,
+# which gzip readers concatenate transparently.
+#
+# Site config: ai_assistant_query_retention_days (default 180; 0 keeps everything)
+
+DEFAULT_RETENTION_DAYS = 180
+CHUNK_SIZE = 2000
+# Bounds a single run so the daily job stays short; the remainder is picked up the next day
+MAX_CHUNKS_PER_RUN = 100
+
+ARCHIVE_FIELDS = [
+    "name",
+    "query_text",
+    "response_text",
+    "response_size",
+    "query_type",
+    "user",
+    "conversation",
+    "query_date",
+    "provider",
+    "model",
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+]
+
+
+def archive_old_queries():
+    # Scheduled daily
+    retention_days = frappe.conf.get("ai_assistant_query_retention_days")
+    retention_days = DEFAULT_RETENTION_DAYS if retention_days is None else frappe.utils.cint(retention_days)
+    if retention_days <= 0:
+        return 0
+
+    cutoff = frappe.utils.add_days(frappe.utils.now_datetime(), -retention_days)
+    archived = 0
+    for _ in range(MAX_CHUNKS_PER_RUN):
+        rows = frappe.get_all(
+            "AI Query",
+            filters={"query_date": ("<", cutoff)},
+            fields=ARCHIVE_FIELDS,
+            order_by="query_date asc",
+            limit_page_length=CHUNK_SIZE,
+        )
+        if not rows:
+            break
+
+        # Written before deleting: an interrupted run can at worst archive a chunk twice, never lose it
+        _write_archive(rows)
+        frappe.db.delete("AI Query", {"name": ("in", [row.name for row in rows])})
+        frappe.db.commit()
+        archived += len(rows)
+
+    return archived
+
+
+def get_archive_path(*parts):
+    return frappe.get_site_path("private", "ai_assistant", "query_archive", *parts)
+
+
+def _write_archive(rows):
+    by_month = {}
+    for row in rows:
+        month = frappe.utils.get_datetime(row.query_date).strftime("%Y-%m") if row.query_date else "undated"
+        by_month.setdefault(month, []).append(row)
+
+    os.makedirs(get_archive_path(), exist_ok=True)
+    for month, month_rows in by_month.items():
+        with gzip.open(get_archive_path(f"ai_query-{month}.jsonl.gz"), "at", encoding="utf-8") as f:
+            for row in month_rows:
+                f.write(json.dumps(row, default=str, ensure_ascii=False) + "\n")
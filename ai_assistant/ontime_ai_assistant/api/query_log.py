@@ -0,0 +1,130 @@
+import json
+
+import frappe
+
+# AI Query logging off the request path.
+#
+# Chat requests append one JSON entry to a Redis list and return; a scheduler job drains the list
+# every minute and writes the entries with multi-row inserts, so busy hours cost one INSERT per batch
+# instead of one per query. Responses are stored truncated (their full size is kept in
+# response_size), and latency and token counts are structured columns.
+#
+# Site config:
+#   ai_assistant_log_response_chars: characters of the response kept, default 4000
+#   ai_assistant_log_buffer_size: entries kept in Redis when the scheduler is behind, default 50000
+
+LOG_KEY = "ai_assistant:query_log"
+FLUSH_BATCH = 500
+DEFAULT_RESPONSE_CHARS = 4000
+DEFAULT_BUFFER_SIZE = 50_000
+
+LOG_FIELDS = (
+    "query_text",
+    "response_text",
+    "response_size",
+    "query_type",
+    "user",
+    "conversation",
+    "query_date",
+    "provider",
+    "model",
+    "latency_ms",
+    "prompt_tokens",
+    "completion_tokens",
+)
+
+
+def log_query(query_text, response, query_type, user=None, latency_ms=None, conversation=None):
+    # Returns the entry's query_date, which conversations use to find the row again after the flush
+    usage = getattr(frappe.local, "ai_query_usage", None) or {}
+    frappe.local.ai_query_usage = {}
+
+    response_text = response if isinstance(response, str) else frappe.as_json(response, indent=None)
+    limit = frappe.utils.cint(frappe.conf.get("ai_assistant_log_response_chars")) or DEFAULT_RESPONSE_CHARS
+    entry = {
+        "query_text": query_text,
+        "response_text": _truncate(response_text, limit),
+        "response_size": len(response_text),
+        "query_type": query_type,
+        "user": user or frappe.session.user,
+        "conversation": conversation,
+        "query_date": str(frappe.utils.now_datetime()),
+        "provider": usage.get("provider"),
+        "model": usage.get("model"),
+        "latency_ms": frappe.utils.cint(latency_ms) if latency_ms is not None else None,
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+    }
+
+    try:
+        cache = frappe.cache()
+        key = cache.make_key(LOG_KEY)
+        buffer_size = frappe.utils.cint(frappe.conf.get("ai_assistant_log_buffer_size")) or DEFAULT_BUFFER_SIZE
+        pipe = cache.pipeline()
+        pipe.rpush(key, json.dumps(entry, default=str))
+        # Bounded: if the scheduler is down, the oldest entries are dropped rather than filling Redis
+        pipe.ltrim(key, -buffer_size, -1)
+        pipe.execute()
+    except Exception as e:
+        frappe.log_error(f"Could not buffer AI Query log: {e}", "AI Query Log Error")
+    return entry["query_date"]
+
+
+def flush_query_log():
+    # Scheduled every minute
+    cache = frappe.cache()
+    key = cache.make_key(LOG_KEY)
+    while True:
+        pipe = cache.pipeline()
+        pipe.lrange(key, 0, FLUSH_BATCH - 1)
+        pipe.ltrim(key, FLUSH_BATCH, -1)
+        raw_entries, _ = pipe.execute()
+        if not raw_entries:
+            return
+
+        try:
+            entries = [json.loads(raw) for raw in raw_entries]
+            _insert(entries)
+            _touch_conversations(entries)
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            # Put the batch back in front so it is retried on the next run
+            cache.pipeline().lpush(key, *reversed(raw_entries)).execute()
+            frappe.log_error(f"Could not write AI Query log batch: {e}", "AI Query Log Error")
+            return
+
+        if len(raw_entries) < FLUSH_BATCH:
+            return
+
+
+def _insert(entries):
+    now = frappe.utils.now()
+    fields = ["creation", "modified", "owner", "modified_by", *LOG_FIELDS]
+    values = [(now, now, entry["user"], entry["user"], *(entry.get(field) for field in LOG_FIELDS)) for entry in entries]
+    # AI Query is autoincrement-named, so the database assigns the names
+    frappe.db.bulk_insert("AI Query", fields=fields, values=values)
+
+
+def _touch_conversations(entries):
+    # Turn counts and activity of AI Conversation are kept here, one UPDATE per conversation per batch
+    turns = {}
+    for entry in entries:
+        if entry.get("conversation"):
+            count, last = turns.get(entry["conversation"], (0, entry["query_date"]))
+            turns[entry["conversation"]] = (count + 1, max(last, entry["query_date"]))
+
+    Conversation = frappe.qb.DocType("AI Conversation")
+    for conversation, (count, last) in turns.items():
+        (
+            frappe.qb.update(Conversation)
+            .set(Conversation.turn_count, Conversation.turn_count + count)
+            .set(Conversation.last_active, last)
+            .where(Conversation.name == conversation)
+        ).run()
+
+
+def _truncate(text, limit):
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}\n… [{len(text) - limit} more characters]"
@@ -0,0 +1,197 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import frappe
+
+# Response cache for knowledge-base answers ("what is X", "how to Y").
+#
+# Lookups go exact query -> normalized query -> (optional) embedding similarity. Every entry is
+# scoped by kind, provider, model and role perspective so a sales answer is never served to an
+# accountant. Entries live in an in-process LRU in front of the site cache (Redis); Redis entries
+# carry a TTL and a sorted set scored by last-access time bounds their number (LRU eviction).
+#
+# Site config:
+#   ai_assistant_response_cache_ttl: seconds, default 7 days
+#   ai_assistant_response_cache_size: max Redis entries, default 5000
+#   ai_assistant_embedding_model: litellm embedding model enabling the similarity tier; its credentials
+#     come from the provider environment variables litellm reads (e.g. OPENAI_API_KEY), as in erp_docs_index
+#   ai_assistant_semantic_threshold: cosine similarity needed for a semantic hit, default 0.92
+
+ENTRY_KEY = "ai_assistant:response"
+LRU_INDEX_KEY = "ai_assistant:response_lru"
+VECTOR_KEY = "ai_assistant:response_vectors"
+
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_THRESHOLD = 0.92
+LOCAL_LRU_SIZE = 256
+MAX_VECTORS_PER_SCOPE = 500
+
+STOP_WORDS = frozenset(
+    """
+    a an the is are was were be been of in on at to for from by with and or what whats how do does
+    i we you me my our please can could would should explain define tell about erpnext erp
+    ما هو هي معنى كيف في من على الى إلى عن هل ماذا لماذا اشرح لي
+    """.split()
+)
+
+_ARABIC_DIACRITICS = re.compile("[\u064B-\u0652\u0640]")
+_ARABIC_LETTERS = str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي"})
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+_local = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalize_query(text):
+    text = _ARABIC_DIACRITICS.sub("", text.lower()).translate(_ARABIC_LETTERS)
+    words = _PUNCTUATION.sub(" ", text).split()
+    return " ".join(word for word in words if word not in STOP_WORDS)
+
+
+def make_scope(kind, provider, model, perspective=None, template=None):
+    # template is prompt_templates.template_key(), so a prompt change retires the answers it produced
+    return f"{kind}|{provider}|{model}|{perspective or ''}|{template or ''}"
+
+
+def get_cached_response(scope, query):
+    for key in _lookup_keys(scope, query):
+        response = _get(key)
+        if response is not None:
+            return response
+
+    if frappe.conf.get("ai_assistant_embedding_model"):
+        return _semantic_lookup(scope, query)
+    return None
+
+
+def set_cached_response(scope, query, response):
+    for key in _lookup_keys(scope, query):
+        _set(key, response)
+
+    if frappe.conf.get("ai_assistant_embedding_model"):
+        _store_vector(scope, query, response)
+
+
+def clear_response_cache():
+    frappe.cache().delete_keys(ENTRY_KEY)
+    frappe.cache().delete_keys(VECTOR_KEY)
+    frappe.cache().delete_value(LRU_INDEX_KEY)
+    with _lock:
+        _local.clear()
+
+
+def _lookup_keys(scope, query):
+    exact = query.strip()
+    normalized = normalize_query(query) or exact
+    return [_hash(scope, "exact", exact), _hash(scope, "norm", normalized)]
+
+
+def _hash(*parts):
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+def _get(key):
+    local_key = (frappe.local.site, key)
+    with _lock:
+        entry = _local.get(local_key)
+        if entry is not None:
+            if entry[0] > time.time():
+                _local.move_to_end(local_key)
+                return entry[1]
+            del _local[local_key]
+
+    response = frappe.cache().get_value(f"{ENTRY_KEY}:{key}")
+    if response is None:
+        return None
+
+    # Refresh the access time so hot entries survive eviction
+    cache = frappe.cache()
+    cache.pipeline().zadd(cache.make_key(LRU_INDEX_KEY), {key: time.time()}).execute()
+    _set_local(local_key, response)
+    return response
+
+
+def _set(key, response):
+    ttl = frappe.utils.cint(frappe.conf.get("ai_assistant_response_cache_ttl")) or DEFAULT_TTL
+    max_entries = frappe.utils.cint(frappe.conf.get("ai_assistant_response_cache_size")) or DEFAULT_MAX_ENTRIES
+
+    cache = frappe.cache()
+    cache.set_value(f"{ENTRY_KEY}:{key}", response, expires_in_sec=ttl)
+    index_key = cache.make_key(LRU_INDEX_KEY)
+    size = cache.pipeline().zadd(index_key, {key: time.time()}).zcard(index_key).execute()[1]
+    if size > max_entries:
+        # Evict a tenth more than needed so eviction does not run on every insert
+        overflow = size - max_entries + max_entries // 10
+        pipe = cache.pipeline()
+        pipe.zrange(index_key, 0, overflow - 1)
+        pipe.zremrangebyrank(index_key, 0, overflow - 1)
+        evicted = [m.decode() if isinstance(m, bytes) else m for m in pipe.execute()[0]]
+        cache.delete_value([f"{ENTRY_KEY}:{member}" for member in evicted])
+
+    _set_local((frappe.local.site, key), response)
+
+
+def _set_local(local_key, response):
+    # Local entries live at most a minute so evictions and clears elsewhere are picked up quickly
+    with _lock:
+        _local[local_key] = (time.time() + 60, response)
+        _local.move_to_end(local_key)
+        while len(_local) > LOCAL_LRU_SIZE:
+            _local.popitem(last=False)
+
+
+def _embed(text):
+    from litellm import embedding
+
+    result = embedding(model=frappe.conf.get("ai_assistant_embedding_model"), input=[text])
+    return result.data[0]["embedding"]
+
+
+def _cosine(a, b):
+    try:
+        import numpy as np
+
+        a, b = np.asarray(a, dtype="float32"), np.asarray(b, dtype="float32")
+        return float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+    except ImportError:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = (sum(x * x for x in a) ** 0.5) * (sum(y * y for y in b) ** 0.5)
+        return dot / norm if norm else 0.0
+
+
+def _semantic_lookup(scope, query):
+    vectors = frappe.cache().get_value(f"{VECTOR_KEY}:{_hash(scope)}") or []
+    if not vectors:
+        return None
+
+    try:
+        query_vector = _embed(normalize_query(query) or query)
+    except Exception as e:
+        frappe.log_error(f"Embedding lookup failed: {e}", "AI Response Cache Error")
+        return None
+
+    threshold = frappe.utils.flt(frappe.conf.get("ai_assistant_semantic_threshold")) or DEFAULT_THRESHOLD
+    best_key, best_score = None, threshold
+    for key, vector in vectors:
+        score = _cosine(query_vector, vector)
+        if score >= best_score:
+            best_key, best_score = key, score
+    return _get(best_key) if best_key else None
+
+
+def _store_vector(scope, query, response):
+    try:
+        vector = _embed(normalize_query(query) or query)
+    except Exception as e:
+        frappe.log_error(f"Embedding store failed: {e}", "AI Response Cache Error")
+        return
+
+    vector_key = f"{VECTOR_KEY}:{_hash(scope)}"
+    vectors = frappe.cache().get_value(vector_key) or []
+    vectors.append((_lookup_keys(scope, query)[1], vector))
+    ttl = frappe.utils.cint(frappe.conf.get("ai_assistant_response_cache_ttl")) or DEFAULT_TTL
+    frappe.cache().set_value(vector_key, vectors[-MAX_VECTORS_PER_SCOPE:], expires_in_sec=ttl)
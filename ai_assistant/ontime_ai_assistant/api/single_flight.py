@@ -0,0 +1,105 @@
+import hashlib
+import pickle
+import time
+
+import frappe
+
+from ai_assistant.ontime_ai_assistant.api import metrics
+
+# Request coalescing for identical LLM calls that are in flight at the same time.
+#
+# When a class asks "what is a Payment Entry" at once, the first request (the leader) takes a Redis
+# lock (SET NX) named after the normalized prompt, provider and model, and makes the provider call.
+# Requests arriving while the lock is held (on any gunicorn or RQ worker) subscribe to the flight's
+# channel and wait: the leader stores the answer under a short-lived result key and publishes on the
+# channel, and every waiter returns that answer without calling the provider.
+#
+# Only successful answers are shared. If the leader fails, or dies and its lock expires, one waiter
+# takes over as the new leader. The result key lives a few seconds, just long enough for the waiters
+# to read it; repeated questions are the response cache's job, not this one.
+#
+# Site config: ai_assistant_single_flight, set to 0 to disable.
+
+FLIGHT_KEY = "ai_assistant:single_flight"
+# Seconds the shared answer stays readable after the leader finishes
+RESULT_TTL = 5
+# Waiters re-check the lock this often, in case the leader's message was missed or the leader died
+WAIT_POLL_INTERVAL = 1.0
+
+# Only the lock's owner may release it; a lock that expired and was re-taken is left alone
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def is_enabled():
+    value = frappe.conf.get("ai_assistant_single_flight")
+    return value is None or bool(frappe.utils.cint(value))
+
+
+def flight_key(provider, model, messages):
+    # Case and whitespace do not change the answer, so "What is  a Payment Entry?" and
+    # "what is a payment entry?" share a flight
+    digest = hashlib.sha256(f"{provider}\x1f{model}".encode())
+    for message in messages:
+        content = message.get("content")
+        if not isinstance(content, str):
+            content = frappe.as_json(content, indent=None)
+        digest.update(f"\x1e{message.get('role')}\x1f{' '.join(content.split()).casefold()}".encode())
+    return digest.hexdigest()
+
+
+def run(key, call, lock_ttl, share=None, labels=None, on_shared=None):
+    # Returns call()'s result, or the result of an identical call already running elsewhere.
+    # share(result) decides whether a result may be handed to waiters, on_shared(result) is called
+    # when this request received one; labels go on the metric.
+    cache = frappe.cache()
+    lock_key = cache.make_key(f"{FLIGHT_KEY}:lock:{key}")
+    result_key = cache.make_key(f"{FLIGHT_KEY}:result:{key}")
+    channel = cache.make_key(f"{FLIGHT_KEY}:channel:{key}")
+    token = frappe.generate_hash(length=12)
+    deadline = time.monotonic() + lock_ttl
+
+    while True:
+        if cache.set(lock_key, token, nx=True, ex=lock_ttl):
+            return _lead(cache, lock_key, result_key, channel, token, call, share)
+
+        found, result = _wait(cache, lock_key, result_key, channel, deadline)
+        if found:
+            metrics.inc("ai_llm_coalesced_total", **(labels or {}))
+            if on_shared:
+                on_shared(result)
+            return result
+        if time.monotonic() > deadline:
+            # The leader is still running past its lock; call the provider rather than wait longer
+            return call()
+
+
+def _lead(cache, lock_key, result_key, channel, token, call, share):
+    try:
+        result = call()
+        if share is None or share(result):
+            cache.set(result_key, pickle.dumps(result), ex=RESULT_TTL)
+        return result
+    finally:
+        # Waiters are woken on failure too, so one of them can take over without waiting for a poll
+        cache.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+        cache.publish(channel, b"1")
+
+
+def _wait(cache, lock_key, result_key, channel, deadline):
+    # (True, result) once the leader has shared its answer; (False, None) when the lock is free again
+    # without an answer or the deadline has passed
+    pubsub = cache.pubsub(ignore_subscribe_messages=True)
+    try:
+        # Subscribed before checking, so a publish between the check and the wait is not missed
+        pubsub.subscribe(channel)
+        while True:
+            # Read together: the result is written before the lock is released, so a free lock with no
+            # result means the leader failed
+            raw, locked = cache.pipeline().get(result_key).exists(lock_key).execute()
+            if raw is not None:
+                return True, pickle.loads(raw)
+            if not locked or time.monotonic() > deadline:
+                return False, None
+            pubsub.get_message(timeout=WAIT_POLL_INTERVAL)
+    finally:
+        pubsub.close()
@@ -0,0 +1,154 @@
+import datetime
+import io
+from array import array
+
+import frappe
+
+# Streaming XLSX extraction for the document analyser.
+#
+# Workbooks are opened read-only and rows are read as plain values, so cell objects are never built.
+# The model gets a compact profile per sheet: the column schema, statistics for numeric columns
+# (computed over every row) and a sample of the raw rows that stops at the row/byte budget. Memory is
+# bounded by the sample plus one float array per numeric column.
+#
+# Site config:
+#   ai_assistant_xlsx_max_rows: raw rows included across all sheets, default 500
+#   ai_assistant_xlsx_max_bytes: size of the raw row sample in bytes, default 100000
+
+DEFAULT_MAX_ROWS = 500
+DEFAULT_MAX_BYTES = 100_000
+MAX_COLUMNS = 60
+MAX_CELL_CHARS = 80
+
+
+def extract_workbook_profile(file_path, max_rows=None, max_bytes=None):
+    import openpyxl
+
+    max_rows = max_rows or frappe.utils.cint(frappe.conf.get("ai_assistant_xlsx_max_rows")) or DEFAULT_MAX_ROWS
+    max_bytes = max_bytes or frappe.utils.cint(frappe.conf.get("ai_assistant_xlsx_max_bytes")) or DEFAULT_MAX_BYTES
+    budget = {"rows": max_rows, "bytes": max_bytes}
+
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        out = io.StringIO()
+        for sheet in workbook.worksheets:
+            _profile_sheet(sheet, out, budget)
+        return out.getvalue()
+    finally:
+        # Read-only workbooks keep the zip file open until closed
+        workbook.close()
+
+
+def _profile_sheet(sheet, out, budget):
+    rows = sheet.iter_rows(values_only=True)
+    header = None
+    for row in rows:
+        if any(value is not None for value in row):
+            header = [_cell_text(value) or f"Column {i + 1}" for i, value in enumerate(row[:MAX_COLUMNS])]
+            break
+
+    if header is None:
+        out.write(f"\n--- Sheet: {sheet.title} (empty) ---\n")
+        return
+
+    columns = [_ColumnProfile(name) for name in header]
+    sample = io.StringIO()
+    sample_rows = 0
+    total_rows = 0
+    truncated = False
+
+    for row in rows:
+        if not any(value is not None for value in row):
+            continue
+        total_rows += 1
+        row = row[: len(columns)]
+        for column, value in zip(columns, row):
+            column.add(value)
+
+        if truncated:
+            continue
+        line = "\t".join(_cell_text(value) for value in row) + "\n"
+        if budget["rows"] <= 0 or budget["bytes"] < len(line):
+            truncated = True
+            continue
+        sample.write(line)
+        sample_rows += 1
+        budget["rows"] -= 1
+        budget["bytes"] -= len(line)
+
+    out.write(f"\n--- Sheet: {sheet.title} ({total_rows} rows, {len(columns)} columns) ---\n")
+    out.write("Columns: " + ", ".join(f"{c.name} ({c.kind()}, {c.empty} empty)" for c in columns) + "\n")
+
+    numeric = [c for c in columns if c.kind() == "number"]
+    if numeric:
+        out.write("Numeric summary:\n")
+        for column in numeric:
+            out.write(f"  {column.name}: {column.summary()}\n")
+
+    out.write(f"Rows ({sample_rows} of {total_rows}):\n")
+    out.write("\t".join(header) + "\n")
+    out.write(sample.getvalue())
+    if truncated:
+        out.write(f"[{total_rows - sample_rows} more rows omitted]\n")
+
+
+def _cell_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return " ".join(str(value).split())[:MAX_CELL_CHARS]
+
+
+class _ColumnProfile:
+    def __init__(self, name):
+        self.name = name
+        self.values = array("d")
+        self.texts = 0
+        self.dates = 0
+        self.empty = 0
+
+    def add(self, value):
+        if value is None or value == "":
+            self.empty += 1
+        elif isinstance(value, bool):
+            self.texts += 1
+        elif isinstance(value, (int, float)):
+            self.values.append(value)
+        elif isinstance(value, (datetime.datetime, datetime.date)):
+            self.dates += 1
+        else:
+            self.texts += 1
+
+    def kind(self):
+        counts = {"number": len(self.values), "date": self.dates, "text": self.texts}
+        kind = max(counts, key=counts.get)
+        return kind if counts[kind] else "empty"
+
+    def summary(self):
+        try:
+            import numpy as np
+        except ImportError:
+            return self._summary_python()
+
+        values = np.frombuffer(self.values, dtype="float64")
+        p25, p50, p75 = np.percentile(values, [25, 50, 75])
+        return _format_summary(
+            count=values.size, sum=values.sum(), min=values.min(), max=values.max(),
+            mean=values.mean(), std=values.std(), p25=p25, p50=p50, p75=p75,
+        )
+
+    def _summary_python(self):
+        values = sorted(self.values)
+        count = len(values)
+        total = sum(values)
+        mean = total / count
+        std = (sum((v - mean) ** 2 for v in values) / count) ** 0.5
+        return _format_summary(
+            count=count, sum=total, min=values[0], max=values[-1], mean=mean, std=std,
+            p25=values[count // 4], p50=values[count // 2], p75=values[(count * 3) // 4],
+        )
+
+
+def _format_summary(**stats):
+    return ", ".join(f"{key}={value:.6g}" if key != "count" else f"count={value}" for key, value in stats.items())
@@ -0,0 +1,55 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from ai_assistant.ontime_ai_assistant.api.bulk_commands import run_bulk_command
+
+PROVIDER_NAMES = ["_Test Bulk Provider 1", "_Test Bulk Provider 2", "_Test Bulk Provider 3"]
+
+
+class TestBulkCommands(FrappeTestCase):
+    def setUp(self):
+        # run_bulk_command commits, so the rows outlive the test transaction
+        self.addCleanup(self._delete_providers)
+
+    def _delete_providers(self):
+        for name in PROVIDER_NAMES:
+            frappe.delete_doc("AI Provider", name, force=True, ignore_missing=True)
+        frappe.db.commit()
+
+    def _row(self, name, provider_type="OpenAI"):
+        return {"name": name, "provider_type": provider_type, "api_endpoint": "https://api.openai.com/v1", "api_key": "sk-test"}
+
+    def test_failed_row_is_rolled_back_alone(self):
+        rows = [
+            self._row(PROVIDER_NAMES[0]),
+            # Passes the up-front checks, fails in insert() on the Select options
+            self._row(PROVIDER_NAMES[1], provider_type="Not A Provider"),
+            self._row(PROVIDER_NAMES[2]),
+            {**self._row("_Test Bulk Provider 4"), "colour": "blue"},
+        ]
+
+        result = run_bulk_command("bulk_create", "AI Provider", rows, user="Administrator")
+
+        self.assertEqual(result["status"], "partial")
+        self.assertEqual((result["created"], result["failed"]), (2, 2))
+        self.assertEqual([row["status"] for row in result["results"]], ["created", "failed", "created", "failed"])
+        self.assertEqual(result["results"][0]["name"], PROVIDER_NAMES[0])
+        self.assertEqual(result["results"][3]["message"], "Unknown fields: colour")
+
+        self.assertTrue(frappe.db.exists("AI Provider", PROVIDER_NAMES[0]))
+        self.assertFalse(frappe.db.exists("AI Provider", PROVIDER_NAMES[1]))
+        self.assertTrue(frappe.db.exists("AI Provider", PROVIDER_NAMES[2]))
+
+    def test_update_reports_missing_rows(self):
+        run_bulk_command("bulk_create", "AI Provider", [self._row(PROVIDER_NAMES[0])], user="Administrator")
+
+        result = run_bulk_command(
+            "bulk_update",
+            "AI Provider",
+            [{"name": PROVIDER_NAMES[0], "max_concurrent_requests": 3}, {"name": PROVIDER_NAMES[1], "max_concurrent_requests": 3}],
+            user="Administrator",
+        )
+
+        self.assertEqual([row["status"] for row in result["results"]], ["updated", "failed"])
+        self.assertEqual(result["results"][1]["message"], f"AI Provider {PROVIDER_NAMES[1]} not found.")
+        self.assertEqual(frappe.db.get_value("AI Provider", PROVIDER_NAMES[0], "max_concurrent_requests"), 3)
@@ -0,0 +1,58 @@
+from frappe.tests.utils import FrappeTestCase
+
+from ai_assistant.ontime_ai_assistant.api.chunked_analysis import chunk_pages, estimate_tokens, map_reduce
+
+
+class TestChunkedAnalysis(FrappeTestCase):
+    def test_pages_are_packed_up_to_the_budget(self):
+        # Each page estimates to 11 tokens, so two fit a chunk of 25
+        pages = [(1, "a" * 40), (2, "b" * 40), (3, "c" * 40)]
+
+        chunks = list(chunk_pages(pages, max_tokens=25))
+
+        self.assertEqual([(chunk["first_page"], chunk["last_page"]) for chunk in chunks], [(1, 2), (3, 3)])
+        self.assertEqual([chunk["index"] for chunk in chunks], [0, 1])
+
+    def test_long_page_is_split_within_the_budget(self):
+        sentences = " ".join(f"Sentence number {index} about the ledger." for index in range(300))
+        text = f"# Heading\n\n{sentences}\n\nClosing paragraph."
+
+        chunks = list(chunk_pages([(1, text)], max_tokens=100))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk["tokens"] <= 100 for chunk in chunks))
+        self.assertEqual(" ".join(" ".join(chunk["text"].split()) for chunk in chunks), " ".join(text.split()))
+
+    def test_page_without_whitespace_is_split_by_characters(self):
+        text = "x" * 10000
+
+        chunks = list(chunk_pages([(1, text)], max_tokens=100))
+
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(chunk["tokens"] <= 100 for chunk in chunks))
+        self.assertEqual("".join(chunk["text"] for chunk in chunks), text)
+
+    def test_small_partials_are_reduced_once(self):
+        reduced = []
+
+        def reduce_fn(group):
+            reduced.append(group)
+            return "+".join(group)
+
+        result = map_reduce(range(6), lambda chunk, total: str(chunk), reduce_fn)
+
+        self.assertEqual(result, "0+1+2+3+4+5")
+        self.assertEqual(len(reduced), 1)
+
+    def test_large_partials_converge_pairwise(self):
+        # Every partial is over the budget, so no two can be grouped and they are merged in pairs
+        reduced = []
+
+        def reduce_fn(group):
+            reduced.append(len(group))
+            return "r" * 400
+
+        result = map_reduce(range(9), lambda chunk, total: "p" * 400, reduce_fn, max_tokens=estimate_tokens("p" * 200))
+
+        self.assertEqual(result, "r" * 400)
+        self.assertEqual(reduced, [2] * 8)
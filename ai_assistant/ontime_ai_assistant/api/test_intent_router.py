@@ -0,0 +1,50 @@
+from frappe.tests.utils import FrappeTestCase
+
+from ai_assistant.ontime_ai_assistant.api.intent_router import route
+
+
+class TestIntentRouter(FrappeTestCase):
+    def test_phrases_match_whole_words(self):
+        result = route("Create customer named Acme Trading")
+        self.assertEqual(result["name"], "create_customer")
+        self.assertEqual(result["data"], {"customer_name": "Acme Trading"})
+
+        # "create" inside "recreate" and "customer" inside "customers" are not triggers
+        self.assertIsNone(route("please recreate the customer named Acme"))
+
+    def test_top_inside_stop_is_not_a_report(self):
+        self.assertIsNone(route("list customers who stopped ordering"))
+
+    def test_question_without_report_verb_is_explained(self):
+        result = route("what is the total cost of sales returns?")
+        self.assertEqual(result["name"], "explain_term")
+        self.assertEqual(result["remainder"], "the total cost of sales returns?")
+
+    def test_report_modifiers_combine(self):
+        result = route("show total sales by customer per month")
+        self.assertEqual(result["name"], "report_sales_totals")
+        self.assertEqual(
+            result["aggregate"],
+            {"measure": "sum", "field": "grand_total", "dimension": "customer", "time_bucket": "month"},
+        )
+
+        result = route("show average sales by territory")
+        self.assertEqual(result["aggregate"]["measure"], "avg")
+        self.assertEqual(result["aggregate"]["dimension"], "territory")
+
+        result = route("give me top 5 customers quarterly")
+        self.assertEqual(result["name"], "report_top_customers")
+        self.assertEqual(result["aggregate"]["top"], 5)
+        self.assertEqual(result["aggregate"]["time_bucket"], "quarter")
+
+    def test_bulk_names_split_on_commas(self):
+        result = route("create item groups named Research And Development, Tools and Spare Parts")
+        self.assertEqual(result["name"], "bulk_create_item_groups")
+        self.assertEqual(
+            [row["item_group_name"] for row in result["rows"]],
+            ["Research And Development", "Tools", "Spare Parts"],
+        )
+        self.assertTrue(all(row["is_group"] == 1 for row in result["rows"]))
+
+        result = route("create item groups named Research and Development")
+        self.assertEqual([row["item_group_name"] for row in result["rows"]], ["Research And Development"])
@@ -0,0 +1,46 @@
+import pickle
+import threading
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from ai_assistant.ontime_ai_assistant.api import single_flight
+
+
+class TestSingleFlight(FrappeTestCase):
+    def setUp(self):
+        cache = frappe.cache()
+        self.key = single_flight.flight_key("Test", frappe.generate_hash(length=8), [{"role": "user", "content": "What is a Payment Entry?"}])
+        self.lock_key = cache.make_key(f"{single_flight.FLIGHT_KEY}:lock:{self.key}")
+        self.result_key = cache.make_key(f"{single_flight.FLIGHT_KEY}:result:{self.key}")
+        self.channel = cache.make_key(f"{single_flight.FLIGHT_KEY}:channel:{self.key}")
+        self.calls = []
+        self.addCleanup(cache.delete, self.lock_key, self.result_key)
+
+    def own_call(self):
+        self.calls.append(1)
+        return "own answer"
+
+    def test_follower_receives_the_leaders_result(self):
+        cache = frappe.cache()
+        # A leader on another worker holds the lock and finishes shortly
+        cache.set(self.lock_key, "leader", ex=10)
+
+        def finish():
+            cache.set(self.result_key, pickle.dumps("leader answer"), ex=single_flight.RESULT_TTL)
+            cache.delete(self.lock_key)
+            cache.publish(self.channel, b"1")
+
+        leader = threading.Timer(0.3, finish)
+        leader.start()
+        self.addCleanup(leader.cancel)
+
+        self.assertEqual(single_flight.run(self.key, self.own_call, lock_ttl=10), "leader answer")
+        self.assertEqual(self.calls, [])
+
+    def test_follower_calls_itself_when_the_leaders_lock_expires(self):
+        # The leader died: its lock expires without a result being shared
+        frappe.cache().set(self.lock_key, "leader", ex=1)
+
+        self.assertEqual(single_flight.run(self.key, self.own_call, lock_ttl=10), "own answer")
+        self.assertEqual(self.calls, [1])
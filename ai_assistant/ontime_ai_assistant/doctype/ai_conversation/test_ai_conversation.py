@@ -0,0 +1,53 @@
+# Copyright (c) 2026, osalama102@gmail.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from ai_assistant.ontime_ai_assistant.api import conversation as conversations
+
+
+class TestAIConversation(FrappeTestCase):
+	def setUp(self):
+		self.conversation_id = conversations.start_conversation("Test conversation", user="Administrator")
+
+	def test_history_keeps_the_latest_turns_within_budget(self):
+		# Each turn estimates to 2 * (400 // 4 + 1) = 202 tokens
+		state = {"summary": "", "turns": [[f"q{index}" + "x" * 398, "a" * 400, None] for index in range(5)]}
+
+		messages = conversations.build_messages(state, "next question", budget=450)
+
+		user_messages = [message["content"] for message in messages if message["role"] == "user"]
+		self.assertEqual([content[:2] for content in user_messages[:-1]], ["q3", "q4"])
+		self.assertEqual(user_messages[-1], "next question")
+
+	def test_record_turn_skips_failed_answers(self):
+		conversations.record_turn(self.conversation_id, "show invoices", {"status": "error", "message": "denied"}, "2026-01-01 10:00:00")
+		conversations.record_turn(self.conversation_id, "what is a budget", "Error: provider timed out", "2026-01-01 10:01:00")
+		conversations.record_turn(self.conversation_id, "what is a cost center", "A cost center is ...", "2026-01-01 10:02:00")
+
+		state = conversations.get_conversation_state(self.conversation_id, "Administrator")
+		self.assertEqual(state["turns"], [["what is a cost center", "A cost center is ...", "2026-01-01 10:02:00"]])
+
+	def test_load_state_rebuilds_turns_after_summary(self):
+		for minute, answer in ((1, "folded into the summary"), (2, "Error: provider timed out"), (3, "kept")):
+			frappe.get_doc(
+				{
+					"doctype": "AI Query",
+					"query_text": f"question {minute}",
+					"response_text": answer,
+					"conversation": self.conversation_id,
+					"query_date": f"2026-01-01 10:0{minute}:00",
+				}
+			).insert(ignore_permissions=True)
+		frappe.db.set_value(
+			"AI Conversation",
+			self.conversation_id,
+			{"summary": "Earlier turns", "summarized_turns": 1, "summarized_until": "2026-01-01 10:01:00"},
+		)
+
+		state = conversations._load_state(self.conversation_id)
+
+		self.assertEqual(state["summary"], "Earlier turns")
+		self.assertEqual(state["summarized"], 1)
+		self.assertEqual([turn[:2] for turn in state["turns"]], [["question 3", "kept"]])
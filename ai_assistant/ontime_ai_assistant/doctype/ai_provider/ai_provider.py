@@ -4,6 +4,12 @@
 # import frappe
 from frappe.model.document import Document
 
+from ai_assistant.ontime_ai_assistant.api.provider_config import clear_provider_cache
+
 
 class AIProvider(Document):
-	pass
+	def on_update(self):
+		clear_provider_cache()
+
+	def on_trash(self):
+		clear_provider_cache()
@@ -1,9 +1,28 @@
 # Copyright (c) 2025, osalama102@gmail.com and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from ai_assistant.ontime_ai_assistant.api.provider_config import get_provider_config
+
 
 class TestAIProvider(FrappeTestCase):
-	pass
+	def test_provider_config_is_invalidated_on_update(self):
+		provider = frappe.get_doc(
+			{
+				"doctype": "AI Provider",
+				"name": "_Test AI Provider",
+				"provider_type": "OpenAI",
+				"api_endpoint": "https://api.openai.com/v1",
+				"api_key": "sk-test-first",
+			}
+		).insert()
+
+		config = get_provider_config(provider.name)
+		self.assertEqual(config["provider_type"], "OpenAI")
+		self.assertEqual(config["api_key"], "sk-test-first")
+
+		provider.api_key = "sk-test-second"
+		provider.save()
+		self.assertEqual(get_provider_config(provider.name)["api_key"], "sk-test-second")
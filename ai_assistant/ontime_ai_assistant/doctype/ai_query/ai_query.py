@@ -9,3 +9,9 @@ class AIQuery(Document):
 	pass
 
 
+def on_doctype_update():
+	# Per-user history and per-type analytics both filter on a key and then a date range
+	frappe.db.add_index("AI Query", ["user", "query_date"])
+	frappe.db.add_index("AI Query", ["query_type", "query_date"])
+	# Conversation history is rebuilt from the turns logged after the summarised ones
+	frappe.db.add_index("AI Query", ["conversation", "query_date"])
@@ -1,9 +1,44 @@
 # Copyright (c) 2025, osalama102@gmail.com and Contributors
 # See license.txt
 
-# import frappe
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from ai_assistant.ontime_ai_assistant.api.frappe_command_executor import fetch_next_page, read_records
+
 
 class TestAIQuery(FrappeTestCase):
-	pass
+	def setUp(self):
+		# Rows sharing one creation timestamp, so paging relies on the name tie-break
+		self.marker = frappe.generate_hash(length=10)
+		self.names = []
+		for index in range(7):
+			query = frappe.get_doc({"doctype": "AI Query", "query_text": self.marker, "query_type": "Read"}).insert()
+			frappe.db.set_value("AI Query", query.name, "creation", "2025-01-01 10:00:00", update_modified=False)
+			self.names.append(query.name)
+
+	def test_keyset_pages_cover_rows_with_equal_creation_once(self):
+		seen = []
+		page = read_records("AI Query", {"query_text": self.marker}, ["name", "query_text"], limit_page_length=3)
+		seen += [record["name"] for record in page["data"]]
+		while page.get("next_cursor"):
+			page = fetch_next_page(page["next_cursor"], user="Administrator")
+			self.assertEqual(page["status"], "success")
+			seen += [record["name"] for record in page["data"]]
+
+		self.assertEqual(len(seen), len(set(seen)))
+		self.assertEqual(sorted(seen), sorted(self.names))
+
+	def test_tampered_cursor_is_rejected(self):
+		page = read_records("AI Query", {"query_text": self.marker}, ["name"], limit_page_length=3)
+		payload, signature = page["next_cursor"].rsplit(".", 1)
+		state = json.loads(urlsafe_b64decode(payload))
+		state["doctype"] = "User"
+		state["fields"] = ["name", "api_secret"]
+		forged = urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+		for cursor in (f"{forged}.{signature}", payload, f"{payload}.{'0' * len(signature)}"):
+			self.assertEqual(fetch_next_page(cursor, user="Administrator")["status"], "error")
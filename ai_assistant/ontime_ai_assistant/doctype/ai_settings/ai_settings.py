@@ -4,13 +4,9 @@
 # import frappe
 from frappe.model.document import Document
 
+from ai_assistant.ontime_ai_assistant.api.provider_config import clear_provider_cache
 
-class AISettings(Document):
-	pass
-
-import frappe
-from frappe.model.document import Document
 
 class AISettings(Document):
-	pass
-
+	def on_update(self):
+		clear_provider_cache()
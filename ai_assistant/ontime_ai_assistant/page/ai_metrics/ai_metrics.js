@@ -0,0 +1,106 @@
+frappe.pages['ai-metrics'].on_page_load = function(wrapper) {
+	const page = frappe.ui.make_app_page({
+		parent: wrapper,
+		title: __('AI Metrics'),
+		single_column: true
+	});
+
+	const $body = $('<div class="ai-metrics"></div>').appendTo(page.main);
+	const refresh = () => {
+		Promise.all([
+			frappe.call('ai_assistant.ontime_ai_assistant.api.metrics.get_metrics_summary'),
+			frappe.call('ai_assistant.ontime_ai_assistant.api.prompt_templates.get_template_report')
+		]).then(([summary, templates]) => {
+			render($body, Object.assign({ calls: [], cache: [] }, summary.message, { templates: templates.message || [] }));
+		});
+	};
+
+	page.set_primary_action(__('Refresh'), refresh, 'refresh');
+	page.add_menu_item(__('Reset Metrics'), () => {
+		frappe.confirm(__('Clear all collected AI metrics?'), () => {
+			frappe.call('ai_assistant.ontime_ai_assistant.api.metrics.reset_metrics').then(refresh);
+		});
+	});
+
+	refresh();
+	// Series are flushed from workers every few seconds; a slow auto-refresh keeps the page current
+	wrapper.refresh_interval = setInterval(() => {
+		if (frappe.get_route_str() === 'ai-metrics') refresh();
+	}, 30000);
+};
+
+function render($body, data) {
+	const fmt = (value) => (value === null || value === undefined ? '-' : format_number(value, null, 0));
+	const callRows = data.calls.map((row) => `
+		<tr>
+			<td>${frappe.utils.escape_html(row.provider || '')}</td>
+			<td>${frappe.utils.escape_html(row.model || '')}</td>
+			<td>${frappe.utils.escape_html(row.intent || '')}</td>
+			<td class="text-right">${fmt(row.requests)}</td>
+			<td class="text-right">${fmt(row.errors)}</td>
+			<td class="text-right">${fmt(row.coalesced)}</td>
+			<td class="text-right">${fmt(row.latency_avg_ms)}</td>
+			<td class="text-right">${row.latency_p50_ms ? '≤ ' + fmt(row.latency_p50_ms) : '-'}</td>
+			<td class="text-right">${row.latency_p95_ms ? '≤ ' + fmt(row.latency_p95_ms) : '-'}</td>
+			<td class="text-right">${fmt(row.ttft_avg_ms)}</td>
+			<td class="text-right">${fmt(row.prompt_tokens)}</td>
+			<td class="text-right">${fmt(row.completion_tokens)}</td>
+		</tr>`).join('');
+
+	const cacheRows = data.cache.map((row) => {
+		const total = row.hits + row.misses;
+		const rate = total ? Math.round((row.hits / total) * 100) + '%' : '-';
+		return `
+		<tr>
+			<td>${frappe.utils.escape_html(row.kind)}</td>
+			<td class="text-right">${fmt(row.hits)}</td>
+			<td class="text-right">${fmt(row.misses)}</td>
+			<td class="text-right">${rate}</td>
+		</tr>`;
+	}).join('');
+
+	const providers = data.templates.length ? Object.keys(data.templates[0].static_tokens) : [];
+	const templateRows = data.templates.map((row) => `
+		<tr>
+			<td>${frappe.utils.escape_html(row.template)}${row.changed ? ` <span class="indicator-pill orange">${__('Changed without version bump')}</span>` : ''}</td>
+			<td>${row.version} <span class="text-muted">${row.fingerprint}</span></td>
+			${providers.map((provider) => `<td class="text-right">${fmt(row.static_tokens[provider])}</td>`).join('')}
+			<td class="text-right">${fmt(row.renders)}</td>
+			<td class="text-right">${fmt(row.avg_tokens)}</td>
+			<td class="text-right">${fmt(row.total_tokens)}</td>
+		</tr>`).join('');
+
+	$body.html(`
+		<h5 class="mt-3">${__('LLM Calls')}</h5>
+		<table class="table table-bordered table-sm">
+			<thead><tr>
+				<th>${__('Provider')}</th><th>${__('Model')}</th><th>${__('Intent')}</th>
+				<th class="text-right">${__('Requests')}</th><th class="text-right">${__('Errors')}</th>
+				<th class="text-right">${__('Coalesced')}</th>
+				<th class="text-right">${__('Avg ms')}</th><th class="text-right">${__('p50 ms')}</th>
+				<th class="text-right">${__('p95 ms')}</th><th class="text-right">${__('Avg TTFT ms')}</th>
+				<th class="text-right">${__('Prompt Tokens')}</th><th class="text-right">${__('Completion Tokens')}</th>
+			</tr></thead>
+			<tbody>${callRows || `<tr><td colspan="11" class="text-muted">${__('No calls recorded yet')}</td></tr>`}</tbody>
+		</table>
+		<h5 class="mt-4">${__('Answer Cache')}</h5>
+		<table class="table table-bordered table-sm">
+			<thead><tr>
+				<th>${__('Kind')}</th><th class="text-right">${__('Hits')}</th>
+				<th class="text-right">${__('Misses')}</th><th class="text-right">${__('Hit Rate')}</th>
+			</tr></thead>
+			<tbody>${cacheRows || `<tr><td colspan="4" class="text-muted">${__('No lookups recorded yet')}</td></tr>`}</tbody>
+		</table>
+		<h5 class="mt-4">${__('Prompt Templates')}</h5>
+		<table class="table table-bordered table-sm">
+			<thead><tr>
+				<th>${__('Template')}</th><th>${__('Version')}</th>
+				${providers.map((provider) => `<th class="text-right">${__('Static tokens')} (${frappe.utils.escape_html(provider)})</th>`).join('')}
+				<th class="text-right">${__('Renders')}</th><th class="text-right">${__('Avg prompt tokens')}</th>
+				<th class="text-right">${__('Total prompt tokens')}</th>
+			</tr></thead>
+			<tbody>${templateRows}</tbody>
+		</table>
+		<p class="text-muted small">${__('Prometheus endpoint')}: <code>/api/method/ai_assistant.ontime_ai_assistant.api.metrics.prometheus</code></p>
+	`);
+}
@@ -10,6 +10,12 @@ class AIAssistant {
         this.currentQuery = null;
         this.fileUploadQueue = [];
         this.processingFiles = new Map();
+        this.documentJobs = new Map();
+        this.streams = new Map();
+        this.streamingEnabled = false;
+        this.pendingJobs = new Map();
+        // Server-side conversation that gives follow-up questions their context
+        this.conversationId = localStorage.getItem('aiAssistantConversationId');
         
         // Bind methods to the instance to ensure 'this' context is correct
         this.setupEventListeners = this.setupEventListeners.bind(this);
@@ -25,12 +31,15 @@ class AIAssistant {
         this.loadChatHistory = this.loadChatHistory.bind(this);
         this.addMessageToHistory = this.addMessageToHistory.bind(this);
         this.saveChatHistory = this.saveChatHistory.bind(this);
+        this.setupRealtime = this.setupRealtime.bind(this);
+        this.handleStreamChunk = this.handleStreamChunk.bind(this);
     }
 
     init() {
         if (this.isInitialized) return;
         
         this.setupEventListeners();
+        this.setupRealtime();
         this.loadChatHistory();
         this.isInitialized = true;
         
@@ -83,6 +92,8 @@ class AIAssistant {
                 if (query) {
                     this.sendQuery(query);
                 }
+            } else if (e.target.matches('.load-more-records')) {
+                this.loadMoreRecords(e.target);
             }
         });
 
@@ -125,12 +136,93 @@ class AIAssistant {
         }
     }
 
+    setupRealtime() {
+        // Partial tokens are pushed over socket.io when the page has Frappe realtime available
+        if (typeof frappe === 'undefined' || !frappe.realtime || !frappe.realtime.on) return;
+        frappe.realtime.on('ai_assistant_stream', this.handleStreamChunk);
+        frappe.realtime.on('ai_assistant_job', (data) => this.resolveJob(data.job_id, data));
+        frappe.realtime.on('ai_assistant_job_progress', (data) => {
+            const fileName = this.documentJobs.get(data.job_id);
+            if (fileName) this.processingFiles.set(fileName, `analyzing (${data.progress}%)`);
+        });
+        this.streamingEnabled = true;
+    }
+
+    waitForJob(requestId) {
+        // Background chat jobs resolve from the realtime push; polling the status endpoint is the fallback
+        return new Promise((resolve) => {
+            this.pendingJobs.set(requestId, resolve);
+            const poll = async () => {
+                if (!this.pendingJobs.has(requestId)) return;
+                const response = await fetch(`/api/method/ai_assistant.ontime_ai_assistant.api.chat.get_chat_job_status?request_id=${encodeURIComponent(requestId)}`, {
+                    headers: { 'X-Frappe-CSRF-Token': this.getCSRFToken() }
+                });
+                const status = response.ok ? (await response.json()).message : null;
+                if (status && (status.status === 'Completed' || status.status === 'Failed' || status.status === 'Unknown')) {
+                    this.resolveJob(requestId, status);
+                } else {
+                    setTimeout(poll, this.streamingEnabled ? 5000 : 1500);
+                }
+            };
+            setTimeout(poll, this.streamingEnabled ? 5000 : 1500);
+        });
+    }
+
+    resolveJob(requestId, job) {
+        const resolve = this.pendingJobs.get(requestId);
+        if (!resolve) return;
+        this.pendingJobs.delete(requestId);
+        if (job.status === 'Completed') {
+            resolve({ message: job.result });
+        } else {
+            resolve({ message: { status: 'error', message: job.error || 'The request could not be completed.' } });
+        }
+    }
+
+    handleStreamChunk(data) {
+        const stream = this.streams.get(data.stream_id);
+        if (!stream || !data.delta) return;
+
+        if (!stream.element) {
+            this.hideTypingIndicator();
+            stream.element = this.createStreamingMessage();
+        }
+        stream.text += data.delta;
+        stream.element.querySelector('.message-text').textContent = stream.text;
+
+        const chatMessages = document.getElementById('chatMessages');
+        chatMessages.scrollTop = chatMessages.scrollHeight;
+    }
+
+    createStreamingMessage() {
+        const chatMessages = document.getElementById('chatMessages');
+        const messageDiv = document.createElement('div');
+        messageDiv.classList.add('message', 'ai', 'streaming');
+        messageDiv.innerHTML = `\n            <div class="message-avatar"><i class="fas fa-robot"></i></div>\n            <div class="message-content">\n                <div class="message-text"></div>\n            </div>\n        `;
+        chatMessages.appendChild(messageDiv);
+        return messageDiv;
+    }
+
+    finishStream(streamId) {
+        // The final response replaces the streamed bubble so it is rendered and saved like any other message
+        const stream = this.streams.get(streamId);
+        this.streams.delete(streamId);
+        if (stream && stream.element) {
+            stream.element.remove();
+        }
+    }
+
     async sendQuery(query) {
         if (!query.trim()) return;
 
         this.displayMessage(query, 'user');
         this.showTypingIndicator();
 
+        const streamId = this.streamingEnabled ? `${Date.now()}-${Math.random().toString(36).slice(2, 10)}` : null;
+        if (streamId) {
+            this.streams.set(streamId, { text: '', element: null });
+        }
+
         try {
             // Determine if it's a quick query or complex query
             const quickActionButtons = document.querySelectorAll('.quick-action');
@@ -142,13 +234,20 @@ class AIAssistant {
                 }
             }
 
+            await this.ensureConversation(query);
+
             let response;
             if (isQuickQuery) {
-                response = await this.sendQuickQuery(query);
+                response = await this.sendQuickQuery(query, streamId);
             } else {
-                response = await this.sendComplexQuery(query);
+                response = await this.sendComplexQuery(query, streamId);
+            }
+
+            if (response.message && response.message.status === 'queued') {
+                response = await this.waitForJob(response.message.request_id);
             }
 
+            this.finishStream(streamId);
             this.hideTypingIndicator();
             if (response.status === 'error') {
                 this.displayMessage(`Error: ${response.message}`, 'ai', 'error');
@@ -161,20 +260,48 @@ class AIAssistant {
                 this.displayMessage(response.message || response, 'ai');
             }
         } catch (error) {
+            this.finishStream(streamId);
             this.hideTypingIndicator();
             console.error('Error sending query:', error);
+            if (/Conversation \S+ not found/.test(error.message || '')) {
+                // Deleted on the server; the next message starts a new one
+                this.conversationId = null;
+                localStorage.removeItem('aiAssistantConversationId');
+            }
             this.displayMessage(`Sorry, I encountered an error: ${error.message || error}`, 'ai', 'error');
         }
     }
 
-    async sendComplexQuery(query) {
+    async ensureConversation(title) {
+        if (this.conversationId) return;
+        try {
+            const response = await fetch('/api/method/ai_assistant.ontime_ai_assistant.api.chat.start_conversation', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Frappe-CSRF-Token': this.getCSRFToken()
+                },
+                body: JSON.stringify({ title })
+            });
+            const result = await response.json();
+            if (result.message && result.message.conversation_id) {
+                this.conversationId = result.message.conversation_id;
+                localStorage.setItem('aiAssistantConversationId', this.conversationId);
+            }
+        } catch (error) {
+            // The query is still answered, only without earlier turns
+            console.error('Could not start a conversation:', error);
+        }
+    }
+
+    async sendComplexQuery(query, streamId = null) {
         const response = await fetch('/api/method/ai_assistant.ontime_ai_assistant.api.chat.get_chat_response', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-Frappe-CSRF-Token': this.getCSRFToken()
             },
-            body: JSON.stringify({ user_query: query })
+            body: JSON.stringify({ user_query: query, stream_id: streamId, conversation_id: this.conversationId })
         });
         
         if (!response.ok) {
@@ -184,14 +311,14 @@ class AIAssistant {
         return response.json();
     }
 
-    async sendQuickQuery(query) {
+    async sendQuickQuery(query, streamId = null) {
         const response = await fetch('/api/method/ai_assistant.ontime_ai_assistant.api.chat.quick_query', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
                 'X-Frappe-CSRF-Token': this.getCSRFToken()
             },
-            body: JSON.stringify({ query_text: query }) // Ensure parameter name matches backend
+            body: JSON.stringify({ query_text: query, stream_id: streamId, conversation_id: this.conversationId }) // Ensure parameter name matches backend
         });
 
         if (!response.ok) {
@@ -246,7 +373,19 @@ class AIAssistant {
             const result = await response.json();
             this.processingFiles.set(file.name, 'analyzing');
             this.displayMessage(`File ${file.name} uploaded. Analysis initiated.`, 'ai');
-            // Optionally, poll for analysis status using result.processor_id
+
+            // The analysis result is pushed when the background job finishes
+            const processorId = result.message && result.message.processor_id;
+            if (result.message && result.message.cached) {
+                this.processingFiles.set(file.name, 'done');
+                this.displayMessage(result.message.extracted_data, 'ai');
+            } else if (processorId) {
+                this.documentJobs.set(processorId, file.name);
+                const job = await this.waitForJob(processorId);
+                this.documentJobs.delete(processorId);
+                this.processingFiles.set(file.name, job.message && job.message.status === 'error' ? 'failed' : 'done');
+                this.displayMessage(job.message, 'ai');
+            }
 
         } catch (error) {
             console.error('Error uploading file:', error);
@@ -273,6 +412,8 @@ class AIAssistant {
                 messageText = `Error: ${message.message || 'An unknown error occurred.'}`;
             } else if (message.status === 'navigate') {
                 messageText = `Navigating to: ${message.message || message.path}`;
+            } else if (Array.isArray(message.data)) {
+                messageText = this.renderRecords(message);
             } else if (message.message) { // Check for a 'message' property in the object
                 messageText = message.message;
             } else {
@@ -288,6 +429,49 @@ class AIAssistant {
         this.addMessageToHistory(message, sender, type);
     }
 
+    renderRecords(result) {
+        // Records arrive one page at a time; the cursor of the last row fetches the next page
+        const escape = (value) => String(value == null ? '' : value)
+            .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;').replace(/"/g, '&quot;');
+        const fields = result.fields || (result.data.length ? Object.keys(result.data[0]) : []);
+        let html = result.summary ? `<p>${escape(result.summary)}</p>` : '';
+        if (!result.data.length) {
+            return html || 'No records found.';
+        }
+        html += '<table class="table table-sm"><thead><tr>'
+            + fields.map((field) => `<th>${escape(field)}</th>`).join('')
+            + '</tr></thead><tbody>'
+            + result.data.map((row) => '<tr>' + fields.map((field) => `<td>${escape(row[field])}</td>`).join('') + '</tr>').join('')
+            + '</tbody></table>';
+        if (result.next_cursor) {
+            html += `<button class="btn btn-xs btn-default load-more-records" data-cursor="${escape(result.next_cursor)}">Load more</button>`;
+        }
+        return html;
+    }
+
+    async loadMoreRecords(button) {
+        button.disabled = true;
+        try {
+            const response = await fetch('/api/method/ai_assistant.ontime_ai_assistant.api.chat.get_more_records', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'X-Frappe-CSRF-Token': this.getCSRFToken()
+                },
+                body: JSON.stringify({ cursor: button.dataset.cursor })
+            });
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            const result = await response.json();
+            button.remove();
+            this.displayMessage(result.message, 'ai');
+        } catch (error) {
+            button.disabled = false;
+            this.displayMessage(`Could not load more records: ${error.message || error}`, 'ai', 'error');
+        }
+    }
+
     showTypingIndicator() {
         const typingIndicator = document.getElementById('typingIndicator');
         if (typingIndicator) {